@@ -0,0 +1,135 @@
+"""Hot/cold split of bookings: stays that ended long ago move to bookings_archive.
+
+Bookings whose check_out is more than BOOKING_ARCHIVE_AFTER_DAYS in the past are
+copied to bookings_archive and deleted from bookings, BOOKING_ARCHIVE_CHUNK_SIZE
+rows per transaction, so the active table and its indexes only hold recent and
+upcoming stays. Archiving is not a booking change: it logs no event and leaves
+the daily rollups alone. Those stays are long over, so availability is
+unaffected too. Reads that pass include_archived go through booking_source(),
+which unions both tables; archived bookings are read-only.
+
+CLI:
+    python archive.py [--after-days N]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from config import settings
+from database import AsyncSessionLocal
+from metrics import BOOKING_ARCHIVE_ROWS_PER_SECOND, BOOKING_TABLE_BYTES, BOOKING_TABLE_ROWS, BOOKINGS_ARCHIVED
+from models import Booking, BookingArchive
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("bookings", "bookings_archive")
+
+def _all_bookings():
+    table, archive = Booking.__table__, BookingArchive.__table__
+    both = union_all(
+        select(*table.c),
+        select(*(archive.c[column.name] for column in table.c))
+    ).subquery("bookings_all")
+    return aliased(Booking, both, adapt_on_names=True)
+
+# Booking mapped over bookings UNION ALL bookings_archive; filters on it reach both tables' indexes
+ALL_BOOKINGS = _all_bookings()
+
+def booking_source(include_archived: bool):
+    """What a booking read selects from: Booking, or ALL_BOOKINGS when it opts into archived data."""
+    return ALL_BOOKINGS if include_archived else Booking
+
+def archivable_ids(dialect: str, cutoff: datetime, chunk_size: int):
+    """Ids of up to chunk_size bookings that ended before cutoff, locked for archive_chunk."""
+    table = Booking.__table__
+    stmt = select(table.c.id).where(table.c.check_out < cutoff)
+    if dialect == "sqlite":
+        # SQLite reuses the largest rowid once that row is gone, which would clash with the archived copy
+        stmt = stmt.where(table.c.id < select(func.max(table.c.id)).scalar_subquery())
+    # Oldest stays first, straight off ix_bookings_check_out; concurrent runs skip each other's rows
+    return stmt.order_by(table.c.check_out).limit(chunk_size).with_for_update(skip_locked=True)
+
+async def archive_chunk(db: AsyncSession, cutoff: datetime, chunk_size: int) -> int:
+    """Move up to chunk_size bookings that ended before cutoff in one transaction; returns how many."""
+    ids = (await db.scalars(archivable_ids(db.get_bind().dialect.name, cutoff, chunk_size))).all()
+    if not ids:
+        return 0
+
+    table = Booking.__table__
+    columns = [column.name for column in table.c]
+    await db.execute(insert(BookingArchive.__table__).from_select(columns, select(*table.c).where(table.c.id.in_(ids))))
+    await db.execute(delete(table).where(table.c.id.in_(ids)))
+    await db.commit()
+    BOOKINGS_ARCHIVED.inc(len(ids))
+    return len(ids)
+
+async def table_sizes(db: AsyncSession) -> dict:
+    """{table: (rows, bytes)} for bookings and bookings_archive; bytes is None off Postgres."""
+    if db.get_bind().dialect.name == "postgresql":
+        # Planner estimates, so reporting doesn't count a large table
+        rows = await db.execute(text(
+            "SELECT relname, reltuples::bigint, pg_total_relation_size(oid) FROM pg_class "
+            "WHERE oid IN ('bookings'::regclass, 'bookings_archive'::regclass)"
+        ))
+        # reltuples is -1 until the table is first analyzed
+        return {name: (max(count, 0), size) for name, count, size in rows}
+    return {
+        name: (await db.scalar(select(func.count()).select_from(model)), None)
+        for name, model in zip(TABLES, (Booking, BookingArchive))
+    }
+
+async def run_archive(db: AsyncSession, after_days: int, chunk_size: int) -> int:
+    """Move every booking that ended more than after_days ago, chunk by chunk; returns the count."""
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    started = time.monotonic()
+    moved = 0
+    while True:
+        count = await archive_chunk(db, cutoff, chunk_size)
+        moved += count
+        if count < chunk_size:
+            break
+    elapsed = time.monotonic() - started
+
+    sizes = await table_sizes(db)
+    for name, (rows, size) in sizes.items():
+        BOOKING_TABLE_ROWS.set(rows, table=name)
+        if size is not None:
+            BOOKING_TABLE_BYTES.set(size, table=name)
+    if moved:
+        rate = moved / elapsed if elapsed > 0 else 0
+        BOOKING_ARCHIVE_ROWS_PER_SECOND.set(rate)
+        logger.info(
+            "Archived %d bookings that ended before %s in %.1fs (%.0f rows/s); %d active, %d archived",
+            moved, cutoff.date(), elapsed, rate, sizes["bookings"][0], sizes["bookings_archive"][0]
+        )
+    return moved
+
+async def archive_periodically(session_factory, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                await run_archive(db, settings.booking_archive_after_days, settings.booking_archive_chunk_size)
+        except Exception:
+            logger.exception("Booking archive run failed")
+
+async def _run(after_days: int):
+    async with AsyncSessionLocal() as db:
+        moved = await run_archive(db, after_days, settings.booking_archive_chunk_size)
+        sizes = await table_sizes(db)
+    print(f"Archived {moved} bookings; {sizes['bookings'][0]} active, {sizes['bookings_archive'][0]} archived")
+
+def main():
+    parser = argparse.ArgumentParser(description="Move bookings that ended long ago to bookings_archive")
+    parser.add_argument("--after-days", type=int, default=settings.booking_archive_after_days)
+    args = parser.parse_args()
+    if args.after_days < 1:
+        parser.error("--after-days must be at least 1")
+    asyncio.run(_run(args.after_days))
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from database import SessionLocal
-from sqlalchemy.orm import Session
+from config import settings
+from database import get_db
+from hashing import pwd_context
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
 
 # JWT settings
@@ -12,9 +17,65 @@ SECRET_KEY = "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, as seen by request handlers."""
+    id: int
+    email: str
+    full_name: str
+    role: str
+    token_version: int
+    created_at: Optional[datetime] = None
+    disabled_at: Optional[datetime] = None  # set while the account is being purged
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            token_version=user.token_version,
+            created_at=user.created_at,
+            disabled_at=user.disabled_at
+        )
+
+class PrincipalCache:
+    """Bounded LRU of principals by user id; entries expire after a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return principal
+
+    def put(self, principal: Principal):
+        self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+principal_cache = PrincipalCache(settings.principal_cache_size, settings.principal_cache_ttl_seconds)
+
+# Blocking helpers for scripts; request handlers go through hashing.hasher
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -28,17 +89,16 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def create_user_token(user: User):
+    return create_access_token(data={
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role,
+        "tv": user.token_version
+    })
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+async def authenticate(token: str, db: AsyncSession, fresh: bool) -> Principal:
+    """The principal a token stands for; fresh skips the cache and reads the users row."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -46,23 +106,58 @@ def get_current_user(
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        user_id = payload.get("uid")
+        token_version = payload.get("tv")
+        if user_id is None or token_version is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
+
+    # A cached principal older than the token means another worker bumped the version
+    principal = None if fresh else principal_cache.get(user_id)
+    if principal is None or principal.token_version < token_version:
+        user = await db.get(User, user_id)
+        if user is None:
+            principal_cache.invalidate(user_id)
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+        # End the read so the connection goes back to the pool; FastAPI closes this session only
+        # after the response, which for a streamed body (SSE, NDJSON) can be much later
+        await db.commit()
+
+    if principal.token_version != token_version or principal.disabled_at is not None:
         raise credentials_exception
-    return user
+    # Commits on this session start the caller's read-your-writes window (see replicas)
+    db.info["user_id"] = principal.id
+    return principal
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+):
+    return await authenticate(token, db, fresh=False)
 
-def get_current_admin(current_user: User = Depends(get_current_user)):
+async def get_current_writer(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+):
+    """get_current_user for handlers that write.
+
+    Another worker's revocation, purge or deletion reaches this worker's cache only
+    after the TTL, so writes check the users row every time and are refused at once.
+    """
+    return await authenticate(token, db, fresh=True)
+
+async def get_current_admin(current_user: Principal = Depends(get_current_user)):
     if current_user.role not in ["admin", "superadmin"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     return current_user
 
-def get_current_superadmin(current_user: User = Depends(get_current_user)):
+async def get_current_admin_writer(current_user: Principal = Depends(get_current_writer)):
+    return await get_current_admin(current_user)
+
+async def get_current_superadmin(current_user: Principal = Depends(get_current_user)):
     if current_user.role != "superadmin":
         raise HTTPException(status_code=403, detail="Superadmin access required")
-    return current_user
\ No newline at end of file
+    return current_user
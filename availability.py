@@ -0,0 +1,285 @@
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from weakref import WeakValueDictionary
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, String, and_, column, func, select, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Booking
+
+logger = logging.getLogger(__name__)
+
+STAY_FIELDS = ("room_type", "check_in", "check_out")
+
+def naive_utc(value: datetime) -> datetime:
+    # Booking dates are stored without a timezone
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class RoomCalendar:
+    """Bookings of one room type as (check_in, booking_id, check_out), sorted by check_in."""
+
+    def __init__(self):
+        self.entries: List[Tuple[datetime, int, datetime]] = []
+        # Longest stay seen; bounds how far back an overlapping stay can start
+        self.max_stay = timedelta(0)
+
+    def add(self, entry: Tuple[datetime, int, datetime]):
+        insort(self.entries, entry)
+        self.max_stay = max(self.max_stay, entry[2] - entry[0])
+
+    def remove(self, entry: Tuple[datetime, int, datetime]):
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Tuple[datetime, int, datetime]]:
+        lo = bisect_left(self.entries, (start - self.max_stay,))
+        hi = bisect_left(self.entries, (end,))
+        return [e for e in self.entries[lo:hi] if e[2] > start]
+
+class AvailabilityIndex:
+    """In-process interval index of bookings per room type, used to answer availability reads."""
+
+    def __init__(self):
+        self._rooms: Dict[str, RoomCalendar] = defaultdict(RoomCalendar)
+        self._by_id: Dict[int, Tuple[str, Tuple[datetime, int, datetime]]] = {}
+        # Weak, so room types clients merely named don't leave a lock behind
+        self._locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+        # Feed events that arrive while load() runs, applied again once it swaps in
+        self._during_load: Optional[List[dict]] = None
+
+    async def load(self, db: AsyncSession):
+        """Rebuild from current and upcoming bookings; past stays can't affect availability."""
+        rooms = defaultdict(RoomCalendar)
+        by_id = {}
+        self._during_load = []
+        try:
+            result = await db.stream(stays_ending_after(datetime.utcnow()).execution_options(yield_per=10000))
+            async for booking_id, room_type, check_in, check_out in result:
+                entry = (check_in, booking_id, check_out)
+                rooms[room_type].add(entry)
+                by_id[booking_id] = (room_type, entry)
+            self._rooms, self._by_id = rooms, by_id
+            # The rows read may predate these; applying a change twice is harmless
+            self.apply_feed(self._during_load)
+        finally:
+            self._during_load = None
+        logger.info("Availability index loaded with %d bookings", len(by_id))
+
+    def add(self, booking_id: int, room_type: str, check_in: datetime, check_out: datetime):
+        self.remove(booking_id)
+        entry = (naive_utc(check_in), booking_id, naive_utc(check_out))
+        self._rooms[room_type].add(entry)
+        self._by_id[booking_id] = (room_type, entry)
+
+    def remove(self, booking_id: int):
+        existing = self._by_id.pop(booking_id, None)
+        if existing is not None:
+            room_type, entry = existing
+            self._rooms[room_type].remove(entry)
+
+    def apply_feed(self, events: List[dict]) -> List[int]:
+        """Apply change feed events, which carry only the fields a change touched.
+
+        Returns the ids of bookings whose stay can't be worked out from the event
+        and the index, such as a past stay moved into the future.
+        """
+        if self._during_load is not None:
+            self._during_load.extend(events)
+        unknown = []
+        for entry in events:
+            booking_id = entry["booking_id"]
+            if entry["action"] == "delete":
+                self.remove(booking_id)
+                continue
+            changed = {field: entry["changes"][field][1] for field in STAY_FIELDS if field in entry["changes"]}
+            if not changed:
+                continue
+            for field in ("check_in", "check_out"):
+                if field in changed:
+                    changed[field] = datetime.fromisoformat(changed[field])
+            existing = self._by_id.get(booking_id)
+            if existing is not None:
+                room_type, (check_in, _, check_out) = existing
+                stay = {"room_type": room_type, "check_in": check_in, "check_out": check_out, **changed}
+            elif len(changed) == len(STAY_FIELDS):
+                stay = changed
+            else:
+                unknown.append(booking_id)
+                continue
+            if stay["check_out"] > datetime.utcnow():
+                self.add(booking_id, stay["room_type"], stay["check_in"], stay["check_out"])
+            else:
+                self.remove(booking_id)
+        return unknown
+
+    async def reload_bookings(self, db: AsyncSession, booking_ids: List[int]):
+        """Re-read the given bookings' stays, dropping any that are gone or over."""
+        rows = await db.execute(
+            select(Booking.id, Booking.room_type, Booking.check_in, Booking.check_out)
+            .where(Booking.id.in_(booking_ids))
+        )
+        found = {row.id: row for row in rows}
+        now = datetime.utcnow()
+        for booking_id in booking_ids:
+            row = found.get(booking_id)
+            if row is not None and row.check_out > now:
+                self.add(booking_id, row.room_type, row.check_in, row.check_out)
+            else:
+                self.remove(booking_id)
+
+    def conflicts(self, room_type: str, start: datetime, end: datetime) -> List[Tuple[datetime, int, datetime]]:
+        calendar = self._rooms.get(room_type)
+        if calendar is None:
+            return []
+        return calendar.overlapping(naive_utc(start), naive_utc(end))
+
+    def free_slots(self, room_type: str, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        start, end = naive_utc(start), naive_utc(end)
+        slots = []
+        cursor = start
+        for check_in, _, check_out in self.conflicts(room_type, start, end):
+            if check_in > cursor:
+                slots.append((cursor, check_in))
+            cursor = max(cursor, check_out)
+        if cursor < end:
+            slots.append((cursor, end))
+        return slots
+
+    def lock(self, room_type: str) -> asyncio.Lock:
+        # Serializes writers for a room type within this process. The lock lives as long as
+        # someone holds or waits on it, so callers must keep the returned lock until released
+        lock = self._locks.get(room_type)
+        if lock is None:
+            lock = self._locks[room_type] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def locks(self, room_types: Iterable[str]):
+        """lock() for several room types, taken in a fixed order to avoid deadlocks."""
+        async with AsyncExitStack() as stack:
+            for room_type in sorted(set(room_types)):
+                await stack.enter_async_context(self.lock(room_type))
+            yield
+
+availability_index = AvailabilityIndex()
+
+def stays_ending_after(now: datetime):
+    """What AvailabilityIndex.load reads: every stay not yet over."""
+    return select(Booking.id, Booking.room_type, Booking.check_in, Booking.check_out).where(Booking.check_out > now)
+
+def overlapping_booking(room_type: str, check_in: datetime, check_out: datetime, exclude_id: Optional[int] = None):
+    """Id of any booking of room_type overlapping [check_in, check_out), other than exclude_id."""
+    stmt = select(Booking.id).where(
+        Booking.room_type == room_type,
+        Booking.check_in < check_out,
+        Booking.check_out > check_in
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(Booking.id != exclude_id)
+    return stmt.limit(1)
+
+def clashing_bookings(stays: list):
+    """(n, booking id) for every stored booking overlapping the nth of find_overlaps' stays."""
+    candidates = values(
+        column("n", Integer), column("room_type", String), column("check_in", DateTime), column("check_out", DateTime),
+        name="candidates"
+    ).data([(n, room_type, check_in, check_out) for n, (_, _, room_type, check_in, check_out) in enumerate(stays)]).cte("candidates")
+    return select(candidates.c.n, Booking.id).join(Booking, and_(
+        Booking.room_type == candidates.c.room_type,
+        Booking.check_in < candidates.c.check_out,
+        Booking.check_out > candidates.c.check_in
+    ))
+
+async def ensure_available(
+    db: AsyncSession,
+    room_type: str,
+    check_in: datetime,
+    check_out: datetime,
+    exclude_id: Optional[int] = None
+):
+    """Reject a stay that overlaps another booking of the same room type.
+
+    Must run inside the write transaction and under availability_index.lock(room_type).
+    On Postgres an advisory lock serializes writers across workers until commit, and the
+    bookings_no_overlap exclusion constraint backs it up.
+    """
+    check_in, check_out = naive_utc(check_in), naive_utc(check_out)
+    if check_out <= check_in:
+        raise HTTPException(status_code=400, detail="check_out must be after check_in")
+
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(room_type))))
+
+    if await db.scalar(overlapping_booking(room_type, check_in, check_out, exclude_id)) is not None:
+        raise HTTPException(status_code=409, detail="Room is already booked for those dates")
+
+async def lock_room_types(db: AsyncSession, room_types: Iterable[str]):
+    # Same advisory locks as ensure_available, taken in a fixed order to avoid deadlocks
+    if db.get_bind().dialect.name == "postgresql":
+        for room_type in sorted(set(room_types)):
+            await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(room_type))))
+
+async def find_overlaps(db: AsyncSession, stays: list, released_ids: Set[int] = frozenset()) -> set:
+    """Return the keys of stays that overlap a stored booking or an earlier stay in the list.
+
+    stays are (key, booking_id, room_type, check_in, check_out) with naive UTC dates;
+    booking_id is the row being moved (None for a new row) and never conflicts with
+    itself. released_ids are rows deleted in the same transaction. Stored bookings are
+    matched per stay through ix_bookings_room_type_check_in_check_out, with the stays
+    joined in as a VALUES CTE, so only bookings that actually clash are read. Locks the
+    room types involved for the rest of the transaction.
+    """
+    await lock_room_types(db, {stay[2] for stay in stays})
+    clashes = defaultdict(set)
+    for n, booking_id in await db.execute(clashing_bookings(stays)):
+        if booking_id not in released_ids and booking_id != stays[n][1]:
+            clashes[n].add(booking_id)
+
+    # In list order: a moved booking frees its old slot once its own move is accepted
+    calendars = defaultdict(RoomCalendar)
+    moved, conflicts = set(), set()
+    for n, (key, booking_id, room_type, check_in, check_out) in enumerate(stays):
+        if clashes[n] - moved or calendars[room_type].overlapping(check_in, check_out):
+            conflicts.add(key)
+            continue
+        calendars[room_type].add((check_in, n, check_out))
+        if booking_id is not None:
+            moved.add(booking_id)
+    return conflicts
+
+def follow_changes(session_factory) -> Callable[[List[dict]], None]:
+    """change_feed.broker listener that applies every worker's booking writes to availability_index."""
+    pending: Set[asyncio.Task] = set()
+
+    async def reload(booking_ids: List[int]):
+        try:
+            async with session_factory() as db:
+                await availability_index.reload_bookings(db, booking_ids)
+        except Exception:
+            logger.exception("Availability index update for bookings %s failed", booking_ids)
+
+    def apply(events: List[dict]):
+        unknown = availability_index.apply_feed(events)
+        if unknown:
+            task = asyncio.get_running_loop().create_task(reload(unknown))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    return apply
+
+async def refresh_periodically(session_factory, interval: float):
+    """Reload the index now and then, in case the change feed missed something (say, while reconnecting)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                await availability_index.load(db)
+        except Exception:
+            logger.exception("Availability index refresh failed")
@@ -0,0 +1,101 @@
+"""Fail when an endpoint issues more SQL statements than its budget, or repeats one.
+
+Usage: python -m bench.budgets [--only NAME ...]
+
+Sends a few requests to every endpoint in bench.load's scenarios against
+DATABASE_URL (seeded when it has no bookings) and checks each one with
+query_budget. The principal cache is cleared before every request, so budgets
+include the user lookup a cold cache costs. A change that adds statements to
+a handler must raise its budget here, which makes the cost visible in review.
+`python -m pytest` runs the same check (tests/test_query_budgets.py), next to
+the query plan checks in tests/test_query_plans.py.
+"""
+import argparse
+import asyncio
+import sys
+import httpx
+# First, so its environment defaults apply before config is read
+from bench.load import SCENARIOS, app, load_context, prepare_database
+from auth import principal_cache
+from config import settings
+from query_budget import capture_queries
+
+REQUESTS = 3
+
+# (max statements, max times one statement may repeat) per scenario
+BUDGETS = {
+    "root": (0, 1),
+    "auth.login": (1, 1),
+    "auth.register": (3, 1),
+    "users.me": (1, 1),
+    "bookings.my_bookings": (2, 1),
+    "bookings.my_calendar": (2, 1),
+    "bookings.availability": (1, 1),
+    "bookings.adminview": (2, 1),
+    "bookings.adminview_narrow": (2, 1),
+    "bookings.get_by_id": (2, 1),
+    "bookings.stats": (2, 1),
+    "bookings.export": (2, 1),
+    "bookings.activity": (2, 1),
+    "bookings.users": (2, 1),
+    "users.update_me": (2, 1),
+    "bookings.create": (6, 1),
+    # SQLite reads the old row before the UPDATE; Postgres needs one statement less
+    "bookings.update_my": (5, 1),
+    "bookings.update_admin": (5, 1),
+    # Rows are read once for the room locks and again under them
+    "bookings.batch": (8, 1),
+    "bookings.import": (6, 1),
+    "bookings.delete_my": (4, 1),
+    "bookings.delete_admin": (4, 1),
+    "otp.request": (3, 1),
+    "otp.verify": (3, 1),
+    # Active and archived bookings are read once for their delete events; the database cascades the rest
+    "users.delete_me": (7, 1),
+}
+
+async def run(names) -> list:
+    ctx = load_context()
+    scenarios = [s for s in SCENARIOS if not names or s.name in names]
+    if settings.otp_backend != "sql":
+        scenarios = [s for s in scenarios if s.name not in ("otp.verify", "users.delete_me")]
+    # Built up front: some builders write through the sync engine
+    built = [(scenario, scenario.build(ctx, REQUESTS)) for scenario in scenarios]
+
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario, requests in built:
+                max_queries, max_repeats = BUDGETS[scenario.name]
+                worst = 0
+                for kwargs in requests:
+                    kwargs = dict(kwargs)
+                    url = scenario.path.format(*kwargs.pop("url_args", ()))
+                    principal_cache.clear()
+                    with capture_queries() as captured:
+                        response = await client.request(scenario.method, url, **kwargs)
+                    if response.status_code != scenario.expect:
+                        failures.append(f"{scenario.name}: expected {scenario.expect}, got {response.status_code}")
+                        continue
+                    for request in captured:
+                        worst = max(worst, request.count)
+                        failures.extend(f"{scenario.name}: {problem}" for problem in request.problems(max_queries, max_repeats))
+                print(f"  {scenario.name:<26} {worst:>3} / {max_queries} statements")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="*", help="endpoint names to check, e.g. bookings.create")
+    args = parser.parse_args()
+
+    prepare_database(300, 3000, 100)
+    failures = asyncio.run(run(args.only))
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("All endpoints within their query budgets")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""Latency, throughput and queries per request for every endpoint in routers/.
+
+Usage: python -m bench.load [--users N] [--bookings N] [--otps N]
+                            [--requests N] [--concurrency N] [--only NAME ...]
+                            [--output results.json] [--baseline previous.json]
+
+Runs against DATABASE_URL (a scratch SQLite file locally, or a migrated Postgres
+database), seeding it when it has no bookings. Requests go through an in-process
+ASGI client, one endpoint at a time at a fixed concurrency. Mutating endpoints
+consume seeded rows, so reseed from scratch for numbers you want to compare.
+Login and register cost whatever BCRYPT_ROUNDS says.
+"""
+import os
+
+# Keep OTP notifications out of the output and make OTPs preparable in SQL
+os.environ.setdefault("NOTIFICATION_PROVIDER", "file")
+os.environ.setdefault("NOTIFICATION_FILE", os.devnull)
+os.environ.setdefault("OTP_BACKEND", "sql")
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+import httpx
+from sqlalchemy import delete, func, insert, select, text, update
+from auth import create_user_token
+from config import settings
+from database import engine
+from etags import booking_etag
+from hashing import pwd_context
+from main import app
+from models import Base, Booking, BookingArchive, BookingDailyStats, BookingEvent, OTPRequest, User
+from pagination import encode_cursor
+from query_budget import capture_queries
+
+PASSWORD = "bench-password"
+ROOM_TYPES = 50
+BATCH_ITEMS = 10  # updates and deletes per batch request
+
+@dataclass
+class Context:
+    """Seeded ids and ready-made auth headers the scenarios draw from."""
+    run_id: str
+    users: List[SimpleNamespace]  # regular accounts, handed out by take_users
+    bookings: List[SimpleNamespace]
+    users_by_id: Dict[int, SimpleNamespace]  # every account, including the admins
+    superadmin: dict
+    admin: dict
+    headers_by_user: Dict[int, dict] = field(default_factory=dict)
+    _next_booking: int = 0
+    _next_user: int = 0
+
+    def headers(self, user) -> dict:
+        if user.id not in self.headers_by_user:
+            self.headers_by_user[user.id] = {"Authorization": f"Bearer {create_user_token(user)}"}
+        return self.headers_by_user[user.id]
+
+    def take_bookings(self, n: int) -> list:
+        # Mutating scenarios each get bookings nobody else touches
+        taken = self.bookings[self._next_booking:self._next_booking + n]
+        if len(taken) < n:
+            raise SystemExit("Not enough seeded bookings left; reseed with more --bookings")
+        self._next_booking += n
+        return taken
+
+    def take_users(self, n: int) -> list:
+        taken = self.users[self._next_user:self._next_user + n]
+        if len(taken) < n:
+            raise SystemExit("Not enough seeded users left; reseed with more --users")
+        self._next_user += n
+        return taken
+
+    def owner(self, booking):
+        return self.users_by_id[booking.user_id]
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    build: Callable[[Context, int], List[dict]]  # httpx request kwargs, one per request
+    expect: int = 200
+    scale: float = 1.0  # share of --requests, for endpoints too heavy to run in full
+
+def _range(days: int):
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=days)
+
+def build_login(ctx, n):
+    return [{"data": {"username": user.email, "password": PASSWORD}} for user in ctx.take_users(n)]
+
+def build_register(ctx, n):
+    return [{"json": {"email": f"bench-{ctx.run_id}-{i}@example.com", "full_name": f"Bench {i}", "password": PASSWORD}}
+            for i in range(n)]
+
+def build_me(ctx, n):
+    users = ctx.take_users(min(n, 50))
+    return [{"headers": ctx.headers(users[i % len(users)])} for i in range(n)]
+
+def build_update_me(ctx, n):
+    return [{"headers": ctx.headers(user), "json": {"full_name": f"Renamed {user.id}"}} for user in ctx.take_users(n)]
+
+def build_create_booking(ctx, n):
+    users = ctx.take_users(min(n, 50))
+    start, end = _range(2)
+    return [{
+        "headers": ctx.headers(users[i % len(users)]),
+        "json": {"room_type": f"bench-{ctx.run_id}-{i}", "check_in": start.isoformat(), "check_out": end.isoformat(), "guests": 2},
+    } for i in range(n)]
+
+def build_my_bookings(ctx, n):
+    users = ctx.take_users(min(n, 50))
+    return [{"headers": ctx.headers(users[i % len(users)])} for i in range(n)]
+
+def build_my_calendar(ctx, n):
+    # What a calendar widget asks for
+    return [{**request, "params": {"fields": "id,check_in,check_out"}} for request in build_my_bookings(ctx, n)]
+
+def build_availability(ctx, n):
+    start, end = _range(30)
+    user = ctx.take_users(1)[0]
+    return [{"headers": ctx.headers(user), "params": {"room_type": f"room-{i % ROOM_TYPES}", "from": start.isoformat(), "to": end.isoformat()}}
+            for i in range(n)]
+
+def build_update_my(ctx, n):
+    return [{"url_args": (booking.id,), "headers": ctx.headers(ctx.owner(booking)), "json": {"guests": 1 + booking.guests % 4}}
+            for booking in ctx.take_bookings(n)]
+
+def build_delete_my(ctx, n):
+    return [{"url_args": (booking.id,), "headers": ctx.headers(ctx.owner(booking))} for booking in ctx.take_bookings(n)]
+
+def build_adminview(ctx, n):
+    # Spread pages over the table instead of hammering the first one
+    step = max(1, ctx.bookings[-1].id // max(n, 1))
+    return [{"headers": ctx.admin, "params": {"cursor": encode_cursor(i * step)} if i else {}} for i in range(n)]
+
+def build_adminview_narrow(ctx, n):
+    # No include=user, so no users join
+    return [{**request, "params": {**request.get("params", {}), "fields": "id,room_type,check_in,check_out,user_id"}}
+            for request in build_adminview(ctx, n)]
+
+def build_stats(ctx, n):
+    start, end = _range(30)
+    return [{"headers": ctx.admin, "params": {"from": start.date().isoformat(), "to": end.date().isoformat()}} for _ in range(n)]
+
+def build_import(ctx, n):
+    start, end = _range(1)
+    user_id = ctx.users[0].id
+    return [{
+        "headers": ctx.admin,
+        "files": {"file": ("bookings.csv",
+                           "room_type,check_in,check_out,guests,user_id\n"
+                           f"bench-import-{ctx.run_id}-{i},{start.isoformat()},{end.isoformat()},2,{user_id}\n")},
+    } for i in range(n)]
+
+def build_export(ctx, n):
+    return [{"headers": ctx.admin} for _ in range(n)]
+
+def build_get_booking(ctx, n):
+    ids = [booking.id for booking in ctx.bookings]
+    return [{"url_args": (ids[(i * 7919) % len(ids)],), "headers": ctx.admin} for i in range(n)]
+
+def build_update_admin(ctx, n):
+    # Conditional, the way an admin client editing what it last fetched would send it
+    return [{"url_args": (booking.id,), "headers": {**ctx.admin, "If-Match": booking_etag(booking.id, booking.version)},
+             "json": {"guests": 1 + booking.guests % 4}}
+            for booking in ctx.take_bookings(n)]
+
+def build_batch(ctx, n):
+    requests = []
+    for _ in range(n):
+        bookings = ctx.take_bookings(2 * BATCH_ITEMS)
+        requests.append({"headers": ctx.admin, "json": {
+            "updates": [{"id": b.id, "guests": 1 + b.guests % 4} for b in bookings[:BATCH_ITEMS]],
+            "deletes": [b.id for b in bookings[BATCH_ITEMS:]],
+        }})
+    return requests
+
+def build_delete_admin(ctx, n):
+    return [{"url_args": (booking.id,), "headers": ctx.admin} for booking in ctx.take_bookings(n)]
+
+def build_activity(ctx, n):
+    return [{"headers": ctx.superadmin} for _ in range(n)]
+
+def build_users(ctx, n):
+    return [{"headers": ctx.superadmin} for _ in range(n)]
+
+def _prepare_otps(users, is_used: bool, code: str = "123456"):
+    # Replace whatever OTP these users have with one in a known state
+    ids = [user.id for user in users]
+    with engine.begin() as conn:
+        conn.execute(delete(OTPRequest).where(OTPRequest.user_id.in_(ids), OTPRequest.action_type == "delete_account"))
+        conn.execute(insert(OTPRequest), [
+            {"user_id": user_id, "otp_code": code, "action_type": "delete_account", "is_used": is_used,
+             "attempts": 0, "expires_at": datetime.utcnow() + timedelta(minutes=10)}
+            for user_id in ids
+        ])
+
+def build_otp_request(ctx, n):
+    return [{"headers": ctx.headers(user)} for user in ctx.take_users(n)]
+
+def build_otp_verify(ctx, n):
+    users = ctx.take_users(n)
+    _prepare_otps(users, is_used=False)
+    return [{"headers": ctx.headers(user), "json": {"otp_code": "123456"}} for user in users]
+
+def build_delete_me(ctx, n):
+    users = ctx.take_users(n)
+    _prepare_otps(users, is_used=True)
+    return [{"headers": ctx.headers(user)} for user in users]
+
+# Read-only endpoints first; account deletion last since it cascades into bookings
+SCENARIOS = [
+    Scenario("root", "GET", "/", lambda ctx, n: [{} for _ in range(n)]),
+    Scenario("auth.login", "POST", "/auth/login", build_login),
+    Scenario("auth.register", "POST", "/auth/register", build_register),
+    Scenario("users.me", "GET", "/users/me", build_me),
+    Scenario("bookings.my_bookings", "GET", "/bookings/user/my-bookings", build_my_bookings),
+    Scenario("bookings.my_calendar", "GET", "/bookings/user/my-bookings", build_my_calendar),
+    Scenario("bookings.availability", "GET", "/bookings/availability", build_availability),
+    Scenario("bookings.adminview", "GET", "/bookings/adminview", build_adminview),
+    Scenario("bookings.adminview_narrow", "GET", "/bookings/adminview", build_adminview_narrow),
+    Scenario("bookings.get_by_id", "GET", "/bookings/adminview/{}", build_get_booking),
+    Scenario("bookings.stats", "GET", "/bookings/stats", build_stats),
+    Scenario("bookings.export", "GET", "/bookings/adminview/export", build_export, scale=0.05),
+    Scenario("bookings.activity", "GET", "/bookings/superadmin/activity", build_activity),
+    Scenario("bookings.users", "GET", "/bookings/superadmin/users", build_users, scale=0.25),
+    Scenario("users.update_me", "PUT", "/users/me", build_update_me),
+    Scenario("bookings.create", "POST", "/bookings/", build_create_booking),
+    Scenario("bookings.update_my", "PUT", "/bookings/user/my-bookings/{}", build_update_my),
+    Scenario("bookings.update_admin", "PUT", "/bookings/adminview/{}", build_update_admin),
+    Scenario("bookings.batch", "POST", "/bookings/adminview/batch", build_batch, scale=0.25),
+    Scenario("bookings.import", "POST", "/bookings/adminview/import", build_import),
+    Scenario("bookings.delete_my", "DELETE", "/bookings/user/my-bookings/{}", build_delete_my),
+    Scenario("bookings.delete_admin", "DELETE", "/bookings/adminview/{}", build_delete_admin),
+    Scenario("otp.request", "POST", "/otp/request-account-deletion", build_otp_request),
+    Scenario("otp.verify", "POST", "/otp/verify-account-deletion", build_otp_verify),
+    Scenario("users.delete_me", "DELETE", "/users/me", build_delete_me),
+]
+
+def seed(conn, users: int, bookings: int, otps: int):
+    """Insert synthetic rows: non-overlapping stays per room type, about 90% already past,
+    and half as many older stays already archived."""
+    conn.execute(insert(User), [
+        {"email": f"user{i}@example.com", "hashed_password": "x", "full_name": f"User {i}", "role": "user"}
+        for i in range(1, users + 1)
+    ])
+    start = datetime.utcnow() - timedelta(days=2 * (bookings // ROOM_TYPES) * 9 // 10)
+    older = []
+    for i in range(bookings // 2):
+        check_in = start - timedelta(days=2 * (1 + i // ROOM_TYPES))
+        older.append({
+            "room_type": f"room-{i % ROOM_TYPES}",
+            "check_in": check_in,
+            "check_out": check_in + timedelta(days=1),
+            "guests": 1 + i % 4,
+            "user_id": 1 + i % users,
+        })
+    current = []
+    for i in range(bookings):
+        check_in = start + timedelta(days=2 * (i // ROOM_TYPES))
+        current.append({
+            "room_type": f"room-{i % ROOM_TYPES}",
+            "check_in": check_in,
+            "check_out": check_in + timedelta(days=1 + i % 2),
+            "guests": 1 + i % 4,
+            "user_id": 1 + i % users,
+        })
+    for rows in (older, current):
+        for offset in range(0, len(rows), 10000):
+            conn.execute(insert(Booking), rows[offset:offset + 10000])
+    # Archived the way archive.archive_chunk does it, so their ids come from bookings
+    # and new bookings never reuse them
+    table = Booking.__table__
+    conn.execute(insert(BookingArchive.__table__).from_select(
+        [column.name for column in table.c], select(*table.c).where(table.c.check_in < start)
+    ))
+    conn.execute(delete(table).where(table.c.check_in < start))
+    first_id = conn.scalar(select(func.min(Booking.id)))
+    # A creation event per booking spread over the last year, plus admin edits
+    events = []
+    for i in range(bookings):
+        events.append({
+            "ts": datetime.utcnow() - timedelta(minutes=5 * (bookings - i)),
+            "booking_id": first_id + i,
+            "user_id": 1 + i % users,
+            "actor": "admin@example.com" if i % 100 == 0 else f"user{1 + i % users}@example.com",
+            "action": "update" if i % 100 == 0 else "create",
+            "changes": {"guests": [1, 2]},
+        })
+        if len(events) == 10000:
+            conn.execute(insert(BookingEvent), events)
+            events = []
+    if events:
+        conn.execute(insert(BookingEvent), events)
+    # One rollup row per room type and day the bookings above cover
+    conn.execute(insert(BookingDailyStats), [
+        {"room_type": f"room-{r}", "day": (start + timedelta(days=d)).date(), "bookings": 1, "guests": 2}
+        for r in range(ROOM_TYPES) for d in range(2 * (bookings // ROOM_TYPES))
+    ])
+    # At most one OTP per user and action
+    conn.execute(insert(OTPRequest), [
+        {"user_id": 1 + i % users, "otp_code": f"{i % 1000000:06d}", "action_type": f"action-{i // users}",
+         "is_used": i % 3 == 0, "expires_at": datetime.utcnow() + timedelta(minutes=10)}
+        for i in range(otps)
+    ])
+    conn.execute(text("ANALYZE"))
+
+def prepare_database(users: int, bookings: int, otps: int):
+    with engine.begin() as conn:
+        # The app only creates tables once its lifespan starts
+        Base.metadata.create_all(conn)
+        if not conn.scalar(select(func.count()).select_from(Booking)):
+            print(f"Seeding {users} users, {bookings} bookings, {otps} OTPs...")
+            seed(conn, users, bookings, otps)
+        # Every seeded account gets the same password; the first two run the admin endpoints
+        conn.execute(update(User).values(hashed_password=pwd_context.hash(PASSWORD)))
+        first_ids = conn.scalars(select(User.id).order_by(User.id).limit(2)).all()
+        conn.execute(update(User).where(User.id == first_ids[0]).values(role="superadmin"))
+        conn.execute(update(User).where(User.id == first_ids[1]).values(role="admin"))
+
+def load_context() -> Context:
+    with engine.connect() as conn:
+        users = [SimpleNamespace(**row._mapping) for row in conn.execute(
+            select(User.id, User.email, User.role, User.token_version).order_by(User.id)
+        )]
+        bookings = [SimpleNamespace(**row._mapping) for row in conn.execute(
+            select(Booking.id, Booking.user_id, Booking.guests, Booking.version).order_by(Booking.id)
+        )]
+    return Context(
+        run_id=uuid.uuid4().hex[:8],
+        users=users[2:],
+        bookings=bookings,
+        users_by_id={user.id: user for user in users},
+        superadmin={"Authorization": f"Bearer {create_user_token(users[0])}"},
+        admin={"Authorization": f"Bearer {create_user_token(users[1])}"},
+    )
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest rank on sorted values
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: List[dict], concurrency: int) -> dict:
+    latencies = []
+    errors = {}
+    pending = iter(requests)
+
+    async def worker():
+        for kwargs in pending:
+            kwargs = dict(kwargs)
+            url = scenario.path.format(*kwargs.pop("url_args", ()))
+            start = time.perf_counter()
+            response = await client.request(scenario.method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != scenario.expect:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    # Counted the way the query budgets count them, so the two always agree
+    with capture_queries() as captured:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(latencies) / wall,
+        "queries_per_request": sum(request.count for request in captured) / len(captured),
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results: dict, baseline: Optional[dict]):
+    header = f"{'endpoint':<26}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'q/req':>7}"
+    if baseline:
+        header += f"{'p95 Δ':>9}{'req/s Δ':>9}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<26}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                f"{r['p99_ms']:>9.1f}{r['throughput_rps']:>9.1f}{r['queries_per_request']:>7.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            line += f"{(r['p95_ms'] / before['p95_ms'] - 1) * 100:>+8.0f}%"
+            line += f"{(r['throughput_rps'] / before['throughput_rps'] - 1) * 100:>+8.0f}%"
+        if r["error_statuses"]:
+            line += "  " + ", ".join(f"{count}x {status}" for status, count in sorted(r["error_statuses"].items()))
+        print(line)
+
+async def run(args) -> dict:
+    ctx = load_context()
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    if settings.otp_backend != "sql":
+        # Prepared OTP rows only exist for the SQL backend
+        scenarios = [s for s in scenarios if s.name not in ("otp.verify", "users.delete_me")]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    # Startup and shutdown hooks run as they would under a server
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in scenarios:
+                # The first request is an untimed warm-up
+                n = max(2, int(args.requests * scenario.scale) + 1)
+                requests = scenario.build(ctx, n)
+                await run_scenario(client, scenario, requests[:1], 1)
+                results[scenario.name] = await run_scenario(client, scenario, requests[1:], args.concurrency)
+                r = results[scenario.name]
+                print(f"  {scenario.name:<26} p95 {r['p95_ms']:.1f} ms, {r['throughput_rps']:.0f} req/s", flush=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--bookings", type=int, default=100000)
+    parser.add_argument("--otps", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="endpoint names to run, e.g. bookings.create")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    prepare_database(args.users, args.bookings, args.otps)
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "commit": git_commit(),
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "database": engine.dialect.name,
+                    "python": platform.python_version(),
+                    "bcrypt_rounds": settings.bcrypt_rounds,
+                    "users": args.users,
+                    "bookings": args.bookings,
+                    "otps": args.otps,
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Rows per second for the adminview payload: ORM + pydantic vs plain rows + orjson.
+
+Usage: python -m bench.serialization [--rows N] [--repeat N]
+
+Runs against DATABASE_URL (point it at a scratch SQLite file), seeding it when empty.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from pydantic import TypeAdapter
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import joinedload
+from database import AsyncSessionLocal, engine
+from models import Base, Booking, User
+from schemas import BookingWithUser, UserResponse
+from serialization import booking_with_user_dict, booking_with_user_select, dumps
+
+response_adapter = TypeAdapter(list[BookingWithUser])
+
+def seed(rows: int):
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        if conn.scalar(select(func.count()).select_from(Booking)) >= rows:
+            return
+        conn.execute(insert(User), [
+            {"email": f"bench{i}@example.com", "hashed_password": "x", "full_name": f"Bench {i}", "role": "user"}
+            for i in range(100)
+        ])
+        user_ids = conn.scalars(select(User.id)).all()
+        start = datetime(2030, 1, 1)
+        conn.execute(insert(Booking), [
+            {"room_type": f"bench-{i % 50}", "check_in": start + timedelta(days=i), "check_out": start + timedelta(days=i, hours=12),
+             "guests": 2, "user_id": user_ids[i % len(user_ids)], "updated_by": "admin@example.com"}
+            for i in range(rows)
+        ])
+
+async def orm_path(limit: int) -> bytes:
+    """The previous implementation: ORM objects, hand-built models, response_model validation."""
+    async with AsyncSessionLocal() as db:
+        bookings = (await db.scalars(
+            select(Booking).options(joinedload(Booking.user)).order_by(Booking.id).limit(limit)
+        )).all()
+        payload = [
+            BookingWithUser(
+                id=b.id, room_type=b.room_type, check_in=b.check_in, check_out=b.check_out,
+                guests=b.guests, user_id=b.user_id, created_at=b.created_at, updated_at=b.updated_at,
+                updated_by=b.updated_by, version=b.version,
+                user=UserResponse(id=b.user.id, email=b.user.email, full_name=b.user.full_name, role=b.user.role,
+                                  created_at=b.user.created_at)
+            )
+            for b in bookings
+        ]
+        # What FastAPI does with the returned list and response_model
+        return response_adapter.dump_json(response_adapter.validate_python(payload, from_attributes=True))
+
+async def row_path(limit: int) -> bytes:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(booking_with_user_select().order_by(Booking.id).limit(limit))).all()
+        return dumps([booking_with_user_dict(row) for row in rows])
+
+async def measure(fn, rows: int, repeat: int) -> float:
+    await fn(rows)  # warm up connections and statement caches
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+async def run(rows: int, repeat: int):
+    # Only a like-for-like comparison means anything
+    if json.loads(await orm_path(100)) != json.loads(await row_path(100)):
+        raise SystemExit("The two paths produce different payloads")
+    before = await measure(orm_path, rows, repeat)
+    after = await measure(row_path, rows, repeat)
+    print(f"{'path':<28}{'rows/s':>12}")
+    print(f"{'ORM + pydantic (before)':<28}{before:>12,.0f}")
+    print(f"{'rows + orjson (after)':<28}{after:>12,.0f}")
+    print(f"speedup: {after / before:.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    seed(args.rows)
+    asyncio.run(run(args.rows, args.repeat))
+
+if __name__ == "__main__":
+    main()
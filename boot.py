@@ -0,0 +1,51 @@
+"""Worker boot timings.
+
+main marks its import phases and times each lifespan step; the breakdown is
+logged once the worker is ready, with a warning when it overruns STARTUP_BUDGET_MS.
+Import this first so its clock starts before the heavy imports.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class BootTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self.steps: List[Tuple[str, str, float]] = []  # (phase, step, seconds)
+
+    def mark(self, name: str):
+        """Record the import time since the previous mark."""
+        now = time.perf_counter()
+        self.steps.append(("import", name, now - self._last_mark))
+        self._last_mark = now
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append(("startup", name, time.perf_counter() - start))
+
+    def breakdown(self) -> str:
+        parts = []
+        for phase in ("import", "startup"):
+            steps = [(name, seconds) for step_phase, name, seconds in self.steps if step_phase == phase]
+            total = sum(seconds for _, seconds in steps)
+            detail = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in steps)
+            parts.append(f"{phase} {total * 1000:.0f} ms ({detail})")
+        return "; ".join(parts)
+
+    def ready(self):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        logger.info("Worker ready in %.0f ms: %s", elapsed_ms, self.breakdown())
+        if settings.startup_budget_ms and elapsed_ms > settings.startup_budget_ms:
+            logger.warning("Worker boot took %.0f ms, over the %.0f ms budget: %s",
+                           elapsed_ms, settings.startup_budget_ms, self.breakdown())
+
+boot = BootTimer()
@@ -0,0 +1,200 @@
+"""Bulk booking import and export.
+
+CLI:
+    python bulk.py import bookings.csv [--format csv|ndjson] [--actor EMAIL]
+    python bulk.py export bookings.ndjson [--format csv|ndjson]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, TextIO
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from availability import availability_index, find_overlaps
+from database import AsyncSessionLocal
+from events import Change, record, snapshot
+from models import Booking, User
+from schemas import BookingImportRow, ImportReport, ImportRowError
+
+FORMATS = ("csv", "ndjson")
+IMPORT_COLUMNS = ("room_type", "check_in", "check_out", "guests", "user_id", "version")
+EXPORT_COLUMNS = ("id", "room_type", "check_in", "check_out", "guests", "user_id", "created_at", "updated_at", "updated_by", "version")
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_BATCH_SIZE = 5000
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # Surfaces as a per-row validation error
+                yield {"__error__": f"Invalid JSON: {e.msg}"}
+
+def _validate(line_no: int, raw: dict, errors: list):
+    if "__error__" in raw:
+        errors.append((line_no, raw["__error__"]))
+        return None
+    try:
+        row = BookingImportRow.model_validate(raw)
+    except ValidationError as e:
+        first = e.errors()[0]
+        errors.append((line_no, f"{'.'.join(map(str, first['loc']))}: {first['msg']}"))
+        return None
+    if row.check_out <= row.check_in:
+        errors.append((line_no, "check_out must be after check_in"))
+        return None
+    return row
+
+def _next_chunk(numbered: Iterator, errors: list) -> Optional[list]:
+    """Read and validate up to CHUNK_SIZE rows as (line_no, row); None once rows run out."""
+    chunk = list(islice(numbered, CHUNK_SIZE))
+    if not chunk:
+        return None
+    valid = []
+    for line_no, raw in chunk:
+        row = _validate(line_no, raw, errors)
+        if row is not None:
+            valid.append((line_no, row))
+    return valid
+
+async def _reject_conflicts(db: AsyncSession, rows: list, errors: list) -> list:
+    """Drop rows overlapping an existing booking or an earlier row of the same import."""
+    conflicts = await find_overlaps(db, [
+        (line_no, None, row.room_type, row.check_in, row.check_out) for line_no, row in rows
+    ])
+    for line_no, _ in rows:
+        if line_no in conflicts:
+            errors.append((line_no, "Room is already booked for those dates"))
+    return [row for line_no, row in rows if line_no not in conflicts]
+
+async def _insert(db: AsyncSession, rows: List[BookingImportRow]) -> List[int]:
+    values = [tuple(getattr(row, column) for column in IMPORT_COLUMNS) for row in rows]
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Reserve ids up front so COPY rows can be indexed without reading them back
+        ids = (await db.scalars(
+            select(func.nextval(func.pg_get_serial_sequence("bookings", "id")))
+            .select_from(func.generate_series(1, len(rows)))
+        )).all()
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "bookings",
+            records=[(booking_id,) + row for booking_id, row in zip(ids, values)],
+            columns=("id",) + IMPORT_COLUMNS,
+        )
+        return list(ids)
+
+    result = await db.scalars(
+        insert(Booking).returning(Booking.id, sort_by_parameter_order=True),
+        [dict(zip(IMPORT_COLUMNS, row)) for row in values],
+    )
+    return list(result)
+
+async def import_bookings(db: AsyncSession, rows: Iterable[dict], actor: str) -> ImportReport:
+    """Validate and insert rows in chunks, one transaction per chunk, logging each as created by actor."""
+    imported = 0
+    errors = []
+    numbered = enumerate(rows, start=1)
+    while True:
+        # rows may read and parse a file; keep that off the event loop
+        valid = await asyncio.to_thread(_next_chunk, numbered, errors)
+        if valid is None:
+            break
+
+        user_ids = {row.user_id for _, row in valid}
+        known = set((await db.scalars(select(User.id).where(User.id.in_(user_ids)))).all()) if user_ids else set()
+        for line_no, row in valid:
+            if row.user_id not in known:
+                errors.append((line_no, f"user_id {row.user_id} does not exist"))
+        valid = [(line_no, row) for line_no, row in valid if row.user_id in known]
+
+        accepted = await _reject_conflicts(db, valid, errors) if valid else []
+        if accepted:
+            ids = await _insert(db, accepted)
+            await record(db, [Change(booking_id, actor, "create", None, snapshot(row)) for booking_id, row in zip(ids, accepted)])
+            await db.commit()
+            imported += len(accepted)
+            for booking_id, row in zip(ids, accepted):
+                availability_index.add(booking_id, row.room_type, row.check_in, row.check_out)
+        else:
+            await db.rollback()
+
+    errors.sort()
+    return ImportReport(
+        imported=imported,
+        failed=len(errors),
+        errors=[ImportRowError(row=line_no, error=error) for line_no, error in errors[:MAX_REPORTED_ERRORS]],
+    )
+
+def _format_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def export_bookings(fmt: str):
+    """Yield bookings as CSV or NDJSON text, read through a server-side cursor."""
+    columns = [getattr(Booking, column) for column in EXPORT_COLUMNS]
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(*columns).order_by(Booking.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+        async for partition in result.partitions():
+            for row in partition:
+                values = [_format_value(value) for value in row]
+                if fmt == "csv":
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+def detect_format(path: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+async def _run_import(path: str, fmt: str, actor: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        async with AsyncSessionLocal() as db:
+            report = await import_bookings(db, read_rows(f, fmt), actor)
+    print(f"Imported {report.imported} bookings, {report.failed} rows failed")
+    for error in report.errors:
+        print(f"  row {error.row}: {error.error}")
+
+async def _run_export(path: str, fmt: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        async for text in export_bookings(fmt):
+            f.write(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk booking import and export")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--actor", default="bulk-cli", help="recorded as the actor of imported bookings")
+    args = parser.parse_args()
+
+    fmt = detect_format(args.path, args.format)
+    if args.command == "import":
+        asyncio.run(_run_import(args.path, fmt, args.actor))
+    else:
+        asyncio.run(_run_export(args.path, fmt))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Live booking change feed for GET /bookings/changes (Server-Sent Events).
+
+events.record() hands every logged change to queue_changes(). On Postgres they
+go out with pg_notify in the writer's transaction, so they are delivered only on
+commit, and a listener in each worker passes them to that worker's broker. Other
+databases publish straight to the in-process broker after commit, which covers
+a single worker and the tests. The availability index follows the same broker
+through broker.listeners, so it sees every worker's writes too.
+
+Each stream has a bounded queue. A client that can't keep up doesn't hold back
+writers or other clients: once its queue is full it stops receiving live events,
+and after draining the queue it catches up from booking_events. That is the same
+replay a reconnecting client gets from Last-Event-ID. Event ids come from a
+sequence, so on Postgres a transaction that commits late can carry an id lower
+than one already sent; replay after such a gap can miss it.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Set
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from config import settings
+from models import BookingEvent
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "booking_changes"
+# Postgres rejects NOTIFY payloads from 8000 bytes on
+MAX_PAYLOAD_BYTES = 7900
+REPLAY_PAGE_SIZE = 500
+LISTEN_RETRY_SECONDS = 5
+# How long EventSource waits before reconnecting
+RECONNECT_MS = 3000
+
+def feed_event(row) -> dict:
+    """JSON-ready feed entry for a booking_events row or anything with its columns."""
+    return {
+        "id": row.id,
+        # SQLite hands back naive UTC
+        "ts": row.ts.replace(tzinfo=row.ts.tzinfo or timezone.utc).isoformat(),
+        "booking_id": row.booking_id,
+        "user_id": row.user_id,
+        "actor": row.actor,
+        "action": row.action,
+        "changes": row.changes,
+    }
+
+@dataclass(eq=False)
+class Subscriber:
+    user_id: Optional[int]  # None sees every booking
+    queue: asyncio.Queue
+    # Set when the queue overflowed; the stream then catches up from the table
+    lagging: bool = False
+
+class ChangeBroker:
+    """In-process fan-out to the open change streams."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscriber] = set()
+        # Called with every published batch, e.g. to keep in-process caches current
+        self.listeners: List[Callable[[List[dict]], None]] = []
+
+    def subscribe(self, user_id: Optional[int]) -> Subscriber:
+        subscriber = Subscriber(user_id, asyncio.Queue(self.queue_size))
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, events: List[dict]):
+        for listener in self.listeners:
+            try:
+                listener(events)
+            except Exception:
+                logger.exception("Change feed listener failed")
+        for subscriber in list(self.subscribers):
+            for entry in events:
+                if subscriber.user_id is not None and entry["user_id"] != subscriber.user_id:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(entry)
+                except asyncio.QueueFull:
+                    subscriber.lagging = True
+                    self.unsubscribe(subscriber)
+                    break
+
+broker = ChangeBroker(settings.change_feed_queue_size)
+
+def _payloads(events: List[dict]) -> List[str]:
+    """JSON arrays of events, each small enough for one NOTIFY."""
+    payloads, batch, size = [], [], 2
+    for entry in events:
+        encoded = json.dumps(entry, separators=(",", ":"))
+        if batch and size + len(encoded) + 1 > MAX_PAYLOAD_BYTES:
+            payloads.append("[" + ",".join(batch) + "]")
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append("[" + ",".join(batch) + "]")
+    return payloads
+
+async def queue_changes(db: AsyncSession, events: List[dict]):
+    """Deliver events to the feed when the caller's transaction commits."""
+    if db.get_bind().dialect.name == "postgresql":
+        for payload in _payloads(events):
+            await db.execute(select(func.pg_notify(CHANNEL, payload)))
+        return
+    db.sync_session.info.setdefault("feed_events", []).extend(events)
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    events = session.info.pop("feed_events", None)
+    if events:
+        broker.publish(events)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("feed_events", None)
+
+async def listen(engine: AsyncEngine):
+    """Pass NOTIFYs on CHANNEL to this worker's broker; reconnects until cancelled."""
+    def received(connection, pid, channel, payload):
+        broker.publish(json.loads(payload))
+
+    while True:
+        try:
+            async with engine.connect() as conn:
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.add_listener(CHANNEL, received)
+                logger.info("Listening for booking changes on %s", CHANNEL)
+                try:
+                    # asyncpg delivers notifications from its own reader; just keep the connection open
+                    while not raw.is_closed():
+                        await asyncio.sleep(LISTEN_RETRY_SECONDS)
+                finally:
+                    # The connection goes back to the pool, where it must not keep listening
+                    if not raw.is_closed():
+                        await raw.remove_listener(CHANNEL, received)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Booking change listener failed, retrying: %s", e)
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+def replay_page(user_id: Optional[int], after: int, since: datetime):
+    """One page of replay(): events after the given id and no older than since."""
+    # Bounded by ts so Postgres only looks at recent partitions
+    stmt = select(BookingEvent).where(BookingEvent.id > after, BookingEvent.ts >= since)
+    if user_id is not None:
+        stmt = stmt.where(BookingEvent.user_id == user_id)
+    return stmt.order_by(BookingEvent.id).limit(REPLAY_PAGE_SIZE)
+
+async def replay(session_factory, user_id: Optional[int], after: int) -> AsyncIterator[dict]:
+    """Logged events after the given id, oldest first, within the replay window."""
+    since = datetime.now(timezone.utc) - timedelta(hours=settings.change_feed_replay_hours)
+    while True:
+        async with session_factory() as db:
+            rows = (await db.scalars(replay_page(user_id, after, since))).all()
+        for row in rows:
+            yield feed_event(row)
+        if len(rows) < REPLAY_PAGE_SIZE:
+            return
+        after = rows[-1].id
+
+async def latest_event_id(session_factory, user_id: Optional[int]) -> int:
+    """Id of the newest logged event the stream would see, or 0 when there is none."""
+    stmt = select(func.max(BookingEvent.id))
+    if user_id is not None:
+        stmt = stmt.where(BookingEvent.user_id == user_id)
+    async with session_factory() as db:
+        return await db.scalar(stmt) or 0
+
+def sse(entry: dict) -> str:
+    return f"id: {entry['id']}\nevent: {entry['action']}\ndata: {json.dumps(entry, separators=(',', ':'))}\n\n"
+
+async def stream(session_factory, user_id: Optional[int], last_event_id: Optional[int],
+                 heartbeat: float) -> AsyncIterator[str]:
+    """SSE lines for one client: replay after last_event_id, then live events.
+
+    A client that starts without last_event_id gets only changes made from now on.
+    """
+    yield f"retry: {RECONNECT_MS}\n\n"
+    while True:
+        # Subscribe before replaying so nothing committed in between is lost
+        subscriber = broker.subscribe(user_id)
+        try:
+            replayed: Set[int] = set()
+            if last_event_id is None:
+                # Where this connection starts; newer events are already queued, and
+                # catching up after an overflow replays from here
+                last_event_id = await latest_event_id(session_factory, user_id)
+            else:
+                async for entry in replay(session_factory, user_id, last_event_id):
+                    replayed.add(entry["id"])
+                    last_event_id = entry["id"]
+                    yield sse(entry)
+            while not (subscriber.lagging and subscriber.queue.empty()):
+                try:
+                    entry = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if entry["id"] in replayed:
+                    continue
+                last_event_id = max(entry["id"], last_event_id)
+                yield sse(entry)
+        finally:
+            broker.unsubscribe(subscriber)
+        logger.info("Change feed client fell %d events behind; catching up from the log", broker.queue_size)
@@ -0,0 +1,70 @@
+"""Strong ETags, If-None-Match handling for booking reads and If-Match for writes.
+
+Validators come from values that change whenever the representation does:
+a booking's id and version, or for a page of bookings the row count, the
+highest id, the latest updated_at and the sum of the versions within that page.
+Every write bumps a version, so the sum changes even when two updates share an
+updated_at tick. Handlers compare the
+client's tag using a narrow query first, so an unchanged poll never loads or
+serializes the rows. Writes put the versions an If-Match header names into
+the statement's WHERE clause, so a stale tag matches no row.
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, List, Optional
+from fastapi import Response
+
+# Per-user data: caches may store it but must revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+def _part(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(_part(p) for p in parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when the If-None-Match header lists etag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def booking_etag(booking_id: int, version: int) -> str:
+    # Not hashed, so the version can be read back from If-Match
+    return f'"{booking_id}.{version}"'
+
+def if_match_versions(if_match: Optional[str], booking_id: int) -> Optional[List[int]]:
+    """Versions of the booking an If-Match header accepts, or None when it accepts any.
+
+    If-Match uses strong comparison, so weak tags and tags of other bookings accept nothing.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"':
+            tag_id, _, version = tag[1:-1].partition(".")
+            if tag_id == str(booking_id) and version.isdigit():
+                versions.append(int(version))
+    return versions
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
+
+def rows_version(rows: Iterable) -> tuple:
+    """(count, max id, latest updated_at, version sum) of fetched rows; pagination.page_version computes the same in SQL."""
+    rows = list(rows)
+    updated = [row.updated_at for row in rows if row.updated_at is not None]
+    return (len(rows), max((row.id for row in rows), default=None), max(updated, default=None),
+            sum(row.version for row in rows))
@@ -0,0 +1,120 @@
+"""Booking change events.
+
+Writers call record() in the same transaction as the change, so the log and
+the daily rollups never disagree with the bookings table.
+
+CLI (Postgres):
+    python events.py partitions [--months 3]
+"""
+import argparse
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from availability import naive_utc
+from change_feed import feed_event, queue_changes
+from database import engine
+from models import BookingEvent
+from rollups import apply_changes
+
+EVENT_FIELDS = ("room_type", "check_in", "check_out", "guests", "user_id")
+PARTITION_MONTHS_AHEAD = 3
+
+def _value(value):
+    return naive_utc(value).isoformat() if isinstance(value, datetime) else value
+
+def snapshot(booking, prefix: str = "") -> dict:
+    """Event fields of a Booking or a row that has them (named prefix + field), dates as naive UTC."""
+    values = {field: getattr(booking, prefix + field) for field in EVENT_FIELDS}
+    return {field: naive_utc(v) if isinstance(v, datetime) else v for field, v in values.items()}
+
+def diff(old: Optional[dict], new: Optional[dict]) -> dict:
+    """{field: [old, new]} for fields that changed; either side may be None."""
+    old, new = old or {}, new or {}
+    changes = {}
+    for field in EVENT_FIELDS:
+        before, after = _value(old.get(field)), _value(new.get(field))
+        if before != after:
+            changes[field] = [before, after]
+    return changes
+
+@dataclass
+class Change:
+    booking_id: int
+    actor: str
+    action: str  # create, update, delete
+    old: Optional[dict]  # snapshot() before, None for create
+    new: Optional[dict]  # snapshot() after, None for delete
+
+async def record(db: AsyncSession, changes: Iterable[Change]):
+    """Log changes, fold them into the rollups and queue them for the change feed, in the caller's transaction."""
+    changes = list(changes)
+    if not changes:
+        return
+    events = [
+        {"booking_id": c.booking_id, "user_id": (c.new or c.old)["user_id"], "actor": c.actor,
+         "action": c.action, "changes": diff(c.old, c.new)}
+        for c in changes
+    ]
+    # Unordered RETURNING keeps this one INSERT; rows are matched back to events by booking
+    logged = defaultdict(deque)
+    for row in sorted(await db.execute(
+        insert(BookingEvent).returning(BookingEvent.id, BookingEvent.booking_id, BookingEvent.ts), events
+    ), key=lambda row: row.id):
+        logged[row.booking_id].append(row)
+    await apply_changes(db, changes)
+    feed = []
+    for values in events:
+        row = logged[values["booking_id"]].popleft()
+        feed.append(feed_event(SimpleNamespace(**values, id=row.id, ts=row.ts)))
+    await queue_changes(db, feed)
+
+def _month(day: date, offset: int) -> date:
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+def partition_ddl(start: date, months: int) -> List[str]:
+    """CREATE statements for monthly partitions covering months from start's month on."""
+    statements = []
+    for offset in range(months):
+        lo, hi = _month(start, offset), _month(start, offset + 1)
+        statements.append(
+            f"CREATE TABLE IF NOT EXISTS booking_events_{lo:%Y_%m} PARTITION OF booking_events "
+            f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        )
+    return statements
+
+def ensure_partitions(conn, months: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Create this month's and upcoming partitions on Postgres; returns how many were checked.
+
+    Events outside every partition land in booking_events_default, which then
+    blocks creating the partition for their month, so run this ahead of time.
+    """
+    if conn.dialect.name != "postgresql":
+        return 0
+    partitioned = conn.scalar(text(
+        "SELECT count(*) FROM pg_partitioned_table WHERE partrelid = 'booking_events'::regclass"
+    ))
+    if not partitioned:
+        # Created by create_all rather than the migration
+        return 0
+    statements = partition_ddl(date.today(), months)
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    return len(statements)
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking event log maintenance")
+    parser.add_argument("command", choices=("partitions",))
+    parser.add_argument("--months", type=int, default=PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        checked = ensure_partitions(conn, args.months)
+    print(f"Checked {checked} booking_events partitions")
+
+if __name__ == "__main__":
+    main()
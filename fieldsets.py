@@ -0,0 +1,80 @@
+"""Sparse fieldsets for the list endpoints: ?fields=id,check_in,check_out&include=user.
+
+fields names booking columns, and user.<column> entries narrow the embedded user
+that include=user asks for. Only those columns are selected, and users is joined
+only when the user is included, so narrow requests read and send less. Lists
+answer such requests with plain dicts through FastJSONResponse; a request with
+neither parameter keeps the endpoint's usual response. id is always returned,
+since cursors are built from it.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from fastapi import HTTPException, Query
+from sqlalchemy import select
+from models import Booking, User
+from serialization import BOOKING_COLUMNS
+
+BOOKING_FIELDS = tuple(column.key for column in BOOKING_COLUMNS)
+USER_FIELDS = ("id", "email", "full_name", "role", "created_at")
+USER_PREFIX = "user."
+
+def _split(fields: Optional[str]) -> list:
+    return [name.strip() for name in (fields or "").split(",") if name.strip()]
+
+def _pick(names, allowed: Tuple[str, ...], label: str) -> Tuple[str, ...]:
+    """names in allowed's order plus id, or all of allowed when names is empty."""
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown {label} field(s): {', '.join(unknown)}; choose from {', '.join(allowed)}"
+        )
+    if not names:
+        return allowed
+    return tuple(name for name in allowed if name == "id" or name in names)
+
+@dataclass(frozen=True)
+class BookingFieldset:
+    booking: Tuple[str, ...]
+    user: Optional[Tuple[str, ...]]  # None leaves the user out, and the users join with it
+
+    def key(self) -> tuple:
+        """Stable value for ETags and the like."""
+        return self.booking, self.user
+
+    def select(self, source=Booking, extra=()):
+        """SELECT of the requested columns; extra adds columns the endpoint needs itself (sort key, ETag)."""
+        names = self.booking + tuple(column.key for column in extra if column.key not in self.booking)
+        stmt = select(*(getattr(source, name) for name in names))
+        if self.user is not None:
+            # Labelled so they don't clash with the booking columns of the same name
+            stmt = stmt.add_columns(*(getattr(User, name).label("user__" + name) for name in self.user))
+            stmt = stmt.join(User, source.user_id == User.id)
+        return stmt
+
+    def to_dict(self, row) -> dict:
+        item = {name: getattr(row, name) for name in self.booking}
+        if self.user is not None:
+            item["user"] = {name: getattr(row, "user__" + name) for name in self.user}
+        return item
+
+def booking_fieldset(
+    fields: Optional[str] = Query(None, max_length=500),
+    include: Optional[str] = Query(None, pattern="^user$")
+) -> Optional[BookingFieldset]:
+    """Query parameters shared by the booking lists; None when the request gives neither."""
+    if fields is None and include is None:
+        return None
+    names = _split(fields)
+    user_names = [name[len(USER_PREFIX):] for name in names if name.startswith(USER_PREFIX)]
+    if user_names and include != "user":
+        raise HTTPException(status_code=400, detail="'user.' fields need include=user")
+    booking = _pick([name for name in names if not name.startswith(USER_PREFIX)], BOOKING_FIELDS, "booking")
+    user = _pick(user_names, USER_FIELDS, "user") if include == "user" else None
+    return BookingFieldset(booking, user)
+
+def user_fieldset(fields: Optional[str] = Query(None, max_length=500)) -> Optional[Tuple[str, ...]]:
+    """fields for the user lists; None when not given."""
+    if fields is None:
+        return None
+    return _pick(_split(fields), USER_FIELDS, "user")
@@ -0,0 +1,85 @@
+"""Filters and sort orders for the booking list endpoints.
+
+Every filter maps to an indexed predicate: check_in ranges use
+ix_bookings_check_in_id (or the room type index when room_type is given),
+and the user searches compile to ILIKE on email / full_name, which
+Postgres answers from the trigram indexes on those columns. The user searches run as a
+subquery on users, so lists that don't join users can use them as well.
+Filters and sorts name columns of a source, Booking or archive.ALL_BOOKINGS.
+"""
+from dataclasses import astuple, dataclass
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Query
+from sqlalchemy import select
+from availability import naive_utc
+from models import Booking, User
+
+# sort parameter -> (keyset sort column name, descending); None sorts by id alone
+SORTS = {
+    "id": (None, False),
+    "-id": (None, True),
+    "check_in": ("check_in", False),
+    "-check_in": ("check_in", True),
+}
+SORT_PATTERN = "^(" + "|".join(key.replace("-", "\\-") for key in SORTS) + ")$"
+# Shorter search terms can't use trigrams and would scan every user
+MIN_SEARCH_LENGTH = 3
+
+@dataclass(frozen=True)
+class BookingFilters:
+    check_in_from: Optional[datetime] = None
+    check_in_to: Optional[datetime] = None
+    room_type: Optional[str] = None
+    min_guests: Optional[int] = None
+    user_email: Optional[str] = None  # prefix, case-insensitive
+    full_name: Optional[str] = None  # substring, case-insensitive
+
+    def key(self) -> tuple:
+        """Stable value for ETags and the like."""
+        return astuple(self)
+
+    def apply(self, stmt, users_joined: bool = False, source=Booking):
+        if self.check_in_from is not None:
+            stmt = stmt.where(source.check_in >= self.check_in_from)
+        if self.check_in_to is not None:
+            stmt = stmt.where(source.check_in < self.check_in_to)
+        if self.room_type is not None:
+            stmt = stmt.where(source.room_type == self.room_type)
+        if self.min_guests is not None:
+            stmt = stmt.where(source.guests >= self.min_guests)
+
+        user_conditions = []
+        if self.user_email is not None:
+            user_conditions.append(User.email.istartswith(self.user_email, autoescape=True))
+        if self.full_name is not None:
+            user_conditions.append(User.full_name.icontains(self.full_name, autoescape=True))
+        if user_conditions:
+            if users_joined:
+                stmt = stmt.where(*user_conditions)
+            else:
+                stmt = stmt.where(source.user_id.in_(select(User.id).where(*user_conditions)))
+        return stmt
+
+def sort_order(sort: str, source=Booking) -> tuple:
+    """(keyset sort column of source or None, descending) for a sort parameter."""
+    name, descending = SORTS[sort]
+    return (getattr(source, name) if name is not None else None), descending
+
+def booking_filters(
+    check_in_from: Optional[datetime] = None,
+    check_in_to: Optional[datetime] = None,
+    room_type: Optional[str] = None,
+    min_guests: Optional[int] = Query(None, ge=1),
+    user_email: Optional[str] = Query(None, max_length=255),
+    full_name: Optional[str] = Query(None, max_length=255)
+) -> BookingFilters:
+    """Query parameters shared by the booking lists; check_in bounds are [from, to) in UTC."""
+    check_in_from = naive_utc(check_in_from) if check_in_from is not None else None
+    check_in_to = naive_utc(check_in_to) if check_in_to is not None else None
+    if check_in_from is not None and check_in_to is not None and check_in_to <= check_in_from:
+        raise HTTPException(status_code=400, detail="'check_in_to' must be after 'check_in_from'")
+    for name, term in (("user_email", user_email), ("full_name", full_name)):
+        if term is not None and len(term) < MIN_SEARCH_LENGTH:
+            raise HTTPException(status_code=400, detail=f"'{name}' needs at least {MIN_SEARCH_LENGTH} characters")
+    return BookingFilters(check_in_from, check_in_to, room_type, min_guests, user_email, full_name)
@@ -1,23 +1,106 @@
-from fastapi import FastAPI
-from database import engine
+from boot import boot
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+boot.mark("fastapi")
+from archive import archive_periodically
+from availability import availability_index, follow_changes, refresh_periodically
+from change_feed import broker, listen as listen_for_changes
+from config import settings
+from database import async_engine, engine, AsyncSessionLocal
+from events import ensure_partitions
+from hashing import hasher
+from metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, render
+from otp_store import sweep_periodically
+from outbox import start_workers
+from purge import run_worker as run_purge_worker
+from replicas import replica_set
+from warmup import warm_pool
 import models
 from routers import auth, users, bookings, otp
+boot.mark("app modules")
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+background_tasks = []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.db_startup_ddl:
+        with boot.step("schema"):
+            async with async_engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+                # Keep upcoming booking_events partitions ahead of the clock
+                await conn.run_sync(ensure_partitions)
+    if replica_set.replicas:
+        with boot.step("replica checks"):
+            # Reads stay on the primary until a replica passes its first check
+            await replica_set.check_all()
+        background_tasks.append(asyncio.create_task(replica_set.check_periodically(settings.replica_check_seconds)))
+    with boot.step("pool warmup"):
+        await asyncio.gather(warm_pool(async_engine, settings.db_pool_warmup), replica_set.warm(settings.db_pool_warmup))
+    with boot.step("availability index"):
+        # Following first, so changes committed during the load still reach the index
+        apply_booking_changes = follow_changes(AsyncSessionLocal)
+        broker.listeners.append(apply_booking_changes)
+        async with AsyncSessionLocal() as db:
+            await availability_index.load(db)
+    if settings.availability_refresh_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            refresh_periodically(AsyncSessionLocal, settings.availability_refresh_seconds)
+        ))
+    if settings.otp_backend == "sql" and settings.otp_sweep_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            sweep_periodically(AsyncSessionLocal, settings.otp_sweep_seconds)
+        ))
+    if settings.booking_archive_after_days > 0 and settings.booking_archive_interval_seconds > 0:
+        background_tasks.append(asyncio.create_task(
+            archive_periodically(AsyncSessionLocal, settings.booking_archive_interval_seconds)
+        ))
+    background_tasks.extend(start_workers(AsyncSessionLocal))
+    if async_engine.dialect.name == "postgresql":
+        # Change feed events from every worker arrive by NOTIFY
+        background_tasks.append(asyncio.create_task(listen_for_changes(async_engine)))
+    background_tasks.append(asyncio.create_task(
+        run_purge_worker(AsyncSessionLocal, settings.account_purge_chunk_size, settings.account_purge_poll_seconds)
+    ))
+    boot.ready()
+
+    yield
+
+    broker.listeners.remove(apply_booking_changes)
+    for task in background_tasks:
+        task.cancel()
+    # Let workers unwind before their connections are closed
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await async_engine.dispose()
+    await replica_set.dispose()
+    hasher.shutdown()
 
 app = FastAPI(
     title="Booking Platform API",
     description="A booking platform with role-based authentication and OTP for account deletion",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per-route latency, SQL and pool metrics on /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+for replica in replica_set.replicas:
+    instrument_engine(replica.engine.sync_engine, replica.name)
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router,prefix="/auth", tags=["authentication"])
 app.include_router(users.router,prefix="/users", tags=["users"])
 app.include_router(bookings.router,prefix="/bookings", tags=["bookings"])
 app.include_router(otp.router,prefix="/otp", tags=["otp-verification"])  # Add OTP router
+boot.mark("app setup")
 
 @app.get("/")
 def root():
-    return {"message": "Booking Platform API with OTP Security"}
\ No newline at end of file
+    return {"message": "Booking Platform API with OTP Security"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
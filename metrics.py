@@ -0,0 +1,253 @@
+"""Prometheus metrics for requests, SQL, connection pools and password hashing.
+
+Rendered in the Prometheus text format on /metrics without a client library.
+Per-request query counts and SQL time are attributed through a contextvar that
+MetricsMiddleware sets, so statements from background tasks aren't charged to
+a request.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+# Statements kept per request for the slow-request log and query budgets
+MAX_LOGGED_STATEMENTS = 200
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, object] = {}
+        registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Per-bucket counts, then sum and count
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+registry: List[Metric] = []
+# Called before rendering to refresh gauges that are cheaper to read than to track
+collectors: List[Callable[[], None]] = []
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+REQUEST_QUERIES = Histogram("http_request_queries", "SQL statements per request", ("method", "route"), buckets=QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram("http_request_sql_seconds", "Time spent in SQL per request", ("method", "route"))
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement latency", ("engine",))
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool", ("engine",))
+POOL_SATURATED_CHECKOUTS = Counter(
+    "db_pool_saturated_checkouts_total", "Checkouts made while every pooled connection was busy", ("engine",)
+)
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out", ("engine",))
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", ("engine",))
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size", ("engine",))
+READ_SESSIONS = Counter("db_read_sessions_total", "Read-only request sessions by where they were routed", ("target",))
+REPLICA_HEALTHY = Gauge("db_replica_healthy", "1 while a read replica passes its health check", ("replica",))
+REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "Replication lag seen by the last health check", ("replica",))
+ACCOUNT_PURGE_BOOKINGS = Counter("account_purge_bookings_total", "Bookings deleted by background account purges")
+NOTIFICATIONS_FAILED = Counter("notifications_failed_total", "Notifications given up on after OUTBOX_MAX_ATTEMPTS attempts")
+NOTIFICATIONS_FAILED_PURGED = Counter("notifications_failed_purged_total", "Failed notifications deleted after their retention")
+BOOKINGS_ARCHIVED = Counter("bookings_archived_total", "Bookings moved to bookings_archive")
+BOOKING_ARCHIVE_ROWS_PER_SECOND = Gauge("booking_archive_rows_per_second", "Move throughput of the last archive run")
+BOOKING_TABLE_ROWS = Gauge("booking_table_rows", "Rows in bookings and bookings_archive (an estimate on Postgres)", ("table",))
+BOOKING_TABLE_BYTES = Gauge("booking_table_bytes", "Size on disk including indexes, Postgres only", ("table",))
+HASH_SECONDS = Histogram("password_hash_duration_seconds", "bcrypt time including queueing", ("operation",),
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+HASH_PENDING = Gauge("password_hash_pending", "bcrypt jobs queued or running")
+HASH_REJECTED = Counter("password_hash_rejected_total", "bcrypt jobs refused because the queue was full")
+
+def render() -> str:
+    for collect in collectors:
+        collect()
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    sql_seconds: float = 0.0
+    statements: List[Tuple[float, str]] = field(default_factory=list)
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+# Called with (method, route, status, stats) after each request, e.g. by query_budget
+request_observers: List[Callable[[str, str, int, RequestStats], None]] = []
+
+def _keep_statements() -> bool:
+    return bool(settings.slow_request_ms or request_observers)
+
+def instrument_engine(engine, name: str):
+    """Time every statement and track pool usage for a sync Engine (use .sync_engine for async)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        QUERY_SECONDS.observe(elapsed, engine=name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+            if _keep_statements() and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+                stats.statements.append((elapsed, statement))
+
+    pool = engine.pool
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc(engine=name)
+        size = pool.size() if hasattr(pool, "size") else 0
+        if size and pool.checkedout() > size:
+            POOL_SATURATED_CHECKOUTS.inc(engine=name)
+
+    def collect():
+        if hasattr(pool, "checkedout"):
+            POOL_CHECKED_OUT.set(pool.checkedout(), engine=name)
+        if hasattr(pool, "size"):
+            POOL_SIZE.set(pool.size(), engine=name)
+            POOL_OVERFLOW.set(max(pool.overflow(), 0), engine=name)
+
+    collectors.append(collect)
+
+def _log_slow_request(method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+    slowest = sorted(stats.statements, reverse=True)[:10]
+    logger.warning(
+        "Slow request %s %s -> %d took %.0f ms, %d queries, %.0f ms in SQL%s",
+        method, route, status, elapsed * 1000, stats.queries, stats.sql_seconds * 1000,
+        "".join(f"\n  {seconds * 1000:8.1f} ms  {' '.join(sql.split())[:500]}" for seconds, sql in slowest)
+    )
+
+def route_template(scope) -> str:
+    """Path template of the matched route, including the prefix it was mounted under."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # FastAPI puts the router-relative route in the scope; the mount prefix lives on the include
+    included = scope.get("fastapi", {}).get("included_router")
+    prefix = getattr(getattr(included, "include_context", None), "prefix", "")
+    return prefix + getattr(route, "path", "")
+
+class MetricsMiddleware:
+    """Records latency, statement count and SQL time for each HTTP request, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Includes streaming the body
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            # Templates, not raw paths, so ids don't explode label cardinality
+            path = route_template(scope)
+            method = scope["method"]
+            REQUEST_SECONDS.observe(elapsed, method=method, route=path, status=status)
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=path)
+            REQUEST_SQL_SECONDS.observe(stats.sql_seconds, method=method, route=path)
+            if settings.slow_request_ms and elapsed * 1000 >= settings.slow_request_ms:
+                _log_slow_request(method, path, status, elapsed, stats)
+            for observer in request_observers:
+                observer(method, path, status, stats)
@@ -0,0 +1,34 @@
+"""Indexes for the router queries
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index("ix_bookings_user_id_id", "bookings", ["user_id", "id"])
+    op.create_index("ix_bookings_room_type_check_in_check_out", "bookings", ["room_type", "check_in", "check_out"])
+    op.create_index("ix_bookings_check_out", "bookings", ["check_out"])
+    op.create_index(
+        "ix_bookings_updated_id",
+        "bookings",
+        ["id"],
+        postgresql_where=sa.text("updated_by IS NOT NULL"),
+        sqlite_where=sa.text("updated_by IS NOT NULL"),
+    )
+    op.create_index("ix_otp_requests_user_action_used", "otp_requests", ["user_id", "action_type", "is_used"])
+
+def downgrade() -> None:
+    op.drop_index("ix_otp_requests_user_action_used", table_name="otp_requests")
+    op.drop_index("ix_bookings_updated_id", table_name="bookings")
+    op.drop_index("ix_bookings_check_out", table_name="bookings")
+    op.drop_index("ix_bookings_room_type_check_in_check_out", table_name="bookings")
+    op.drop_index("ix_bookings_user_id_id", table_name="bookings")
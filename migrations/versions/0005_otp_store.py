@@ -0,0 +1,32 @@
+"""One active OTP per user and action, with an attempt counter
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Keep only the newest OTP for each user and action before enforcing uniqueness
+    op.execute(
+        "DELETE FROM otp_requests WHERE id NOT IN "
+        "(SELECT max(id) FROM otp_requests GROUP BY user_id, action_type)"
+    )
+    op.add_column("otp_requests", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.drop_index("ix_otp_requests_user_action_used", table_name="otp_requests")
+    op.create_index("ux_otp_requests_user_action", "otp_requests", ["user_id", "action_type"], unique=True)
+    op.create_index("ix_otp_requests_expires_at", "otp_requests", ["expires_at"])
+
+def downgrade() -> None:
+    op.drop_index("ix_otp_requests_expires_at", table_name="otp_requests")
+    op.drop_index("ux_otp_requests_user_action", table_name="otp_requests")
+    op.create_index("ix_otp_requests_user_action_used", "otp_requests", ["user_id", "action_type", "is_used"])
+    with op.batch_alter_table("otp_requests") as batch_op:
+        batch_op.drop_column("attempts")
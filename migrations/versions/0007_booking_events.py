@@ -0,0 +1,63 @@
+"""Append-only booking event log, partitioned by month on Postgres
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def _month(day: date, offset: int) -> date:
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+def upgrade() -> None:
+    postgres = op.get_context().dialect.name == "postgresql"
+    op.create_table(
+        "booking_events",
+        sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), nullable=False, autoincrement=True),
+        sa.Column("ts", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("booking_id", sa.Integer(), nullable=False),
+        sa.Column("actor", sa.String(length=255), nullable=False),
+        sa.Column("action", sa.String(length=20), nullable=False),
+        sa.Column("changes", sa.JSON(), nullable=False),
+        # A partitioned table's primary key has to include the partition column
+        sa.PrimaryKeyConstraint(*(("id", "ts") if postgres else ("id",))),
+        postgresql_partition_by="RANGE (ts)",
+    )
+    if postgres:
+        op.execute("CREATE TABLE booking_events_default PARTITION OF booking_events DEFAULT")
+        today = date.today()
+        for offset in range(-1, 3):
+            lo, hi = _month(today, offset), _month(today, offset + 1)
+            op.execute(
+                f"CREATE TABLE booking_events_{lo:%Y_%m} PARTITION OF booking_events "
+                f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+            )
+    op.create_index("ix_booking_events_actor_ts", "booking_events", ["actor", "ts"])
+    op.create_index("ix_booking_events_booking_id_ts", "booking_events", ["booking_id", "ts"])
+    op.create_index("ix_booking_events_ts_id", "booking_events", ["ts", "id"])
+
+    # Activity now comes from booking_events
+    op.drop_index("ix_bookings_updated_id", table_name="bookings")
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_bookings_updated_id",
+        "bookings",
+        ["id"],
+        postgresql_where=sa.text("updated_by IS NOT NULL"),
+        sqlite_where=sa.text("updated_by IS NOT NULL"),
+    )
+    op.drop_index("ix_booking_events_ts_id", table_name="booking_events")
+    op.drop_index("ix_booking_events_booking_id_ts", table_name="booking_events")
+    op.drop_index("ix_booking_events_actor_ts", table_name="booking_events")
+    # Drops the partitions with it
+    op.drop_table("booking_events")
@@ -0,0 +1,49 @@
+"""Per room type, per day booking rollups
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "booking_daily_stats",
+        sa.Column("room_type", sa.String(length=100), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("bookings", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("guests", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("room_type", "day"),
+    )
+    op.create_index("ix_booking_daily_stats_day", "booking_daily_stats", ["day"])
+
+    # Backfill with the same night counting as rollups.stay_days
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("""
+            INSERT INTO booking_daily_stats (room_type, day, bookings, guests)
+            SELECT room_type, night::date, count(*), sum(guests)
+            FROM bookings,
+                 generate_series(check_in::date, greatest(check_out::date - 1, check_in::date), interval '1 day') AS night
+            GROUP BY room_type, night::date
+        """)
+    else:
+        op.execute("""
+            INSERT INTO booking_daily_stats (room_type, day, bookings, guests)
+            WITH RECURSIVE nights(room_type, day, last, guests) AS (
+                SELECT room_type, date(check_in), max(date(check_out, '-1 day'), date(check_in)), guests FROM bookings
+                UNION ALL
+                SELECT room_type, date(day, '+1 day'), last, guests FROM nights WHERE day < last
+            )
+            SELECT room_type, day, count(*), sum(guests) FROM nights GROUP BY room_type, day
+        """)
+
+def downgrade() -> None:
+    op.drop_index("ix_booking_daily_stats_day", table_name="booking_daily_stats")
+    op.drop_table("booking_daily_stats")
@@ -0,0 +1,40 @@
+"""Disabled accounts and background account purges
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("disabled_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_table(
+        "account_purges",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(length=255), nullable=False),
+        sa.Column("bookings_total", sa.Integer(), nullable=False),
+        sa.Column("bookings_deleted", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("started_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(
+        "ix_account_purges_pending",
+        "account_purges",
+        ["user_id"],
+        postgresql_where=sa.text("finished_at IS NULL"),
+        sqlite_where=sa.text("finished_at IS NULL"),
+    )
+
+def downgrade() -> None:
+    op.drop_index("ix_account_purges_pending", table_name="account_purges")
+    op.drop_table("account_purges")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("disabled_at")
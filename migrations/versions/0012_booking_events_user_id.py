@@ -0,0 +1,24 @@
+"""Add booking_events.user_id for the per-user change feed
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Older events keep NULL; the feed only replays recent ones
+    op.add_column("booking_events", sa.Column("user_id", sa.Integer(), nullable=True))
+    op.create_index("ix_booking_events_user_id_id", "booking_events", ["user_id", "id"])
+
+def downgrade() -> None:
+    op.drop_index("ix_booking_events_user_id_id", table_name="booking_events")
+    with op.batch_alter_table("booking_events") as batch_op:
+        batch_op.drop_column("user_id")
@@ -0,0 +1,39 @@
+"""Archive table for bookings that ended long ago
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "bookings_archive",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("room_type", sa.String(length=100), nullable=False),
+        sa.Column("check_in", sa.DateTime(), nullable=False),
+        sa.Column("check_out", sa.DateTime(), nullable=False),
+        sa.Column("guests", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_by", sa.String(length=50), nullable=True),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_bookings_archive_user_id_id", "bookings_archive", ["user_id", "id"])
+    op.create_index("ix_bookings_archive_check_in_id", "bookings_archive", ["check_in", "id"])
+
+def downgrade() -> None:
+    op.drop_index("ix_bookings_archive_check_in_id", table_name="bookings_archive")
+    op.drop_index("ix_bookings_archive_user_id_id", table_name="bookings_archive")
+    op.drop_table("bookings_archive")
@@ -0,0 +1,32 @@
+"""Trigram indexes on the user columns the ILIKE search reads
+
+The 0009 indexes were on lower(email) / lower(full_name), which the planner
+can't use for ILIKE on the columns themselves.
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+revision = "0014"
+down_revision = "0013"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX ix_users_full_name_trgm")
+    op.execute("DROP INDEX ix_users_email_trgm")
+    op.execute("CREATE INDEX ix_users_email_trgm ON users USING gin (email gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_users_full_name_trgm ON users USING gin (full_name gin_trgm_ops)")
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX ix_users_full_name_trgm")
+    op.execute("DROP INDEX ix_users_email_trgm")
+    op.execute("CREATE INDEX ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_users_full_name_trgm ON users USING gin (lower(full_name) gin_trgm_ops)")
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from datetime import datetime, timezone
+from sqlalchemy import JSON, BigInteger, Column, Date, Integer, String, Text, DateTime, ForeignKey, Boolean, DDL, Index, event, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -11,11 +13,27 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(255), nullable=False)
     role = Column(String(50), default="user")  # user, admin, superadmin
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # bump to revoke issued tokens
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    disabled_at = Column(DateTime(timezone=True))  # set while the account is being purged
     
     # When user is deleted, all their bookings are also deleted (CASCADE)
-    bookings = relationship("Booking", back_populates="user", cascade="all, delete-orphan")
-    otp_requests = relationship("OTPRequest", back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes leaves that to the database instead of loading every child row
+    bookings = relationship("Booking", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    otp_requests = relationship("OTPRequest", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        # Postgres only: trigram indexes for the adminview user_email / full_name search;
+        # pg_trgm answers ILIKE on the column itself, which is what the filters compile to there
+        Index(
+            "ix_users_email_trgm", email,
+            postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_users_full_name_trgm", full_name,
+            postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -27,10 +45,102 @@ class Booking(Base):
     guests = Column(Integer, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set in Python so SQLite keeps sub-second precision; ETags are derived from it
+    updated_at = Column(DateTime(timezone=True), onupdate=lambda: datetime.now(timezone.utc))
     updated_by = Column(String(50))
+    # Bumped by every update; If-Match on writes is checked against it
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     user = relationship("User", back_populates="bookings")
+    
+    __table_args__ = (
+        # Postgres only: no two stays of the same room type may overlap
+        ExcludeConstraint(
+            ("room_type", "="),
+            (func.tsrange(check_in, check_out), "&&"),
+            name="bookings_no_overlap",
+            using="gist"
+        ).ddl_if(dialect="postgresql"),
+        # my-bookings pages for one user, and the user delete cascade
+        Index("ix_bookings_user_id_id", "user_id", "id"),
+        # Overlap checks in ensure_available
+        Index("ix_bookings_room_type_check_in_check_out", "room_type", "check_in", "check_out"),
+        # Availability index load (current and upcoming stays)
+        Index("ix_bookings_check_out", "check_out"),
+        # List filters and sort on check_in, with id as the keyset tiebreak
+        Index("ix_bookings_check_in_id", "check_in", "id"),
+    )
+
+class BookingArchive(Base):
+    """Bookings that ended more than BOOKING_ARCHIVE_AFTER_DAYS ago, moved out of bookings by archive.py.
+
+    Same columns as bookings, ids included, so reads can union the two tables.
+    """
+    __tablename__ = "bookings_archive"
+    
+    id = Column(Integer, primary_key=True)
+    room_type = Column(String(100), nullable=False)
+    check_in = Column(DateTime, nullable=False)
+    check_out = Column(DateTime, nullable=False)
+    guests = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    updated_by = Column(String(50))
+    version = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    
+    __table_args__ = (
+        # my-bookings with include_archived, and the user delete cascade
+        Index("ix_bookings_archive_user_id_id", "user_id", "id"),
+        # check_in filters and sort with include_archived
+        Index("ix_bookings_archive_check_in_id", "check_in", "id"),
+    )
+
+class BookingEvent(Base):
+    """Append-only log of booking changes.
+
+    On Postgres migration 0007 range-partitions it by month on ts, which makes
+    the primary key (id, ts) there. No foreign key, so events outlive their booking.
+    """
+    __tablename__ = "booking_events"
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    # Set by the app so every writer stores the same format; SQLite's CURRENT_TIMESTAMP drops microseconds
+    ts = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc), server_default=func.now())
+    booking_id = Column(Integer, nullable=False)
+    user_id = Column(Integer)  # booking owner, for the per-user change feed
+    actor = Column(String(255), nullable=False)  # email of the user who made the change
+    action = Column(String(20), nullable=False)  # create, update, delete
+    changes = Column(JSON, nullable=False)  # {field: [old, new]}
+    
+    __table_args__ = (
+        # Activity pages filtered by who made the change
+        Index("ix_booking_events_actor_ts", "actor", "ts"),
+        # History of one booking
+        Index("ix_booking_events_booking_id_ts", "booking_id", "ts"),
+        # Unfiltered activity pages over a time range
+        Index("ix_booking_events_ts_id", "ts", "id"),
+        # Change feed replay for one user
+        Index("ix_booking_events_user_id_id", "user_id", "id"),
+    )
+
+class BookingDailyStats(Base):
+    """Per room type and day: bookings occupying the night starting that day, and their guests.
+
+    Maintained incrementally by events.record(); `python rollups.py rebuild` recomputes it.
+    """
+    __tablename__ = "booking_daily_stats"
+    
+    room_type = Column(String(100), primary_key=True)
+    day = Column(Date, primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0, server_default="0")
+    guests = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    __table_args__ = (
+        # Stats across all room types for a date range
+        Index("ix_booking_daily_stats_day", "day"),
+    )
 
 class OTPRequest(Base):
     __tablename__ = "otp_requests"
@@ -39,8 +149,75 @@ class OTPRequest(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     otp_code = Column(String(6), nullable=False)
     action_type = Column(String(20), nullable=False)  # delete_account
-    is_used = Column(Boolean, default=False)
+    is_used = Column(Boolean, default=False)  # set once verified
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    user = relationship("User", back_populates="otp_requests")
\ No newline at end of file
+    user = relationship("User", back_populates="otp_requests")
+    
+    __table_args__ = (
+        # One active OTP per user and action; every OTP lookup goes through it
+        Index("ux_otp_requests_user_action", "user_id", "action_type", unique=True),
+        # Expiry sweeper
+        Index("ix_otp_requests_expires_at", "expires_at"),
+    )
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # otp
+    recipient = Column(String(255), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    dedupe_key = Column(String(255), unique=True, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")  # pending, failed
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        # Workers claim due rows in id order
+        Index(
+            "ix_notification_outbox_due",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'")
+        ),
+    )
+
+class AccountPurge(Base):
+    """Background deletion of an account too large to delete in the request; outlives the user row."""
+    __tablename__ = "account_purges"
+    
+    user_id = Column(Integer, primary_key=True)
+    email = Column(String(255), nullable=False)
+    bookings_total = Column(Integer, nullable=False)
+    bookings_deleted = Column(Integer, nullable=False, default=0, server_default="0")
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        # Workers pick up unfinished purges
+        Index(
+            "ix_account_purges_pending",
+            "user_id",
+            postgresql_where=text("finished_at IS NULL"),
+            sqlite_where=text("finished_at IS NULL")
+        ),
+    )
+
+# The exclusion constraint needs gist support for plain equality on room_type
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+# Trigram operator classes for the user search indexes
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
@@ -0,0 +1,327 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import OTPRequest
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class IssuedOTP:
+    otp_id: int
+    code: str
+    expires_at: datetime
+
+def generate_code() -> str:
+    return str(secrets.randbelow(1000000)).zfill(6)
+
+def codes_match(expected: str, given: str) -> bool:
+    # Constant time, so response timing doesn't leak matching digits
+    return hmac.compare_digest(expected.encode(), given.encode())
+
+def invalid_otp():
+    return HTTPException(status_code=404, detail="Invalid OTP")
+
+def expired_otp():
+    return HTTPException(status_code=400, detail="OTP has expired")
+
+def too_many_attempts():
+    return HTTPException(status_code=429, detail="Too many attempts, request a new OTP")
+
+class OTPStore(ABC):
+    """One active OTP per (user, action): issue replaces, verify marks verified, consume removes.
+
+    The db session is only used by the SQL backend. Except for verify, which must record
+    every attempt, SQL methods run in the caller's transaction and leave committing to it.
+    """
+
+    @abstractmethod
+    async def issue(self, db: AsyncSession, user_id: int, action_type: str) -> IssuedOTP:
+        ...
+
+    @abstractmethod
+    async def verify(self, db: AsyncSession, user_id: int, action_type: str, code: str):
+        ...
+
+    @abstractmethod
+    async def consume_verified(self, db: AsyncSession, user_id: int, action_type: str) -> bool:
+        ...
+
+    async def sweep(self, db: AsyncSession) -> int:
+        # TTL backends expire entries on their own
+        return 0
+
+class SQLOTPStore(OTPStore):
+    """otp_requests table, unique on (user_id, action_type); expired rows are swept periodically."""
+
+    def _upsert(self, db: AsyncSession):
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            return postgresql.insert
+        if dialect == "sqlite":
+            return sqlite.insert
+        raise RuntimeError(f"SQL OTP store does not support {dialect}")
+
+    async def issue(self, db, user_id, action_type):
+        code = generate_code()
+        expires_at = datetime.utcnow() + timedelta(seconds=settings.otp_ttl_seconds)
+        stmt = self._upsert(db)(OTPRequest).values(
+            user_id=user_id, action_type=action_type, otp_code=code,
+            is_used=False, attempts=0, expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OTPRequest.user_id, OTPRequest.action_type],
+            set_={"otp_code": code, "is_used": False, "attempts": 0, "expires_at": expires_at}
+        ).returning(OTPRequest.id)
+        otp_id = await db.scalar(stmt)
+        return IssuedOTP(otp_id=otp_id, code=code, expires_at=expires_at)
+
+    @staticmethod
+    def pending(user_id: int, action_type: str) -> tuple:
+        return (
+            OTPRequest.user_id == user_id,
+            OTPRequest.action_type == action_type,
+            OTPRequest.is_used == False
+        )
+
+    @classmethod
+    def take_attempt(cls, user_id: int, action_type: str):
+        """The UPDATE ... RETURNING verify starts with: reads the pending OTP and counts the guess."""
+        return (
+            update(OTPRequest)
+            .where(*cls.pending(user_id, action_type), OTPRequest.attempts < settings.otp_max_attempts)
+            .values(attempts=OTPRequest.attempts + 1)
+            .returning(OTPRequest.id, OTPRequest.otp_code, OTPRequest.expires_at)
+        )
+
+    @staticmethod
+    def verified(user_id: int, action_type: str, verified_after: datetime):
+        return delete(OTPRequest).where(
+            OTPRequest.user_id == user_id,
+            OTPRequest.action_type == action_type,
+            OTPRequest.is_used == True,
+            OTPRequest.expires_at > verified_after
+        ).returning(OTPRequest.id)
+
+    @staticmethod
+    def expired(now: datetime):
+        """Pending OTPs past expiry and verified ones nobody consumed."""
+        return delete(OTPRequest).where(or_(
+            and_(OTPRequest.is_used == False, OTPRequest.expires_at < now),
+            OTPRequest.expires_at < now - timedelta(seconds=settings.otp_verified_ttl_seconds)
+        ))
+
+    async def verify(self, db, user_id, action_type, code):
+        # Every guess takes an attempt in the same statement that reads the OTP, before
+        # the code is compared, so concurrent guesses can't get past the cap
+        otp = (await db.execute(self.take_attempt(user_id, action_type))).first()
+        await db.commit()
+        if otp is None:
+            # Only failures pay for finding out why
+            if await db.scalar(select(OTPRequest.id).where(*self.pending(user_id, action_type))) is None:
+                raise invalid_otp()
+            raise too_many_attempts()
+        if datetime.utcnow() > otp.expires_at:
+            raise expired_otp()
+        if not codes_match(otp.otp_code, code):
+            raise invalid_otp()
+
+        used = await db.scalar(
+            update(OTPRequest).where(OTPRequest.id == otp.id, OTPRequest.is_used == False)
+            .values(is_used=True).returning(OTPRequest.id)
+        )
+        await db.commit()
+        if used is None:
+            # A concurrent request verified it first
+            raise invalid_otp()
+
+    async def consume_verified(self, db, user_id, action_type):
+        verified_after = datetime.utcnow() - timedelta(seconds=settings.otp_verified_ttl_seconds)
+        consumed = await db.scalar(self.verified(user_id, action_type, verified_after))
+        return consumed is not None
+
+    async def sweep(self, db: AsyncSession) -> int:
+        result = await db.execute(self.expired(datetime.utcnow()))
+        await db.commit()
+        return result.rowcount
+
+# Verify's two steps as Lua, so each runs atomically on the server, like the SQL store's
+# UPDATE ... RETURNING statements. The code itself is compared in Python, in constant time.
+# KEYS: OTP, attempt counter; ARGV: max attempts. Returns the OTP's JSON, 0 when out of
+# attempts, or nil when there is no unverified OTP.
+TAKE_ATTEMPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw or cjson.decode(raw)['verified'] then
+    return false
+end
+if redis.call('INCR', KEYS[2]) > tonumber(ARGV[1]) then
+    return 0
+end
+return raw
+"""
+# KEYS: OTP; ARGV: OTP id, TTL in seconds. Returns 1, or 0 when that OTP is gone or already verified.
+MARK_VERIFIED = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local otp = cjson.decode(raw)
+if otp['verified'] or otp['id'] ~= tonumber(ARGV[1]) then
+    return 0
+end
+otp['verified'] = true
+redis.call('SET', KEYS[1], cjson.encode(otp), 'EX', ARGV[2])
+return 1
+"""
+
+class LocalRedis:
+    """In-process stand-in for the subset of redis.asyncio.Redis the OTP store uses.
+
+    eval runs Python twins of the store's Lua scripts; they don't await, so nothing
+    else runs in between, which makes them as atomic as the scripts are in Redis.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key, value, ex=None, keepttl=False):
+        entry = self._live(key)
+        if keepttl and entry:
+            expires_at = entry[1]
+        else:
+            expires_at = time.monotonic() + ex if ex else None
+        self._data[key] = (value, expires_at)
+        return True
+
+    async def delete(self, key):
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    async def incr(self, key):
+        return self._incr(key)
+
+    def _incr(self, key):
+        entry = self._live(key)
+        value = int(entry[0]) + 1 if entry else 1
+        self._data[key] = (str(value), entry[1] if entry else None)
+        return value
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if script == TAKE_ATTEMPT:
+            entry = self._live(keys[0])
+            if entry is None or json.loads(entry[0])["verified"]:
+                return None
+            if self._incr(keys[1]) > int(args[0]):
+                return 0
+            return entry[0]
+        if script == MARK_VERIFIED:
+            entry = self._live(keys[0])
+            if entry is None:
+                return 0
+            otp = json.loads(entry[0])
+            if otp["verified"] or otp["id"] != int(args[0]):
+                return 0
+            otp["verified"] = True
+            self._data[keys[0]] = (json.dumps(otp), time.monotonic() + int(args[1]))
+            return 1
+        raise NotImplementedError("LocalRedis only runs the OTP store's scripts")
+
+class RedisOTPStore(OTPStore):
+    """OTPs as JSON values with a TTL, so expiry costs nothing and lookups are O(1).
+
+    Works with redis.asyncio.Redis (decode_responses=True) or LocalRedis.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _key(self, user_id: int, action_type: str) -> str:
+        return f"otp:{action_type}:{user_id}"
+
+    def _attempts_key(self, user_id: int, action_type: str) -> str:
+        # A counter next to the OTP, so INCR can count guesses atomically
+        return f"otp-attempts:{action_type}:{user_id}"
+
+    async def issue(self, db, user_id, action_type):
+        otp_id = await self.client.incr("otp:next_id")
+        code = generate_code()
+        expires_at = datetime.utcnow() + timedelta(seconds=settings.otp_ttl_seconds)
+        value = {"id": otp_id, "code": code, "verified": False, "expires_at": time.time() + settings.otp_ttl_seconds}
+        await self.client.set(self._attempts_key(user_id, action_type), 0, ex=settings.otp_ttl_seconds)
+        await self.client.set(self._key(user_id, action_type), json.dumps(value), ex=settings.otp_ttl_seconds)
+        return IssuedOTP(otp_id=otp_id, code=code, expires_at=expires_at)
+
+    async def verify(self, db, user_id, action_type, code):
+        key = self._key(user_id, action_type)
+        # Every guess takes an attempt before it is compared; INCR keeps the counter's TTL
+        raw = await self.client.eval(
+            TAKE_ATTEMPT, 2, key, self._attempts_key(user_id, action_type), settings.otp_max_attempts
+        )
+        if raw is None:
+            # Expired keys are gone, so this can't tell expired from never issued
+            raise invalid_otp()
+        if raw == 0:
+            raise too_many_attempts()
+        value = json.loads(raw)
+        if not codes_match(value["code"], code):
+            raise invalid_otp()
+
+        # Same lifetime as the SQL backend: expiry plus the verified grace period
+        ttl = int(value["expires_at"] - time.time()) + settings.otp_verified_ttl_seconds
+        if not await self.client.eval(MARK_VERIFIED, 1, key, value["id"], max(ttl, 1)):
+            # A concurrent request verified it first
+            raise invalid_otp()
+
+    async def consume_verified(self, db, user_id, action_type):
+        key = self._key(user_id, action_type)
+        raw = await self.client.get(key)
+        if raw is None or not json.loads(raw)["verified"]:
+            return False
+        return await self.client.delete(key) == 1
+
+def create_otp_store() -> OTPStore:
+    if settings.otp_backend == "sql":
+        return SQLOTPStore()
+    if settings.otp_backend == "memory":
+        return RedisOTPStore(LocalRedis())
+    if settings.otp_backend == "redis":
+        from redis.asyncio import Redis  # optional dependency
+        return RedisOTPStore(Redis.from_url(settings.redis_url, decode_responses=True))
+    raise ValueError(f"Unknown OTP_BACKEND {settings.otp_backend!r}")
+
+otp_store = create_otp_store()
+
+async def sweep_periodically(session_factory, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                removed = await otp_store.sweep(db)
+            if removed:
+                logger.info("Swept %d expired OTPs", removed)
+        except Exception:
+            logger.exception("OTP sweep failed")
@@ -0,0 +1,300 @@
+"""Transactional outbox for user notifications.
+
+Request handlers call enqueue() inside their own transaction, so a notification
+exists exactly when the change that caused it commits. Worker tasks claim due
+rows with FOR UPDATE SKIP LOCKED, hand them to the configured provider in
+batches and retry failures with exponential backoff. Notifications still failing
+after OUTBOX_MAX_ATTEMPTS are marked failed, counted in /metrics and deleted by
+the workers once OUTBOX_FAILED_RETENTION_HOURS have passed.
+"""
+import asyncio
+import json
+import logging
+import random
+import smtplib
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from metrics import NOTIFICATIONS_FAILED, NOTIFICATIONS_FAILED_PURGED
+from models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 3600
+# How often a worker deletes failed notifications past their retention
+FAILED_PURGE_INTERVAL_SECONDS = 3600
+
+@dataclass
+class Notification:
+    id: int
+    kind: str
+    recipient: str
+    payload: dict
+    dedupe_key: str
+    attempts: int
+
+def _insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Notification outbox does not support {dialect}")
+
+async def enqueue(db: AsyncSession, kind: str, recipient: str, payload: dict, dedupe_key: str):
+    """Add a notification to the caller's transaction; a repeated dedupe_key is ignored."""
+    await db.execute(
+        _insert(db)(NotificationOutbox).values(
+            kind=kind, recipient=recipient, payload=json.dumps(payload),
+            dedupe_key=dedupe_key, next_attempt_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[NotificationOutbox.dedupe_key])
+    )
+
+def render(notification: Notification) -> Tuple[str, str]:
+    """Subject and plain-text body for a notification."""
+    payload = notification.payload
+    if notification.kind == "otp":
+        subject = "Account deletion OTP verification"
+        body = "\n".join([
+            f"👤 User: {payload['user_name']}",
+            f"📧 Email: {notification.recipient}",
+            f"🚨 Action: {payload['action_type'].upper()}",
+            f"🔢 OTP Code: {payload['otp_code']}",
+            f"⏰ Valid for: {payload['valid_minutes']} minutes",
+        ])
+        return subject, body
+    raise ValueError(f"Unknown notification kind {notification.kind!r}")
+
+class NotificationProvider(ABC):
+    """Delivers a batch; returns one error message (or None on success) per notification."""
+
+    @abstractmethod
+    async def send(self, batch: List[Notification]) -> List[Optional[str]]:
+        ...
+
+class ConsoleProvider(NotificationProvider):
+    async def send(self, batch):
+        for notification in batch:
+            subject, body = render(notification)
+            print("=" * 60)
+            print(f"🔐 {subject.upper()}")
+            print("=" * 60)
+            print(body)
+            print("=" * 60)
+        return [None] * len(batch)
+
+class FileProvider(NotificationProvider):
+    """Appends notifications as JSON lines; a local stand-in for a real provider."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for notification in batch:
+                subject, body = render(notification)
+                f.write(json.dumps({
+                    "dedupe_key": notification.dedupe_key,
+                    "to": notification.recipient,
+                    "subject": subject,
+                    "body": body,
+                }) + "\n")
+
+    async def send(self, batch):
+        await asyncio.to_thread(self._write, batch)
+        return [None] * len(batch)
+
+class SMTPProvider(NotificationProvider):
+    """Sends email over one SMTP connection per batch.
+
+    Point it at `python -m aiosmtpd -n -l localhost:1025` to see messages locally.
+    """
+
+    def __init__(self, host: str, port: int, sender: str):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def _message(self, notification: Notification) -> EmailMessage:
+        subject, body = render(notification)
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = notification.recipient
+        message["Subject"] = subject
+        # Stable across retries, so a redelivered message can be recognised downstream
+        message["Message-ID"] = f"<{notification.dedupe_key}@{self.sender.split('@')[-1]}>"
+        message.set_content(body)
+        return message
+
+    def _send(self, batch):
+        errors = []
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            for notification in batch:
+                try:
+                    smtp.send_message(self._message(notification))
+                    errors.append(None)
+                except smtplib.SMTPException as e:
+                    errors.append(str(e))
+        return errors
+
+    async def send(self, batch):
+        try:
+            return await asyncio.to_thread(self._send, batch)
+        except (OSError, smtplib.SMTPException) as e:
+            # Connection-level failure; retry the whole batch
+            return [str(e)] * len(batch)
+
+def create_provider() -> NotificationProvider:
+    if settings.notification_provider == "console":
+        return ConsoleProvider()
+    if settings.notification_provider == "file":
+        return FileProvider(settings.notification_file)
+    if settings.notification_provider == "smtp":
+        return SMTPProvider(settings.smtp_host, settings.smtp_port, settings.smtp_sender)
+    raise ValueError(f"Unknown NOTIFICATION_PROVIDER {settings.notification_provider!r}")
+
+provider = create_provider()
+
+# Made by start_workers: an Event belongs to the loop that first waits on it
+_wakeup: Optional[asyncio.Event] = None
+
+def notify_workers():
+    # Called after a commit that enqueued something, so delivery doesn't wait for the next poll
+    if _wakeup is not None:
+        _wakeup.set()
+
+def due_ids(now: datetime, limit: int):
+    """Ids of up to limit pending notifications due by now, skipping rows other workers hold."""
+    return (
+        select(NotificationOutbox.id)
+        .where(NotificationOutbox.status == "pending", NotificationOutbox.next_attempt_at <= now)
+        .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+async def claim(db: AsyncSession, limit: int) -> List[Notification]:
+    """Lease up to limit due notifications to this worker.
+
+    The lease pushes next_attempt_at forward, so a worker that dies mid-send
+    leaves its rows to be picked up again once the lease runs out.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(due_ids(now, limit)))
+        .values(
+            next_attempt_at=now + timedelta(seconds=settings.outbox_lease_seconds),
+            attempts=NotificationOutbox.attempts + 1
+        )
+        .returning(
+            NotificationOutbox.id, NotificationOutbox.kind, NotificationOutbox.recipient,
+            NotificationOutbox.payload, NotificationOutbox.dedupe_key, NotificationOutbox.attempts
+        )
+        .execution_options(synchronize_session=False)
+    )
+    batch = [
+        Notification(id=row.id, kind=row.kind, recipient=row.recipient, payload=json.loads(row.payload),
+                     dedupe_key=row.dedupe_key, attempts=row.attempts)
+        for row in result
+    ]
+    await db.commit()
+    return batch
+
+def backoff(attempts: int) -> float:
+    delay = min(settings.outbox_backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    # Jitter keeps retries of a failed batch from landing together
+    return delay * random.uniform(0.5, 1.0)
+
+async def settle(db: AsyncSession, batch: List[Notification], errors: List[Optional[str]]):
+    """Delete delivered notifications and reschedule or fail the rest."""
+    sent = [n.id for n, error in zip(batch, errors) if error is None]
+    if sent:
+        await db.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(sent)))
+
+    now = datetime.utcnow()
+    retries = []
+    for notification, error in zip(batch, errors):
+        if error is None:
+            continue
+        if notification.attempts >= settings.outbox_max_attempts:
+            logger.error("Giving up on notification %s after %d attempts: %s",
+                         notification.dedupe_key, notification.attempts, error)
+            NOTIFICATIONS_FAILED.inc()
+            # A failed row's next_attempt_at is when it was given up on, for purge_failed
+            retries.append({"id": notification.id, "status": "failed", "next_attempt_at": now, "last_error": error})
+        else:
+            retries.append({
+                "id": notification.id,
+                "next_attempt_at": now + timedelta(seconds=backoff(notification.attempts)),
+                "last_error": error,
+            })
+    # Rows differ in which columns change, so group them by key set for executemany
+    for keys in {tuple(sorted(values)) for values in retries}:
+        await db.execute(update(NotificationOutbox), [v for v in retries if tuple(sorted(v)) == keys])
+    await db.commit()
+
+async def deliver_once(db: AsyncSession, limit: int) -> int:
+    batch = await claim(db, limit)
+    if not batch:
+        return 0
+    try:
+        errors = await provider.send(batch)
+    except Exception as e:
+        logger.exception("Notification provider failed")
+        errors = [f"{type(e).__name__}: {e}"] * len(batch)
+    await settle(db, batch, errors)
+    return len(batch)
+
+async def purge_failed(db: AsyncSession, before: datetime) -> int:
+    """Delete notifications given up on before the given time; returns how many."""
+    result = await db.execute(
+        delete(NotificationOutbox)
+        .where(NotificationOutbox.status == "failed", NotificationOutbox.next_attempt_at < before)
+    )
+    await db.commit()
+    NOTIFICATIONS_FAILED_PURGED.inc(result.rowcount)
+    return result.rowcount
+
+async def run_worker(session_factory, batch_size: int, poll_interval: float):
+    next_purge = time.monotonic()
+    while True:
+        # Cleared before claiming, so work enqueued during the claim still wakes us
+        _wakeup.clear()
+        try:
+            async with session_factory() as db:
+                delivered = await deliver_once(db, batch_size)
+        except Exception:
+            logger.exception("Notification outbox worker failed")
+            delivered = 0
+        if delivered < batch_size and time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + FAILED_PURGE_INTERVAL_SECONDS
+            try:
+                async with session_factory() as db:
+                    before = datetime.utcnow() - timedelta(hours=settings.outbox_failed_retention_hours)
+                    removed = await purge_failed(db, before)
+                if removed:
+                    logger.info("Deleted %d failed notifications older than the retention", removed)
+            except Exception:
+                logger.exception("Notification outbox cleanup failed")
+        if delivered < batch_size:
+            # Drained; sleep until new work is enqueued or the poll interval passes
+            try:
+                await asyncio.wait_for(_wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+def start_workers(session_factory) -> List[asyncio.Task]:
+    global _wakeup
+    _wakeup = asyncio.Event()
+    return [
+        asyncio.create_task(run_worker(session_factory, settings.outbox_batch_size, settings.outbox_poll_seconds))
+        for _ in range(settings.outbox_workers)
+    ]
@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, Optional
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, func, select, tuple_
+from etags import rows_version, set_etag
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+def encode_cursor(last_id: int, sort_value=None) -> str:
+    data = {"id": last_id}
+    if sort_value is not None:
+        data["key"] = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        data["id"] = int(data["id"])
+        return data
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset(stmt, id_column, cursor: Optional[str], sort_column=None, descending: bool = False):
+    """Restrict a select to rows after the cursor, ordered by (sort_column, id) or just id, ascending unless descending."""
+    position = decode_cursor(cursor)
+    order = (lambda column: column.desc()) if descending else (lambda column: column)
+    if sort_column is None:
+        if position is not None:
+            stmt = stmt.where(id_column < position["id"] if descending else id_column > position["id"])
+        return stmt.order_by(order(id_column))
+
+    if position is not None:
+        try:
+            key = position["key"]
+            if isinstance(sort_column.type, DateTime):
+                key = datetime.fromisoformat(key)
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        row, after = tuple_(sort_column, id_column), tuple_(key, position["id"])
+        stmt = stmt.where(row < after if descending else row > after)
+    return stmt.order_by(order(sort_column), order(id_column))
+
+def page_select(stmt, id_column, cursor: Optional[str], limit: int, sort_column=None, descending: bool = False):
+    """The rows paginate() fetches: one page, plus a row to tell whether another page exists."""
+    return keyset(stmt, id_column, cursor, sort_column, descending).limit(limit + 1)
+
+async def page_version(db, stmt, id_column, updated_column, version_column, cursor: Optional[str], limit: int,
+                       sort_column=None, descending: bool = False) -> tuple:
+    """(count, max id, max updated_column, sum of version_column) over the rows paginate() would fetch,
+    without loading them; etags.rows_version computes the same from fetched rows."""
+    columns = [id_column, updated_column, version_column] + ([sort_column] if sort_column is not None else [])
+    page = page_select(stmt.with_only_columns(*columns), id_column, cursor, limit, sort_column, descending).subquery()
+    row = (await db.execute(select(
+        func.count(), func.max(page.c[id_column.key]), func.max(page.c[updated_column.key]),
+        func.coalesce(func.sum(page.c[version_column.key]), 0)
+    ))).one()
+    return tuple(row)
+
+async def paginate(db, stmt, id_column, cursor: Optional[str], limit: int, response: Response,
+                   scalars: bool = True, sort_column=None, descending: bool = False,
+                   etag: Optional[Callable[[tuple], str]] = None):
+    """Return one page of ORM objects, or of plain rows with scalars=False.
+
+    With etag, the ETag header is set from the page's version (see page_version).
+    """
+    page = page_select(stmt, id_column, cursor, limit, sort_column, descending)
+    rows = (await db.scalars(page) if scalars else await db.execute(page)).all()
+    if etag is not None:
+        set_etag(response, etag(rows_version(rows)))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_value = getattr(last, sort_column.key) if sort_column is not None else None
+        response.headers["X-Next-Cursor"] = encode_cursor(last.id, sort_value)
+    return rows
+
+def stream_ndjson(db, stmt, id_column, cursor: Optional[str], serialize: Callable[[object], str],
+                  scalars: bool = True, sort_column=None, descending: bool = False):
+    """Stream rows as NDJSON using a server-side cursor so memory stays flat.
+
+    Reads through the request's session: FastAPI tears dependencies with yield down only
+    after a streamed body is sent, so the session stays open for the whole stream.
+    """
+    stmt = keyset(stmt, id_column, cursor, sort_column, descending).execution_options(yield_per=STREAM_CHUNK_SIZE)
+
+    async def generate():
+        rows = await db.stream_scalars(stmt) if scalars else await db.stream(stmt)
+        async for row in rows:
+            yield serialize(row) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
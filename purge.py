@@ -0,0 +1,139 @@
+"""Account deletion, inline for small accounts and in the background for large ones.
+
+Deleting the users row lets the database cascade to bookings and OTP requests
+(passive_deletes on the relationships, foreign keys turned on for SQLite), so
+nothing is loaded into the session. The bookings, archived ones included
+(bookings_archive cascades the same way), still get their delete events
+and rollup updates first, which needs their rows; accounts with more than
+ACCOUNT_PURGE_INLINE_BOOKINGS bookings are therefore disabled in the request and
+purged by a worker, ACCOUNT_PURGE_CHUNK_SIZE bookings per transaction. Progress
+is kept in account_purges, which outlives the user.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from availability import availability_index
+from config import settings
+from events import EVENT_FIELDS, Change, record, snapshot
+from metrics import ACCOUNT_PURGE_BOOKINGS
+from models import AccountPurge, Booking, BookingArchive, User
+
+logger = logging.getLogger(__name__)
+
+# Made by run_worker: an Event belongs to the loop that first waits on it
+_wakeup: Optional[asyncio.Event] = None
+
+def notify_workers():
+    # Called after committing a new purge, so it doesn't wait for the next poll
+    if _wakeup is not None:
+        _wakeup.set()
+
+# Where a user's bookings live; archived rows are taken once the active ones are gone
+BOOKING_MODELS = (Booking, BookingArchive)
+
+def user_bookings_select(model, user_id: int, limit: int):
+    return (
+        select(model.id, *(getattr(model, field) for field in EVENT_FIELDS),
+               literal(model is BookingArchive).label("archived"))
+        .where(model.user_id == user_id).order_by(model.id).limit(limit)
+    )
+
+async def user_bookings(db: AsyncSession, user_id: int, limit: int) -> list:
+    """Up to limit of the user's bookings, with the fields their delete events need and whether archived."""
+    bookings = []
+    for model in BOOKING_MODELS:
+        bookings += (await db.execute(user_bookings_select(model, user_id, limit - len(bookings)))).all()
+        if len(bookings) >= limit:
+            break
+    return bookings
+
+async def count_user_bookings(db: AsyncSession, user_id: int) -> int:
+    total = 0
+    for model in BOOKING_MODELS:
+        total += await db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+    return total
+
+async def delete_account(db: AsyncSession, user_id: int, email: str) -> bool:
+    """Delete the account now if it is small enough, else disable it and queue a purge.
+
+    Runs in the caller's transaction and commits it. Returns True when the account is gone.
+    """
+    limit = settings.account_purge_inline_bookings
+    bookings = await user_bookings(db, user_id, limit + 1)
+    if len(bookings) <= limit:
+        await record(db, [Change(booking.id, email, "delete", snapshot(booking), None) for booking in bookings])
+        # The database cascades to the bookings and OTP requests
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+        for booking in bookings:
+            availability_index.remove(booking.id)
+        return True
+
+    total = await count_user_bookings(db, user_id)
+    # Revokes every issued token; login refuses disabled accounts
+    await db.execute(
+        update(User).where(User.id == user_id)
+        .values(disabled_at=datetime.now(timezone.utc), token_version=User.token_version + 1)
+    )
+    await db.execute(insert(AccountPurge).values(user_id=user_id, email=email, bookings_total=total))
+    await db.commit()
+    notify_workers()
+    logger.info("Account %s disabled; purging %d bookings in the background", user_id, total)
+    return False
+
+async def purge_once(db: AsyncSession, chunk_size: int) -> Optional[AccountPurge]:
+    """Delete one chunk of one pending purge, or the user once no bookings are left.
+
+    Returns the purge worked on, or None when there is nothing to do.
+    """
+    purge = await db.scalar(
+        select(AccountPurge).where(AccountPurge.finished_at.is_(None))
+        .order_by(AccountPurge.user_id).limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if purge is None:
+        return None
+
+    bookings = await user_bookings(db, purge.user_id, chunk_size)
+    booking_ids = [booking.id for booking in bookings]
+    if bookings:
+        await record(db, [Change(booking.id, purge.email, "delete", snapshot(booking), None) for booking in bookings])
+        for model in BOOKING_MODELS:
+            ids = [booking.id for booking in bookings if bool(booking.archived) == (model is BookingArchive)]
+            if ids:
+                await db.execute(delete(model).where(model.id.in_(ids)))
+        purge.bookings_deleted += len(bookings)
+    else:
+        await db.execute(delete(User).where(User.id == purge.user_id))
+        purge.finished_at = datetime.now(timezone.utc)
+    await db.commit()
+
+    for booking_id in booking_ids:
+        availability_index.remove(booking_id)
+    ACCOUNT_PURGE_BOOKINGS.inc(len(booking_ids))
+    if purge.finished_at is None:
+        logger.info("Purging account %s: %d of %d bookings deleted", purge.user_id, purge.bookings_deleted, purge.bookings_total)
+    else:
+        logger.info("Purged account %s (%d bookings)", purge.user_id, purge.bookings_deleted)
+    return purge
+
+async def run_worker(session_factory, chunk_size: int, poll_interval: float):
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        # Cleared before looking, so a purge queued meanwhile still wakes us
+        _wakeup.clear()
+        try:
+            async with session_factory() as db:
+                purge = await purge_once(db, chunk_size)
+        except Exception:
+            logger.exception("Account purge worker failed")
+            purge = None
+        if purge is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,66 @@
+"""Statement counts per request, for asserting query budgets and catching N+1s.
+
+    with query_budget(max_queries=4) as requests:
+        client.get("/bookings/user/my-bookings", headers=headers)
+    print(requests[0].count, requests[0].repeated())
+
+Requests are captured by MetricsMiddleware, so anything that drives the app
+(TestClient, an httpx ASGITransport client, a live server in the same process)
+works, and statements issued by background tasks are never charged to a request.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+from metrics import RequestStats, request_observers
+
+@dataclass
+class RequestQueries:
+    method: str
+    route: str
+    status: int
+    count: int
+    statements: List[str] = field(default_factory=list)
+
+    def repeated(self, allowed: int = 1) -> Dict[str, int]:
+        """Statements issued more than `allowed` times, with how often; the usual N+1 signature."""
+        counts = Counter(" ".join(sql.split()) for sql in self.statements)
+        return {sql: n for sql, n in counts.items() if n > allowed}
+
+    def problems(self, max_queries: Optional[int] = None, max_repeats: Optional[int] = 1) -> List[str]:
+        found = []
+        if max_queries is not None and self.count > max_queries:
+            found.append(f"{self.method} {self.route} issued {self.count} statements, budget is {max_queries}")
+        if max_repeats is not None:
+            for sql, n in self.repeated(max_repeats).items():
+                found.append(f"{self.method} {self.route} repeated {n}x: {sql[:300]}")
+        return found
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@contextmanager
+def capture_queries() -> Iterator[List[RequestQueries]]:
+    """Collect a RequestQueries for every request served inside the block."""
+    captured: List[RequestQueries] = []
+
+    def observe(method: str, route: str, status: int, stats: RequestStats):
+        captured.append(RequestQueries(method, route, status, stats.queries, [sql for _, sql in stats.statements]))
+
+    request_observers.append(observe)
+    try:
+        yield captured
+    finally:
+        request_observers.remove(observe)
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None, max_repeats: Optional[int] = 1) -> Iterator[List[RequestQueries]]:
+    """Fail if any request in the block exceeds max_queries or repeats a statement more than max_repeats times.
+
+    Pass None to skip either check.
+    """
+    with capture_queries() as captured:
+        yield captured
+    found = [problem for request in captured for problem in request.problems(max_queries, max_repeats)]
+    if found:
+        raise QueryBudgetExceeded("\n".join(found))
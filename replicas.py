@@ -0,0 +1,166 @@
+"""Read replicas for read-only request handlers.
+
+Handlers that only read take their session from get_read_db, which hands out
+replicas round-robin and falls back to the primary when none is healthy.
+A user who committed a write in the last READ_YOUR_WRITES_SECONDS reads from
+the primary, so they see their own change. That window is tracked per process,
+so several workers need sticky routing per user for it to hold everywhere.
+
+Two SQLite files work as a stand-in: copy the primary's file and set
+READ_REPLICA_URLS=sqlite:///./replica.db.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+from fastapi import Depends
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from auth import Principal, get_current_user
+from config import settings
+from database import AsyncSessionLocal, async_url, engine_options
+from metrics import READ_SESSIONS, REPLICA_HEALTHY, REPLICA_LAG_SECONDS
+from warmup import warm_pool
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+RECENT_WRITERS_SIZE = 100000
+
+class RecentWriters:
+    """Bounded map of user id to when their read-your-writes window closes."""
+
+    def __init__(self, maxsize: int, window: float):
+        self.maxsize = maxsize
+        self.window = window
+        self._until = OrderedDict()
+
+    def mark(self, user_id: int):
+        self._until[user_id] = time.monotonic() + self.window
+        self._until.move_to_end(user_id)
+        while len(self._until) > self.maxsize:
+            self._until.popitem(last=False)
+
+    def wrote_recently(self, user_id: int) -> bool:
+        until = self._until.get(user_id)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            del self._until[user_id]
+            return False
+        return True
+
+recent_writers = RecentWriters(RECENT_WRITERS_SIZE, settings.read_your_writes_seconds)
+
+@event.listens_for(Session, "after_commit")
+def _remember_writer(session):
+    # get_current_user tags the request's primary session with the caller
+    user_id = session.info.get("user_id")
+    if user_id is not None:
+        recent_writers.mark(user_id)
+
+@dataclass
+class Replica:
+    name: str
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker
+    # Unhealthy until the first check passes
+    healthy: bool = False
+
+class ReplicaSet:
+    def __init__(self, urls: List[str]):
+        self.replicas = []
+        for i, url in enumerate(urls):
+            parsed = async_url(url)
+            replica_engine = create_async_engine(parsed, **engine_options(parsed))
+            replica = Replica(f"replica{i}", replica_engine,
+                              async_sessionmaker(replica_engine, autoflush=False, expire_on_commit=False))
+            self._watch_errors(replica)
+            self.replicas.append(replica)
+        self._next = 0
+
+    def _watch_errors(self, replica: Replica):
+        @event.listens_for(replica.engine.sync_engine, "handle_error")
+        def handle_error(context):
+            # Stop routing to a replica that dropped a connection; the next check may restore it
+            if context.is_disconnect and replica.healthy:
+                logger.warning("Read replica %s disconnected, using the others until it recovers", replica.name)
+                self._set_health(replica, False)
+
+    def _set_health(self, replica: Replica, healthy: bool, lag: Optional[float] = None):
+        replica.healthy = healthy
+        REPLICA_HEALTHY.set(int(healthy), replica=replica.name)
+        if lag is not None:
+            REPLICA_LAG_SECONDS.set(lag, replica=replica.name)
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+    async def check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = float(await conn.scalar(POSTGRES_LAG))
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0.0
+        except Exception as e:
+            if replica.healthy:
+                logger.warning("Read replica %s failed its health check: %s", replica.name, e)
+            self._set_health(replica, False)
+            return
+        healthy = lag <= settings.replica_max_lag_seconds
+        if healthy != replica.healthy:
+            logger.warning("Read replica %s is %s (lag %.1fs)", replica.name, "healthy" if healthy else "lagging", lag)
+        self._set_health(replica, healthy, lag)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def warm(self, size: int):
+        """Warm the pools of healthy replicas; one that fails is marked unhealthy, not fatal."""
+        async def warm_one(replica: Replica):
+            try:
+                await warm_pool(replica.engine, size)
+            except Exception as e:
+                logger.warning("Read replica %s failed warmup: %s", replica.name, e)
+                self._set_health(replica, False)
+        await asyncio.gather(*(warm_one(replica) for replica in self.replicas if replica.healthy))
+
+    async def check_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_all()
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+replica_set = ReplicaSet(settings.read_replica_urls)
+
+def read_sessionmaker(user_id: Optional[int]) -> async_sessionmaker:
+    """Sessions for a read-only request: a healthy replica unless the user just wrote."""
+    if user_id is not None and recent_writers.wrote_recently(user_id):
+        READ_SESSIONS.inc(target="primary")
+        return AsyncSessionLocal
+    replica = replica_set.pick()
+    if replica is None:
+        READ_SESSIONS.inc(target="primary")
+        return AsyncSessionLocal
+    READ_SESSIONS.inc(target=replica.name)
+    return replica.sessionmaker
+
+async def get_read_db(current_user: Principal = Depends(get_current_user)):
+    async with read_sessionmaker(current_user.id)() as db:
+        yield db
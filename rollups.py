@@ -0,0 +1,108 @@
+"""Per room type, per day occupancy rollups.
+
+A booking occupies each night from its check-in date up to (not including) its
+check-out date; a stay that starts and ends on the same date counts for that day.
+
+CLI:
+    python rollups.py rebuild
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import delete, insert, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import Booking, BookingArchive, BookingDailyStats
+
+REBUILD_BATCH_SIZE = 5000
+
+def stay_days(check_in: datetime, check_out: datetime) -> List[date]:
+    first, last = check_in.date(), check_out.date()
+    if last <= first:
+        return [first]
+    return [first + timedelta(days=n) for n in range((last - first).days)]
+
+def _add(totals: dict, stay: dict, sign: int):
+    for day in stay_days(stay["check_in"], stay["check_out"]):
+        counts = totals[(stay["room_type"], day)]
+        counts[0] += sign
+        counts[1] += sign * stay["guests"]
+
+def deltas(changes: Iterable) -> Dict[Tuple[str, date], List[int]]:
+    """Net [bookings, guests] change per (room_type, day) for changes with old/new snapshots."""
+    totals = defaultdict(lambda: [0, 0])
+    for change in changes:
+        if change.old is not None:
+            _add(totals, change.old, -1)
+        if change.new is not None:
+            _add(totals, change.new, 1)
+    return {key: counts for key, counts in totals.items() if counts != [0, 0]}
+
+def _upsert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Rollups do not support {dialect}")
+
+async def apply_changes(db: AsyncSession, changes: Iterable):
+    """Add the changes' deltas to the stored rows, in the caller's transaction."""
+    totals = deltas(changes)
+    if not totals:
+        return
+    stmt = _upsert(db)(BookingDailyStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookingDailyStats.room_type, BookingDailyStats.day],
+        set_={
+            "bookings": BookingDailyStats.bookings + stmt.excluded.bookings,
+            "guests": BookingDailyStats.guests + stmt.excluded.guests,
+        }
+    )
+    # Sorted so concurrent writers lock rows in the same order
+    await db.execute(stmt, [
+        {"room_type": room_type, "day": day, "bookings": counts[0], "guests": counts[1]}
+        for (room_type, day), counts in sorted(totals.items())
+    ])
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute every row from bookings and bookings_archive in one transaction; returns the row count."""
+    if db.get_bind().dialect.name == "postgresql":
+        # Writers block on their rollup upsert until this commits, so none slip in between
+        await db.execute(text("LOCK TABLE booking_daily_stats IN EXCLUSIVE MODE"))
+    await db.execute(delete(BookingDailyStats))
+
+    totals = defaultdict(lambda: [0, 0])
+    stays = union_all(*(
+        select(model.room_type, model.check_in, model.check_out, model.guests)
+        for model in (Booking, BookingArchive)
+    ))
+    result = await db.stream(stays.execution_options(yield_per=REBUILD_BATCH_SIZE))
+    async for row in result:
+        _add(totals, row._mapping, 1)
+
+    rows = [
+        {"room_type": room_type, "day": day, "bookings": counts[0], "guests": counts[1]}
+        for (room_type, day), counts in sorted(totals.items())
+    ]
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        await db.execute(insert(BookingDailyStats), rows[start:start + REBUILD_BATCH_SIZE])
+    await db.commit()
+    return len(rows)
+
+async def _run_rebuild():
+    async with AsyncSessionLocal() as db:
+        count = await rebuild(db)
+    print(f"Rebuilt {count} daily stats rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking rollup maintenance")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.parse_args()
+    asyncio.run(_run_rebuild())
+
+if __name__ == "__main__":
+    main()
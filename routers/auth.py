@@ -1,29 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from database import SessionLocal
-from sqlalchemy.orm import Session
+from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
-from auth import get_password_hash, verify_password, create_access_token
+from auth import create_user_token
+from hashing import hasher
 from schemas import UserCreate, Token, MessageResponse
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", response_model=MessageResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user exists
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hasher.hash(user.password)
     db_user = User(
         email=user.email,
         hashed_password=hashed_password,
@@ -31,16 +26,27 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         role=user.role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return MessageResponse(message="User created successfully", user_id=db_user.id)
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == form_data.username).first()
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(User).where(User.email == form_data.username))
+    if not db_user:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    
+    valid, new_hash = await hasher.verify(form_data.password, db_user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if db_user.disabled_at is not None:
+        raise HTTPException(status_code=403, detail="Account is being deleted")
+    
+    # Transparently upgrade hashes made with an older cost factor
+    if new_hash:
+        db_user.hashed_password = new_hash
+        await db.commit()
     
-    access_token = create_access_token(data={"sub": db_user.email})
+    access_token = create_user_token(db_user)
     return Token(access_token=access_token, token_type="bearer")
\ No newline at end of file
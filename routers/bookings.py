@@ -1,28 +1,203 @@
-from fastapi import APIRouter, Depends, HTTPException
-from database import SessionLocal
-from sqlalchemy.orm import Session, joinedload
-from models import Booking, User
-from auth import get_current_user, get_current_admin, get_current_superadmin
-from schemas import BookingCreate, BookingUpdate, BookingResponse, BookingWithUser, MessageResponse, DeleteResponse, UserResponse, UserBookingUpdate
-from datetime import datetime
+import io
+from contextlib import asynccontextmanager, nullcontext
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from database import AsyncSessionLocal, get_db
+from sqlalchemy import bindparam, delete, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Booking, BookingDailyStats, BookingEvent, User
+from auth import Principal, get_current_user, get_current_writer, get_current_admin, get_current_admin_writer, get_current_superadmin
+from schemas import BookingCreate, BookingUpdate, BookingResponse, BookingWithUser, MessageResponse, DeleteResponse, UserBookingUpdate, AvailabilityResponse, AvailabilitySlot, ImportReport, BookingBatchRequest, BatchItemResult, BatchResponse, BookingEventResponse, DailyStats
+from availability import availability_index, ensure_available, find_overlaps, lock_room_types
+from etags import booking_etag, if_match_versions, make_etag, matches, not_modified, set_etag
+from events import EVENT_FIELDS, Change, record, snapshot
+from change_feed import stream as change_stream
+from config import settings
+from filters import SORT_PATTERN, BookingFilters, booking_filters, sort_order
+from archive import booking_source
+from fieldsets import USER_FIELDS, BookingFieldset, booking_fieldset, user_fieldset
+from bulk import detect_format, export_bookings, import_bookings, read_rows
+from replicas import get_read_db
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, page_version, paginate, stream_ndjson
+from serialization import FastJSONResponse, booking_with_user_dict, booking_with_user_select, dumps
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
+# Activity window when the caller gives no start
+ACTIVITY_WINDOW = timedelta(days=7)
+# Longest range one stats request may cover
+MAX_STATS_DAYS = 366
+# Fields that move a stay, so changing one re-checks availability
+STAY_FIELDS = ("room_type", "check_in", "check_out")
+
+def is_overlap(error: IntegrityError) -> bool:
+    """Whether the error is bookings_no_overlap (SQLSTATE 23P01, exclusion violation)."""
+    code = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    return code == "23P01" or "bookings_no_overlap" in str(error.orig)
+
+@asynccontextmanager
+async def booking_transaction(db: AsyncSession):
+    """Commit on exit; flushes and the commit can both hit bookings_no_overlap."""
     try:
-        yield db
-    finally:
-        db.close()
+        yield
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if not is_overlap(e):
+            raise
+        # bookings_no_overlap caught a race the advisory lock didn't
+        raise HTTPException(status_code=409, detail="Room is already booked for those dates")
+
+def booking_conditions(booking_id: int, versions: Optional[list], owner_id: Optional[int]) -> list:
+    """WHERE clause of a booking write: the id, plus the If-Match versions and the owner when given."""
+    conditions = [Booking.id == booking_id]
+    if versions is not None:
+        conditions.append(Booking.version.in_(versions))
+    if owner_id is not None:
+        conditions.append(Booking.user_id == owner_id)
+    return conditions
+
+async def write_failure(db: AsyncSession, booking_id: int, versions: Optional[list], owner_id: Optional[int]) -> HTTPException:
+    """Why a booking write matched no row; only runs on that path, so successful writes skip it."""
+    row = (await db.execute(select(Booking.user_id, Booking.version).where(Booking.id == booking_id))).first()
+    if row is None:
+        return HTTPException(status_code=404, detail="Booking not found")
+    if owner_id is not None and row.user_id != owner_id:
+        return HTTPException(status_code=403, detail="Not enough permissions")
+    if versions is not None and row.version not in versions:
+        return HTTPException(status_code=412, detail="Booking has changed; fetch it again before retrying")
+    # Another write got in between this request's read and its update
+    return HTTPException(status_code=409, detail="Booking was modified concurrently; retry")
+
+async def update_booking_row(db: AsyncSession, booking_id: int, values: dict, conditions: list, current=None):
+    """UPDATE one booking and bump its version; returns (old snapshot, new snapshot, version) or None.
+
+    current is the row already read (event fields and version), which pins the UPDATE to it.
+    Otherwise Postgres returns the old values from a self-join in the same statement; SQLite's
+    RETURNING can't see the joined table, so there the row is read first and pinned the same way.
+    """
+    table = Booking.__table__
+    values = {**values, "version": table.c.version + 1}
+    returning = [table.c[field] for field in EVENT_FIELDS] + [table.c.version]
+    if current is None and db.get_bind().dialect.name == "postgresql":
+        old = table.alias("old")
+        row = (await db.execute(
+            update(table)
+            .where(table.c.id == old.c.id, table.c.version == old.c.version, *conditions)
+            .values(values)
+            .returning(*(old.c[field].label("old_" + field) for field in EVENT_FIELDS), *returning)
+        )).first()
+        return None if row is None else (snapshot(row, "old_"), snapshot(row), row.version)
+    
+    if current is None:
+        current = (await db.execute(select(*returning).where(*conditions))).first()
+        if current is None:
+            return None
+    row = (await db.execute(
+        update(table).where(table.c.id == booking_id, table.c.version == current.version).values(values).returning(*returning)
+    )).first()
+    return None if row is None else (snapshot(current), snapshot(row), row.version)
+
+async def apply_booking_update(db: AsyncSession, booking_id: int, update_data: dict, updated_by: str,
+                               if_match: Optional[str], owner_id: Optional[int] = None) -> int:
+    """Update a booking and return its new version.
+
+    if_match limits the write to the versions it names (412 otherwise) and owner_id to that
+    user's bookings (403 otherwise); both are part of the UPDATE's WHERE clause.
+    """
+    versions = if_match_versions(if_match, booking_id)
+    conditions = booking_conditions(booking_id, versions, owner_id)
+    current, moved, lock = None, False, nullcontext()
+    if update_data.keys() & set(STAY_FIELDS):
+        # The availability check needs the new stay and its room's lock before writing, so read first
+        current = (await db.execute(
+            select(*(getattr(Booking, field) for field in EVENT_FIELDS), Booking.version).where(*conditions)
+        )).first()
+        if current is None:
+            raise await write_failure(db, booking_id, versions, owner_id)
+        stay = tuple(update_data.get(field, getattr(current, field)) for field in STAY_FIELDS)
+        moved = stay != tuple(getattr(current, field) for field in STAY_FIELDS)
+        if moved:
+            lock = availability_index.lock(stay[0])
+    
+    async with lock, booking_transaction(db):
+        if moved:
+            await ensure_available(db, *stay, exclude_id=booking_id)
+        result = await update_booking_row(db, booking_id, {**update_data, "updated_by": updated_by}, conditions, current)
+        if result is None:
+            raise await write_failure(db, booking_id, versions, owner_id)
+        old, new, version = result
+        await record(db, [Change(booking_id, updated_by, "update", old, new)])
+    
+    availability_index.add(booking_id, new["room_type"], new["check_in"], new["check_out"])
+    return version
+
+async def delete_booking(db: AsyncSession, booking_id: int, actor: str,
+                         if_match: Optional[str], owner_id: Optional[int] = None):
+    """Delete a booking in one statement, under the same If-Match and owner conditions as updates."""
+    versions = if_match_versions(if_match, booking_id)
+    row = (await db.execute(
+        delete(Booking).where(*booking_conditions(booking_id, versions, owner_id))
+        .returning(*(getattr(Booking, field) for field in EVENT_FIELDS))
+    )).first()
+    if row is None:
+        raise await write_failure(db, booking_id, versions, owner_id)
+    await record(db, [Change(booking_id, actor, "delete", snapshot(row), None)])
+    await db.commit()
+    availability_index.remove(booking_id)
+
+def my_bookings_select(source, filters: BookingFilters, fieldset: Optional[BookingFieldset], sort_column,
+                       owner_id: Optional[int]):
+    """get_my_bookings' list before pagination; owner_id limits it to one user's bookings."""
+    if fieldset is None:
+        stmt = filters.apply(select(source), source=source)
+    else:
+        # The sort key and ETag columns are read even when not returned
+        extra = [source.updated_at, source.version] + ([sort_column] if sort_column is not None else [])
+        stmt = filters.apply(fieldset.select(source, extra), users_joined=fieldset.user is not None, source=source)
+    if owner_id is not None:
+        stmt = stmt.where(source.user_id == owner_id)
+    return stmt
+
+def all_bookings_select(source, filters: BookingFilters, fieldset: Optional[BookingFieldset], sort_column):
+    """get_all_bookings' list before pagination."""
+    if fieldset is None:
+        return filters.apply(booking_with_user_select(source), users_joined=True, source=source)
+    return filters.apply(fieldset.select(source, [sort_column] if sort_column is not None else []),
+                         users_joined=fieldset.user is not None, source=source)
+
+def stats_select(start: date, end: date, room_type: Optional[str]):
+    """Rollup rows for days in [start, end) that had bookings, of one room type when given."""
+    stmt = select(BookingDailyStats).where(
+        BookingDailyStats.day >= start,
+        BookingDailyStats.day < end,
+        BookingDailyStats.bookings > 0
+    )
+    if room_type:
+        stmt = stmt.where(BookingDailyStats.room_type == room_type)
+    return stmt.order_by(BookingDailyStats.day, BookingDailyStats.room_type)
+
+def activity_select(since: datetime, until: datetime, actor: Optional[str], booking_id: Optional[int]):
+    """Events in [since, until), narrowed to an actor or a booking when given; paginated by ts."""
+    # The ts bounds let Postgres skip partitions outside the range
+    stmt = select(BookingEvent).where(BookingEvent.ts >= since, BookingEvent.ts < until)
+    if actor:
+        stmt = stmt.where(BookingEvent.actor == actor)
+    if booking_id is not None:
+        stmt = stmt.where(BookingEvent.booking_id == booking_id)
+    return stmt
 
 # ==================== USER ENDPOINTS ====================
 
 # Create booking - Any authenticated user
 @router.post("/", response_model=MessageResponse)
-def create_booking(
+async def create_booking(
     booking: BookingCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_writer),
+    db: AsyncSession = Depends(get_db)
 ):
     db_booking = Booking(
         room_type=booking.room_type,
@@ -31,193 +206,444 @@ def create_booking(
         guests=booking.guests,
         user_id=current_user.id
     )
-    db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
+    async with availability_index.lock(booking.room_type), booking_transaction(db):
+        await ensure_available(db, booking.room_type, booking.check_in, booking.check_out)
+        db.add(db_booking)
+        # Flush for the id the event needs
+        await db.flush()
+        await record(db, [Change(db_booking.id, current_user.email, "create", None, snapshot(db_booking))])
+    await db.refresh(db_booking)
+    availability_index.add(db_booking.id, db_booking.room_type, db_booking.check_in, db_booking.check_out)
     return MessageResponse(message="Booking created", booking_id=db_booking.id)
 
 # Get my bookings - Users see their own, admins & superadmins see all
+# Paged by cursor (next page in X-Next-Cursor header), or streamed with format=ndjson
+# Narrowed by the booking_filters parameters and ordered by sort (id, -id, check_in, -check_in)
+# JSON pages carry an ETag; polling with If-None-Match gets 304 while the page is unchanged
+# include_archived=true adds bookings moved to the archive (see archive.py)
+# fields=id,check_in,... and include=user select only those columns (see fieldsets.py); include=user pages have no ETag
 @router.get("/user/my-bookings", response_model=list[BookingResponse])
-def get_my_bookings(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_my_bookings(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    sort: str = Query("id", pattern=SORT_PATTERN),
+    filters: BookingFilters = Depends(booking_filters),
+    fieldset: Optional[BookingFieldset] = Depends(booking_fieldset),
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    if current_user.role == "user":
-        bookings = db.query(Booking).filter(Booking.user_id == current_user.id).all()
-    else:
-        bookings = db.query(Booking).all()
-    return bookings
+    source = booking_source(include_archived)
+    sort_column, descending = sort_order(sort, source)
+    owner_id = current_user.id if current_user.role == "user" else None
+    stmt = my_bookings_select(source, filters, fieldset, sort_column, owner_id)
+    scope = owner_id if owner_id is not None else "all"
+    
+    if format == "ndjson":
+        if fieldset is None:
+            serialize = lambda b: BookingResponse.model_validate(b).model_dump_json()
+        else:
+            serialize = lambda row: dumps(fieldset.to_dict(row)).decode()
+        return stream_ndjson(db, stmt, source.id, cursor, serialize, scalars=fieldset is None,
+                             sort_column=sort_column, descending=descending)
+    
+    def page_etag(version: tuple) -> str:
+        fields = fieldset.key() if fieldset is not None else None
+        return make_etag("my-bookings", scope, cursor, limit, sort, include_archived, fields, *filters.key(), *version)
+    
+    # Users carry no version to validate against, so pages embedding one get no ETag
+    etag = None if fieldset is not None and fieldset.user is not None else page_etag
+    if etag is not None and if_none_match:
+        # Aggregate over the page's index range only; rows are loaded when it changed
+        current = etag(await page_version(db, stmt, source.id, source.updated_at, source.version, cursor, limit,
+                                          sort_column, descending))
+        if matches(if_none_match, current):
+            return not_modified(current)
+    rows = await paginate(db, stmt, source.id, cursor, limit, response, scalars=fieldset is None,
+                          sort_column=sort_column, descending=descending, etag=etag)
+    if fieldset is None:
+        return rows
+    return FastJSONResponse([fieldset.to_dict(row) for row in rows], headers=response.headers)
+
+# Live booking changes as Server-Sent Events - users see their own bookings, admins & superadmins all
+# A reconnecting client resumes after Last-Event-ID (or ?last_event_id=) from the event log
+@router.get("/changes", response_class=StreamingResponse)
+async def get_booking_changes(
+    last_event_id: Optional[int] = Query(None, ge=0),
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+    current_user: Principal = Depends(get_current_user)
+):
+    user_id = current_user.id if current_user.role == "user" else None
+    after = last_event_id_header if last_event_id_header is not None else last_event_id
+    return StreamingResponse(
+        change_stream(AsyncSessionLocal, user_id, after, settings.change_feed_heartbeat_seconds),
+        media_type="text/event-stream",
+        # Stops nginx and similar proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Free slots for a room type in [from, to) - Any authenticated user, answered from the in-memory index
+@router.get("/availability", response_model=AvailabilityResponse)
+async def get_availability(
+    room_type: str,
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    current_user: Principal = Depends(get_current_user)
+):
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    
+    free_slots = availability_index.free_slots(room_type, start, end)
+    return AvailabilityResponse(
+        room_type=room_type,
+        start=start,
+        end=end,
+        available=not availability_index.conflicts(room_type, start, end),
+        free_slots=[AvailabilitySlot(start=slot_start, end=slot_end) for slot_start, slot_end in free_slots]
+    )
+
+# Per-day occupancy and guests from the rollup table - ADMIN & SUPERADMIN ONLY
+# Days in [from, to) with no bookings are omitted
+@router.get("/stats", response_model=list[DailyStats])
+async def get_booking_stats(
+    start: date = Query(..., alias="from"),
+    end: date = Query(..., alias="to"),
+    room_type: Optional[str] = None,
+    current_user: Principal = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if (end - start).days > MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_STATS_DAYS} days")
+    
+    stats = await db.scalars(stats_select(start, end, room_type))
+    return stats.all()
 
 # Update own booking - Users can update their own bookings (room_type and guests only)
+# Send If-Match with the booking's ETag ("<id>.<version>") to get 412 instead of overwriting a newer edit
 @router.put("/user/my-bookings/{booking_id}", response_model=MessageResponse)
-def update_my_booking(
+async def update_my_booking(
     booking_id: int,
     booking_update: UserBookingUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_writer),
+    db: AsyncSession = Depends(get_db)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
     # Users can only update their own bookings
-    if current_user.role == "user" and booking.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
+    owner_id = current_user.id if current_user.role == "user" else None
     
     # Update only provided fields
     update_data = booking_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(booking, field, value)
-    
-    booking.updated_by = current_user.email
-    db.commit()
+    version = await apply_booking_update(db, booking_id, update_data, current_user.email, if_match, owner_id)
     
+    response.headers["ETag"] = booking_etag(booking_id, version)
     return MessageResponse(message="Booking updated successfully")
 
 # Delete own booking - Users can delete their own bookings
 @router.delete("/user/my-bookings/{booking_id}", response_model=DeleteResponse)
-def delete_my_booking(
+async def delete_my_booking(
     booking_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    if_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_writer),
+    db: AsyncSession = Depends(get_db)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
     # Users can only delete their own bookings
-    if current_user.role == "user" and booking.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    db.delete(booking)
-    db.commit()
+    owner_id = current_user.id if current_user.role == "user" else None
+    await delete_booking(db, booking_id, current_user.email, if_match, owner_id)
     
     return DeleteResponse(message="Booking deleted successfully", deleted_id=booking_id)
 
 # ==================== ADMIN ENDPOINTS ====================
 
 # Get all bookings with user details - ADMIN & SUPERADMIN ONLY
+# Same filters, sort, fields and include_archived as my-bookings, plus the user_email / full_name search
+# The user is embedded unless fields or include are given without include=user, which skips the users join
 @router.get("/adminview", response_model=list[BookingWithUser])
-def get_all_bookings(
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    bookings = db.query(Booking).options(joinedload(Booking.user)).all()
-    
-    booking_list = []
-    for booking in bookings:
-        booking_data = BookingWithUser(
-            id=booking.id,
-            room_type=booking.room_type,
-            check_in=booking.check_in,
-            check_out=booking.check_out,
-            guests=booking.guests,
-            user_id=booking.user_id,
-            created_at=booking.created_at,
-            updated_at=booking.updated_at,
-            updated_by=booking.updated_by,
-            user=UserResponse(
-                id=booking.user.id,
-                email=booking.user.email,
-                full_name=booking.user.full_name,
-                role=booking.user.role
-            )
-        )
-        booking_list.append(booking_data)
+async def get_all_bookings(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    sort: str = Query("id", pattern=SORT_PATTERN),
+    filters: BookingFilters = Depends(booking_filters),
+    fieldset: Optional[BookingFieldset] = Depends(booking_fieldset),
+    include_archived: bool = False,
+    current_user: Principal = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_read_db)
+):
+    source = booking_source(include_archived)
+    sort_column, descending = sort_order(sort, source)
+    # Fast path: plain rows straight to JSON, no ORM objects or second validation pass
+    stmt = all_bookings_select(source, filters, fieldset, sort_column)
+    to_dict = booking_with_user_dict if fieldset is None else fieldset.to_dict
     
-    return booking_list
+    if format == "ndjson":
+        return stream_ndjson(db, stmt, source.id, cursor,
+                             lambda row: dumps(to_dict(row)).decode(), scalars=False,
+                             sort_column=sort_column, descending=descending)
+    rows = await paginate(db, stmt, source.id, cursor, limit, response, scalars=False,
+                          sort_column=sort_column, descending=descending)
+    return FastJSONResponse([to_dict(row) for row in rows], headers=response.headers)
+
+# Bulk import from CSV or NDJSON - ADMIN & SUPERADMIN ONLY
+# Columns: room_type, check_in, check_out, guests, user_id, optional version; bad rows are reported, not fatal
+@router.post("/adminview/import", response_model=ImportReport)
+async def import_bookings_admin(
+    file: UploadFile,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    current_user: Principal = Depends(get_current_admin_writer),
+    db: AsyncSession = Depends(get_db)
+):
+    fmt = detect_format(file.filename or "", format)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    return await import_bookings(db, read_rows(stream, fmt), actor=current_user.email)
+
+# Bulk export as CSV or NDJSON - ADMIN & SUPERADMIN ONLY
+@router.get("/adminview/export")
+async def export_bookings_admin(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: Principal = Depends(get_current_admin)
+):
+    return StreamingResponse(
+        export_bookings(format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="bookings.{format}"'}
+    )
 
 # Get booking by ID - ADMIN & SUPERADMIN ONLY
+# Archived bookings are found with include_archived=true
 @router.get("/adminview/{booking_id}", response_model=BookingResponse)
-def get_booking_by_id(
+async def get_booking_by_id(
     booking_id: int,
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    response: Response,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    source = booking_source(include_archived)
+    if if_none_match:
+        # Only the validator column; the row is loaded when the client's copy is stale
+        row = (await db.execute(select(source.version).where(source.id == booking_id))).first()
+        if row is not None:
+            current = booking_etag(booking_id, row.version)
+            if matches(if_none_match, current):
+                return not_modified(current)
+    
+    booking = await db.scalar(select(source).where(source.id == booking_id))
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    set_etag(response, booking_etag(booking.id, booking.version))
     return booking
 
 # Update any booking - ADMIN & SUPERADMIN ONLY (can update all fields)
+# If-Match with the ETag from GET /adminview/{id} stops concurrent admin edits overwriting each other
 @router.put("/adminview/{booking_id}", response_model=MessageResponse)
-def update_booking_admin(
+async def update_booking_admin(
     booking_id: int,
     booking_update: BookingUpdate,
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_admin_writer),
+    db: AsyncSession = Depends(get_db)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
     # Update only provided fields
     update_data = booking_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(booking, field, value)
-    
-    booking.updated_by = current_user.email
-    db.commit()
+    version = await apply_booking_update(db, booking_id, update_data, current_user.email, if_match)
     
+    response.headers["ETag"] = booking_etag(booking_id, version)
     return MessageResponse(message="Booking updated successfully")
 
+# Apply many updates and deletes in one transaction - ADMIN & SUPERADMIN ONLY
+# atomic mode answers 409 and applies nothing if any item fails
+# A patch's version works like If-Match: the item is reported stale once the booking has moved on
+@router.post("/adminview/batch", response_model=BatchResponse)
+async def batch_bookings_admin(
+    batch: BookingBatchRequest,
+    response: Response,
+    current_user: Principal = Depends(get_current_admin_writer),
+    db: AsyncSession = Depends(get_db)
+):
+    ids = [patch.id for patch in batch.updates] + batch.deletes
+    # Just enough for the locks and If-Match; the rows are read again once the locks are held
+    found = {}
+    if ids:
+        rows = await db.execute(select(Booking.id, Booking.room_type, Booking.version).where(Booking.id.in_(ids)))
+        found = {row.id: row for row in rows}
+    
+    results = []
+    seen = set()
+    
+    def check(booking_id: int, action: str, version: Optional[int] = None) -> Optional[BatchItemResult]:
+        if booking_id in seen:
+            return BatchItemResult(id=booking_id, action=action, status="invalid", detail="Booking appears more than once in the batch")
+        seen.add(booking_id)
+        if booking_id not in found:
+            return BatchItemResult(id=booking_id, action=action, status="not_found", detail="Booking not found")
+        if version is not None and found[booking_id].version != version:
+            return BatchItemResult(id=booking_id, action=action, status="stale", detail="Booking has changed; fetch it again before retrying")
+        return None
+    
+    patches, deletes = {}, []
+    for patch in batch.updates:
+        failure = check(patch.id, "update", patch.version)
+        results.append(failure or BatchItemResult(id=patch.id, action="update", status="updated"))
+        if failure is None:
+            patches[patch.id] = patch.model_dump(exclude_unset=True, exclude={"id", "version"})
+    for booking_id in batch.deletes:
+        failure = check(booking_id, "delete")
+        results.append(failure or BatchItemResult(id=booking_id, action="delete", status="deleted"))
+        if failure is None:
+            deletes.append(booking_id)
+    # Items still expected to apply, by booking
+    pending = {result.id: result for result in results if result.status in ("updated", "deleted")}
+    
+    def fail(booking_id: int, status: str, detail: str):
+        result = pending.pop(booking_id)
+        result.status, result.detail = status, detail
+    
+    room_types = {found[booking_id].room_type for booking_id in pending}
+    room_types.update(data["room_type"] for data in patches.values() if "room_type" in data)
+    async with availability_index.locks(room_types):
+        await lock_room_types(db, room_types)
+        locked = {}
+        if pending:
+            rows = await db.execute(
+                select(Booking.id, *(getattr(Booking, field) for field in EVENT_FIELDS), Booking.version)
+                .where(Booking.id.in_(list(pending))).with_for_update()
+            )
+            locked = {row.id: row for row in rows}
+        for booking_id in list(pending):
+            row = locked.get(booking_id)
+            if row is None:
+                fail(booking_id, "not_found", "Booking not found")
+            elif row.version != found[booking_id].version:
+                # Changed before the locks were taken, possibly to a room type they don't cover
+                fail(booking_id, "stale", "Booking was modified concurrently; retry")
+        
+        stays = []
+        for booking_id, data in patches.items():
+            if booking_id not in pending:
+                continue
+            old = tuple(getattr(locked[booking_id], field) for field in STAY_FIELDS)
+            stay = tuple(data.get(field, value) for field, value in zip(STAY_FIELDS, old))
+            if stay[2] <= stay[1]:
+                fail(booking_id, "invalid", "check_out must be after check_in")
+            elif stay != old:
+                stays.append((booking_id, booking_id, *stay))
+        deletes = [booking_id for booking_id in deletes if booking_id in pending]
+        conflicts = await find_overlaps(db, stays, released_ids=set(deletes)) if stays else set()
+        for booking_id in conflicts:
+            fail(booking_id, "conflict", "Room is already booked for those dates")
+        
+        failed = len(results) - len(pending)
+        if failed and batch.mode == "atomic":
+            await db.rollback()
+            for result in pending.values():
+                result.status = "skipped"
+            response.status_code = 409
+            return BatchResponse(applied=0, failed=failed, results=results)
+        
+        updates = [booking_id for booking_id in patches if booking_id in pending]
+        returning = [getattr(Booking, field) for field in EVENT_FIELDS]
+        # One statement per kind of change instead of one round trip per booking, each pinned to the version read
+        async with booking_transaction(db):
+            deleted, updated = [], []
+            if deletes:
+                deleted = (await db.execute(
+                    delete(Booking).where(tuple_(Booking.id, Booking.version).in_([(i, locked[i].version) for i in deletes]))
+                    .returning(Booking.id, *returning).execution_options(synchronize_session=False)
+                )).all()
+            if updates:
+                await db.execute(
+                    update(Booking).where(Booking.version == bindparam("expected_version")),
+                    [{"id": booking_id, **patches[booking_id], "updated_by": current_user.email,
+                      "expected_version": locked[booking_id].version} for booking_id in updates],
+                    execution_options={"synchronize_session": None}
+                )
+                updated = (await db.execute(
+                    update(Booking).where(tuple_(Booking.id, Booking.version).in_([(i, locked[i].version) for i in updates]))
+                    .values(version=Booking.version + 1)
+                    .returning(Booking.id, *returning, Booking.version).execution_options(synchronize_session=False)
+                )).all()
+            # Only a writer that slipped in before this transaction's first write gets here; the row was left alone
+            missing = set(deletes + updates) - {row.id for row in deleted + updated}
+            if missing and batch.mode == "atomic":
+                raise HTTPException(status_code=409, detail="Booking was modified concurrently; retry")
+            for booking_id in missing:
+                fail(booking_id, "stale", "Booking was modified concurrently; retry")
+            await record(db, [
+                Change(row.id, current_user.email, "delete", snapshot(row), None) for row in deleted
+            ] + [
+                Change(row.id, current_user.email, "update", snapshot(locked[row.id]), snapshot(row)) for row in updated
+            ])
+    
+    for row in deleted:
+        availability_index.remove(row.id)
+    for row in updated:
+        availability_index.add(row.id, row.room_type, row.check_in, row.check_out)
+        pending[row.id].version = row.version
+    
+    return BatchResponse(applied=len(pending), failed=len(results) - len(pending), results=results)
+
 # Delete any booking - ADMIN & SUPERADMIN ONLY
 @router.delete("/adminview/{booking_id}", response_model=DeleteResponse)
-def delete_booking_admin(
+async def delete_booking_admin(
     booking_id: int,
-    current_user: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    if_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_admin_writer),
+    db: AsyncSession = Depends(get_db)
 ):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    db.delete(booking)
-    db.commit()
+    await delete_booking(db, booking_id, current_user.email, if_match)
     
     return DeleteResponse(message="Booking deleted successfully", deleted_id=booking_id)
 
 # ==================== SUPERADMIN ENDPOINTS ====================
 
-# SUPERADMIN ONLY: Get admin activity log (all changes made by admins)
-@router.get("/superadmin/activity", response_model=list[BookingWithUser])
-def get_admin_activity(
-    current_user: User = Depends(get_current_superadmin),
-    db: Session = Depends(get_db)
-):
-    # Get all bookings that were updated by admins (not users)
-    bookings = db.query(Booking).options(joinedload(Booking.user)).filter(
-        Booking.updated_by.isnot(None)
-    ).all()
-    
-    booking_list = []
-    for booking in bookings:
-        booking_data = BookingWithUser(
-            id=booking.id,
-            room_type=booking.room_type,
-            check_in=booking.check_in,
-            check_out=booking.check_out,
-            guests=booking.guests,
-            user_id=booking.user_id,
-            created_at=booking.created_at,
-            updated_at=booking.updated_at,
-            updated_by=booking.updated_by,
-            user=UserResponse(
-                id=booking.user.id,
-                email=booking.user.email,
-                full_name=booking.user.full_name,
-                role=booking.user.role
-            )
-        )
-        booking_list.append(booking_data)
+# SUPERADMIN ONLY: Booking change log, oldest first within [since, until)
+# Defaults to the last week; narrow further by actor email or booking
+@router.get("/superadmin/activity", response_model=list[BookingEventResponse])
+async def get_admin_activity(
+    response: Response,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    actor: Optional[str] = None,
+    booking_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: Principal = Depends(get_current_superadmin),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Event times are UTC; naive bounds are taken as UTC too
+    until = until or datetime.now(timezone.utc)
+    until = until.replace(tzinfo=until.tzinfo or timezone.utc).astimezone(timezone.utc)
+    since = since or until - ACTIVITY_WINDOW
+    since = since.replace(tzinfo=since.tzinfo or timezone.utc).astimezone(timezone.utc)
+    if until <= since:
+        raise HTTPException(status_code=400, detail="'until' must be after 'since'")
+    
+    stmt = activity_select(since, until, actor, booking_id)
     
-    return booking_list
+    if format == "ndjson":
+        return stream_ndjson(db, stmt, BookingEvent.id, cursor,
+                             lambda e: BookingEventResponse.model_validate(e).model_dump_json(),
+                             sort_column=BookingEvent.ts)
+    return await paginate(db, stmt, BookingEvent.id, cursor, limit, response, sort_column=BookingEvent.ts)
 
 # SUPERADMIN ONLY: Get all users with their roles
+# fields=id,email,... selects only those columns; without it, a UserResponse's columns
+# Never the password hash or token state, which plain User rows would carry
 @router.get("/superadmin/users")
-def get_all_users(
-    current_user: User = Depends(get_current_superadmin),
-    db: Session = Depends(get_db)
+async def get_all_users(
+    fields: Optional[Tuple[str, ...]] = Depends(user_fieldset),
+    current_user: Principal = Depends(get_current_superadmin),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    users = db.query(User).all()
-    return users
\ No newline at end of file
+    rows = await db.execute(select(*(getattr(User, name) for name in fields or USER_FIELDS)))
+    return FastJSONResponse([dict(row._mapping) for row in rows])
\ No newline at end of file
@@ -1,56 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
-from database import SessionLocal
-from sqlalchemy.orm import Session
-from models import User, OTPRequest
-from auth import get_current_user, get_password_hash
-from schemas import UserResponse, UserUpdate, MessageResponse, DeleteResponse
+from fastapi import APIRouter, Depends, HTTPException, Response
+from database import get_db
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AccountPurge, User
+from auth import Principal, get_current_user, get_current_writer, get_current_superadmin, principal_cache
+from hashing import hasher
+from otp_store import otp_store
+from purge import delete_account
+from schemas import UserResponse, UserUpdate, MessageResponse, DeleteResponse, AccountPurgeResponse
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 @router.put("/me", response_model=MessageResponse)
-def update_current_user(
+async def update_current_user(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_writer),
+    db: AsyncSession = Depends(get_db)
 ):
     # Update only provided fields
     update_data = user_update.model_dump(exclude_unset=True)
     
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
-    
-    for field, value in update_data.items():
-        setattr(current_user, field, value)
+        update_data["hashed_password"] = await hasher.hash(update_data.pop("password"))
+        # A new password revokes every token issued before it
+        update_data["token_version"] = User.token_version + 1
     
-    db.commit()
-    db.refresh(current_user)
+    # One UPDATE; get_current_writer already read this row
+    if update_data:
+        updated = await db.scalar(
+            update(User).where(User.id == current_user.id).values(**update_data).returning(User.id)
+        )
+        if updated is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        await db.commit()
+        principal_cache.invalidate(current_user.id)
     
     return MessageResponse(message="User updated successfully")
 
+# Small accounts are deleted at once; larger ones are disabled and purged in the background (202)
 @router.delete("/me", response_model=DeleteResponse)
-def delete_current_user(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def delete_current_user(
+    response: Response,
+    current_user: Principal = Depends(get_current_writer),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Check if OTP is verified for account deletion
-    verified_otp = db.query(OTPRequest).filter(
-        OTPRequest.user_id == current_user.id,
-        OTPRequest.action_type == "delete_account",
-        OTPRequest.is_used == True
-    ).first()
-    
-    if not verified_otp:
+    # Consume the verified OTP for account deletion
+    if not await otp_store.consume_verified(db, current_user.id, "delete_account"):
         raise HTTPException(
             status_code=403, 
             detail="OTP verification required for account deletion. Please request and verify OTP first using /otp/request-account-deletion"
@@ -58,14 +57,23 @@ def delete_current_user(
     
     user_id = current_user.id
     
-    # Remove the used OTP first
-    db.delete(verified_otp)
-    db.commit()
+    # Same transaction as the OTP consumption above
+    deleted = await delete_account(db, user_id, current_user.email)
+    principal_cache.invalidate(user_id)
     
-    # Now delete the user (bookings will be automatically deleted due to CASCADE)
-    user_to_delete = db.query(User).filter(User.id == user_id).first()
-    if user_to_delete:
-        db.delete(user_to_delete)
-        db.commit()
-    
-    return DeleteResponse(message="User account and all associated bookings deleted successfully", deleted_id=user_id)
\ No newline at end of file
+    if not deleted:
+        response.status_code = 202
+        return DeleteResponse(message="User account disabled; its bookings are being deleted in the background", deleted_id=user_id)
+    return DeleteResponse(message="User account and all associated bookings deleted successfully", deleted_id=user_id)
+
+# SUPERADMIN ONLY: Progress of a background account purge
+@router.get("/purges/{user_id}", response_model=AccountPurgeResponse)
+async def get_account_purge(
+    user_id: int,
+    current_user: Principal = Depends(get_current_superadmin),
+    db: AsyncSession = Depends(get_db)
+):
+    purge = await db.get(AccountPurge, user_id)
+    if purge is None:
+        raise HTTPException(status_code=404, detail="No purge for this user")
+    return purge
\ No newline at end of file
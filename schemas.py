@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import List, Optional
+from pydantic import AfterValidator, BaseModel, EmailStr, model_validator
+from datetime import date, datetime
+from typing import Annotated, Any, Dict, List, Literal, Optional
+from availability import naive_utc
 
 # User Schemas
 class UserBase(BaseModel):
@@ -25,23 +26,60 @@ class UserResponse(UserBase):
         from_attributes = True
 
 # Booking Schemas
+# Stay times are stored, checked and rolled up as naive UTC; offsets are converted on the way in
+StayTime = Annotated[datetime, AfterValidator(naive_utc)]
+
 class BookingBase(BaseModel):
     room_type: str
-    check_in: datetime
-    check_out: datetime
+    check_in: StayTime
+    check_out: StayTime
     guests: int
 
 class BookingCreate(BookingBase):
     pass
 
-class BookingUpdate(BaseModel):
+class PartialUpdate(BaseModel):
+    """Fields may be left out, but not sent as null; the columns are NOT NULL."""
+
+    @model_validator(mode="after")
+    def _no_nulls(self):
+        nulls = sorted(field for field in self.model_fields_set if getattr(self, field) is None)
+        if nulls:
+            raise ValueError(f"{', '.join(nulls)} may not be null")
+        return self
+
+class BookingUpdate(PartialUpdate):
     room_type: Optional[str] = None
-    check_in: Optional[datetime] = None
-    check_out: Optional[datetime] = None
+    check_in: Optional[StayTime] = None
+    check_out: Optional[StayTime] = None
     guests: Optional[int] = None
 
+# Batch admin mutations
+class BookingPatch(BookingUpdate):
+    id: int
+    # Like If-Match: the patch applies only while the booking has this version
+    version: Optional[int] = None
+
+class BookingBatchRequest(BaseModel):
+    updates: List[BookingPatch] = []
+    deletes: List[int] = []
+    # atomic: apply nothing if any item fails; best_effort: apply the items that pass
+    mode: Literal["atomic", "best_effort"] = "atomic"
+
+class BatchItemResult(BaseModel):
+    id: int
+    action: str  # update, delete
+    status: str  # updated, deleted, not_found, stale, conflict, invalid, skipped
+    detail: Optional[str] = None
+    version: Optional[int] = None  # the booking's new version, for updated items
+
+class BatchResponse(BaseModel):
+    applied: int
+    failed: int
+    results: List[BatchItemResult]
+
 # User can only update room_type and guests
-class UserBookingUpdate(BaseModel):
+class UserBookingUpdate(PartialUpdate):
     room_type: Optional[str] = None
     guests: Optional[int] = None
 
@@ -51,6 +89,7 @@ class BookingResponse(BookingBase):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     updated_by: Optional[str] = None
+    version: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -59,6 +98,56 @@ class BookingResponse(BookingBase):
 class BookingWithUser(BookingResponse):
     user: UserResponse
 
+# Bulk import/export Schemas
+class BookingImportRow(BookingBase):
+    user_id: int
+    # Kept from an export, so a restore keeps the same version numbers
+    version: int = 1
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+
+# Availability Schemas
+class AvailabilitySlot(BaseModel):
+    start: datetime
+    end: datetime
+
+class AvailabilityResponse(BaseModel):
+    room_type: str
+    start: datetime
+    end: datetime
+    available: bool
+    free_slots: List[AvailabilitySlot]
+
+# Daily rollups
+class DailyStats(BaseModel):
+    room_type: str
+    day: date
+    bookings: int  # bookings occupying the night starting on day
+    guests: int
+    
+    class Config:
+        from_attributes = True
+
+# Booking event log
+class BookingEventResponse(BaseModel):
+    id: int
+    ts: datetime
+    booking_id: int
+    user_id: Optional[int] = None
+    actor: str
+    action: str  # create, update, delete
+    changes: Dict[str, List[Any]]  # {field: [old, new]}
+    
+    class Config:
+        from_attributes = True
+
 # OTP Schemas
 class OTPRequestCreate(BaseModel):
     action_type: str  # delete_account
@@ -84,4 +173,15 @@ class MessageResponse(BaseModel):
 
 class DeleteResponse(BaseModel):
     message: str
-    deleted_id: int
\ No newline at end of file
+    deleted_id: int
+
+class AccountPurgeResponse(BaseModel):
+    user_id: int
+    email: str
+    bookings_total: int
+    bookings_deleted: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
\ No newline at end of file
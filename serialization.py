@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+from typing import Any
+from fastapi.responses import Response
+from sqlalchemy import select
+from models import Booking, User
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
+
+BOOKING_COLUMNS = (
+    Booking.id,
+    Booking.room_type,
+    Booking.check_in,
+    Booking.check_out,
+    Booking.guests,
+    Booking.user_id,
+    Booking.created_at,
+    Booking.updated_at,
+    Booking.updated_by,
+    Booking.version,
+)
+# Labelled so they don't clash with the booking columns of the same name
+USER_COLUMNS = (
+    User.id.label("user__id"),
+    User.email.label("user__email"),
+    User.full_name.label("user__full_name"),
+    User.role.label("user__role"),
+    User.created_at.label("user__created_at"),
+)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # UTC as "Z", the way pydantic writes it
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+class FastJSONResponse(Response):
+    """JSON response for already-shaped dicts; skips response_model validation."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def booking_with_user_select(source=Booking):
+    """Select only the columns BookingWithUser needs, as plain rows; source may be archive.ALL_BOOKINGS."""
+    columns = (getattr(source, column.key) for column in BOOKING_COLUMNS)
+    return select(*columns, *USER_COLUMNS).join(User, source.user_id == User.id)
+
+def booking_with_user_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "room_type": row.room_type,
+        "check_in": row.check_in,
+        "check_out": row.check_out,
+        "guests": row.guests,
+        "user_id": row.user_id,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "updated_by": row.updated_by,
+        "version": row.version,
+        "user": {
+            "id": row.user__id,
+            "email": row.user__email,
+            "full_name": row.user__full_name,
+            "role": row.user__role,
+            "created_at": row.user__created_at,
+        },
+    }
@@ -0,0 +1,56 @@
+"""Test settings; applied before any app module reads config."""
+import os
+import tempfile
+import uuid
+import pytest
+
+# A scratch SQLite file unless TEST_DATABASE_URL points at a migrated database
+_scratch = os.path.join(tempfile.mkdtemp(prefix="booking-tests-"), "test.db")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", f"sqlite:///{_scratch}")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Same as bench.load, whichever module is imported first
+os.environ.setdefault("NOTIFICATION_PROVIDER", "file")
+os.environ.setdefault("NOTIFICATION_FILE", os.devnull)
+os.environ.setdefault("OTP_BACKEND", "sql")
+
+PASSWORD = "test-password"
+
+@pytest.fixture(scope="session", autouse=True)
+def seeded():
+    """The seed bench/budgets.py expects; it only seeds a database without bookings."""
+    from bench.load import prepare_database
+    prepare_database(50, 500, 20)
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def login(client):
+    """Register a fresh account with the given role; returns its Authorization header."""
+    def login(role: str = "user") -> dict:
+        email = f"{role}-{uuid.uuid4().hex[:12]}@example.com"
+        response = client.post("/auth/register", json={"email": email, "full_name": "Test", "password": PASSWORD, "role": role})
+        assert response.status_code == 200, response.text
+        token = client.post("/auth/login", data={"username": email, "password": PASSWORD}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
+
+@pytest.fixture
+def room_type() -> str:
+    # Tests share the database; a room type of their own keeps their stays apart
+    return f"room-{uuid.uuid4().hex[:12]}"
+
+@pytest.fixture
+def book(client):
+    """Create a booking as headers and return its id; check_in and check_out are ISO strings."""
+    def book(headers: dict, room_type: str, check_in: str, check_out: str, guests: int = 1) -> int:
+        response = client.post("/bookings/", headers=headers, json={
+            "room_type": room_type, "check_in": check_in, "check_out": check_out, "guests": guests
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["booking_id"]
+    return book
@@ -0,0 +1,39 @@
+"""Tokens of revoked, disabled and deleted accounts."""
+from datetime import datetime, timezone
+from sqlalchemy import delete, update
+from database import engine
+from models import User
+
+def user_id(client, headers):
+    return client.get("/users/me", headers=headers).json()["id"]
+
+def new_booking(room_type):
+    return {"room_type": room_type, "check_in": "2033-01-01T00:00:00", "check_out": "2033-01-02T00:00:00", "guests": 1}
+
+def test_writes_refuse_an_account_another_worker_disabled(client, login, room_type):
+    headers = login()
+    # Cached on this worker from here on
+    uid = user_id(client, headers)
+    # What purge.delete_account does elsewhere, without this worker's cache hearing of it
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.id == uid).values(disabled_at=datetime.now(timezone.utc)))
+
+    assert client.post("/bookings/", headers=headers, json=new_booking(room_type)).status_code == 401
+    # Reading the row again also refreshes the cache, so reads are refused from now on too
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+def test_writes_refuse_a_token_revoked_elsewhere(client, login, room_type):
+    headers = login()
+    uid = user_id(client, headers)
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.id == uid).values(token_version=User.token_version + 1))
+
+    assert client.put("/users/me", headers=headers, json={"full_name": "Changed"}).status_code == 401
+
+def test_writes_for_a_deleted_account_are_401_not_500(client, login, room_type):
+    headers = login()
+    uid = user_id(client, headers)
+    with engine.begin() as conn:
+        conn.execute(delete(User).where(User.id == uid))
+
+    assert client.post("/bookings/", headers=headers, json=new_booking(room_type)).status_code == 401
@@ -0,0 +1,21 @@
+"""AvailabilityIndex room locks."""
+import asyncio
+import gc
+import weakref
+from availability import AvailabilityIndex
+
+def test_room_locks_last_only_while_in_use():
+    index = AvailabilityIndex()
+
+    async def run():
+        async with index.locks(["room-a", "room-b"]):
+            # Shared while held, so writers of one room type still queue behind each other
+            held = index.lock("room-a")
+            assert held.locked()
+            return weakref.ref(held)
+
+    released = asyncio.run(run())
+    gc.collect()
+    # Any room type string a client sends would otherwise leave a lock behind
+    assert released() is None
+    assert not index.lock("room-a").locked()
@@ -0,0 +1,136 @@
+"""POST /bookings/adminview/batch: atomic and best_effort results, versions and conflicts."""
+
+def get_booking(client, admin, booking_id):
+    response = client.get(f"/bookings/adminview/{booking_id}", headers=admin)
+    return response.json() if response.status_code == 200 else None
+
+def test_atomic_batch_applies_nothing_when_an_item_fails(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    first = book(user, room_type, "2031-01-01T00:00:00", "2031-01-02T00:00:00")
+    second = book(user, room_type, "2031-01-03T00:00:00", "2031-01-04T00:00:00")
+
+    response = client.post("/bookings/adminview/batch", headers=admin, json={
+        "updates": [{"id": first, "guests": 3}, {"id": 10 ** 9, "guests": 1}],
+        "deletes": [second],
+    })
+    assert response.status_code == 409
+    body = response.json()
+    assert (body["applied"], body["failed"]) == (0, 1)
+    assert [r["status"] for r in body["results"]] == ["skipped", "not_found", "skipped"]
+    assert get_booking(client, admin, first)["guests"] == 1
+    assert get_booking(client, admin, second) is not None
+
+def test_best_effort_batch_applies_the_items_that_pass(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    first = book(user, room_type, "2031-02-01T00:00:00", "2031-02-02T00:00:00")
+    second = book(user, room_type, "2031-02-03T00:00:00", "2031-02-04T00:00:00")
+
+    response = client.post("/bookings/adminview/batch", headers=admin, json={
+        "mode": "best_effort",
+        "updates": [
+            {"id": first, "guests": 3},
+            {"id": 10 ** 9, "guests": 1},
+            {"id": first, "guests": 4},
+            {"id": second, "check_out": "2031-02-02T00:00:00"},
+        ],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["applied"], body["failed"]) == (1, 3)
+    assert [r["status"] for r in body["results"]] == ["updated", "not_found", "invalid", "invalid"]
+    assert body["results"][0]["version"] == 2
+    assert get_booking(client, admin, first)["guests"] == 3
+
+def test_patch_version_works_like_if_match(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    booking_id = book(user, room_type, "2031-03-01T00:00:00", "2031-03-02T00:00:00")
+    assert client.put(f"/bookings/user/my-bookings/{booking_id}", headers=user, json={"guests": 2}).status_code == 200
+
+    stale = client.post("/bookings/adminview/batch", headers=admin, json={
+        "mode": "best_effort", "updates": [{"id": booking_id, "version": 1, "guests": 5}],
+    }).json()
+    assert stale["results"][0]["status"] == "stale"
+    assert get_booking(client, admin, booking_id)["guests"] == 2
+
+    current = client.post("/bookings/adminview/batch", headers=admin, json={
+        "updates": [{"id": booking_id, "version": 2, "guests": 5}],
+    }).json()
+    assert current["results"][0] == {"id": booking_id, "action": "update", "status": "updated", "detail": None, "version": 3}
+    assert get_booking(client, admin, booking_id)["version"] == 3
+
+def test_moves_are_checked_against_stored_and_released_stays(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    staying = book(user, room_type, "2031-04-01T00:00:00", "2031-04-03T00:00:00")
+    leaving = book(user, room_type, "2031-04-05T00:00:00", "2031-04-07T00:00:00")
+    moving = book(user, room_type, "2031-04-10T00:00:00", "2031-04-11T00:00:00")
+
+    conflict = client.post("/bookings/adminview/batch", headers=admin, json={
+        "updates": [{"id": moving, "check_in": "2031-04-02T00:00:00", "check_out": "2031-04-04T00:00:00"}],
+    })
+    assert conflict.status_code == 409
+    assert conflict.json()["results"][0]["status"] == "conflict"
+
+    # The slot a deleted booking frees can be taken in the same batch
+    response = client.post("/bookings/adminview/batch", headers=admin, json={
+        "updates": [{"id": moving, "check_in": "2031-04-05T00:00:00", "check_out": "2031-04-07T00:00:00"}],
+        "deletes": [leaving],
+    })
+    assert response.status_code == 200, response.text
+    assert get_booking(client, admin, leaving) is None
+    availability = client.get("/bookings/availability", headers=user, params={
+        "room_type": room_type, "from": "2031-04-01T00:00:00", "to": "2031-04-12T00:00:00"
+    }).json()
+    assert availability["free_slots"] == [
+        {"start": "2031-04-03T00:00:00", "end": "2031-04-05T00:00:00"},
+        {"start": "2031-04-07T00:00:00", "end": "2031-04-12T00:00:00"},
+    ]
+    assert get_booking(client, admin, staying)["version"] == 1
+
+def test_a_booking_listed_twice_is_only_updated(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    booking_id = book(user, room_type, "2031-05-01T00:00:00", "2031-05-02T00:00:00")
+
+    body = client.post("/bookings/adminview/batch", headers=admin, json={
+        "mode": "best_effort", "updates": [{"id": booking_id, "guests": 2}], "deletes": [booking_id],
+    }).json()
+    assert [r["status"] for r in body["results"]] == ["updated", "invalid"]
+    assert get_booking(client, admin, booking_id)["guests"] == 2
+
+def test_a_booking_deleted_during_the_batch_is_not_found(client, login, book, room_type):
+    from sqlalchemy import delete, event
+    from availability import availability_index
+    from database import async_engine, engine
+    from models import Booking
+
+    admin, user = login("admin"), login()
+    doomed = book(user, room_type, "2031-06-01T00:00:00", "2031-06-02T00:00:00")
+    kept = book(user, room_type, "2031-06-03T00:00:00", "2031-06-04T00:00:00")
+
+    deleted = []
+
+    def delete_before_locked_read(conn, cursor, statement, parameters, context, executemany):
+        # The second read, once the room locks are held
+        if not deleted and statement.startswith("SELECT bookings.id, bookings.room_type, bookings.check_in"):
+            with engine.begin() as other:
+                deleted.append(other.execute(delete(Booking).where(Booking.id == doomed)).rowcount)
+            # What the change feed does with another worker's delete
+            availability_index.remove(doomed)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", delete_before_locked_read)
+    try:
+        body = client.post("/bookings/adminview/batch", headers=admin, json={
+            "mode": "best_effort",
+            "updates": [{"id": doomed, "check_in": "2031-06-01T12:00:00"}, {"id": kept, "guests": 2}],
+        }).json()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", delete_before_locked_read)
+    assert deleted == [1]
+    assert [r["status"] for r in body["results"]] == ["not_found", "updated"]
+    # Neither the index nor the change log picks the deleted booking back up
+    availability = client.get("/bookings/availability", headers=user, params={
+        "room_type": room_type, "from": "2031-06-01T00:00:00", "to": "2031-06-02T00:00:00"
+    }).json()
+    assert availability["available"]
+    superadmin = login("superadmin")
+    events = client.get("/bookings/superadmin/activity", headers=superadmin, params={"booking_id": doomed}).json()
+    assert [e["action"] for e in events] == ["create"]
@@ -0,0 +1,130 @@
+"""Booking reads and writes: overlaps, ETags and If-Match, archived bookings, query validation."""
+from datetime import datetime
+
+def stay(room_type, check_in, check_out, guests=1):
+    return {"room_type": room_type, "check_in": check_in, "check_out": check_out, "guests": guests}
+
+def test_create_refuses_an_overlapping_stay(client, login, book, room_type):
+    user = login()
+    book(user, room_type, "2034-01-10T00:00:00", "2034-01-12T00:00:00")
+
+    response = client.post("/bookings/", headers=user, json=stay(room_type, "2034-01-11T00:00:00", "2034-01-13T00:00:00"))
+    assert response.status_code == 409
+    # Back to back is not an overlap, and other room types don't count
+    book(user, room_type, "2034-01-12T00:00:00", "2034-01-13T00:00:00")
+    book(user, room_type + "-b", "2034-01-11T00:00:00", "2034-01-13T00:00:00")
+    assert client.post("/bookings/", headers=user, json=stay(room_type, "2034-01-20T00:00:00", "2034-01-20T00:00:00")).status_code == 400
+
+def test_admin_move_refuses_an_overlapping_stay(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    book(user, room_type, "2034-02-10T00:00:00", "2034-02-12T00:00:00")
+    moving = book(user, room_type, "2034-02-20T00:00:00", "2034-02-21T00:00:00")
+
+    response = client.put(f"/bookings/adminview/{moving}", headers=admin, json={
+        "check_in": "2034-02-11T00:00:00", "check_out": "2034-02-13T00:00:00"
+    })
+    assert response.status_code == 409
+    # A booking never clashes with its own old slot
+    response = client.put(f"/bookings/adminview/{moving}", headers=admin, json={"check_out": "2034-02-22T00:00:00"})
+    assert response.status_code == 200
+    assert client.get(f"/bookings/adminview/{moving}", headers=admin).json()["check_out"] == "2034-02-22T00:00:00"
+
+def test_stale_if_match_is_412(client, login, book, room_type):
+    user = login()
+    booking_id = book(user, room_type, "2034-03-01T00:00:00", "2034-03-02T00:00:00")
+    first = f'"{booking_id}.1"'
+
+    assert client.put(f"/bookings/user/my-bookings/{booking_id}", headers={**user, "If-Match": first},
+                      json={"guests": 2}).status_code == 200
+    # Version 1 is gone now, for updates and deletes alike
+    assert client.put(f"/bookings/user/my-bookings/{booking_id}", headers={**user, "If-Match": first},
+                      json={"guests": 3}).status_code == 412
+    assert client.delete(f"/bookings/user/my-bookings/{booking_id}", headers={**user, "If-Match": first}).status_code == 412
+    assert client.delete(f"/bookings/user/my-bookings/{booking_id}",
+                         headers={**user, "If-Match": f'"{booking_id}.2"'}).status_code == 200
+
+def test_etag_answers_304_until_the_booking_changes(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    booking_id = book(user, room_type, "2034-04-01T00:00:00", "2034-04-02T00:00:00")
+
+    response = client.get(f"/bookings/adminview/{booking_id}", headers=admin)
+    etag = response.headers["ETag"]
+    assert client.get(f"/bookings/adminview/{booking_id}", headers={**admin, "If-None-Match": etag}).status_code == 304
+
+    page = client.get("/bookings/user/my-bookings", headers=user)
+    page_etag = page.headers["ETag"]
+    assert client.get("/bookings/user/my-bookings", headers={**user, "If-None-Match": page_etag}).status_code == 304
+
+    client.put(f"/bookings/user/my-bookings/{booking_id}", headers=user, json={"guests": 2})
+    changed = client.get(f"/bookings/adminview/{booking_id}", headers={**admin, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    page = client.get("/bookings/user/my-bookings", headers={**user, "If-None-Match": page_etag})
+    assert page.status_code == 200
+    assert page.json()[0]["guests"] == 2
+
+def test_archived_bookings_are_read_with_include_archived(client, login, book, room_type):
+    from archive import run_archive
+    from database import AsyncSessionLocal
+
+    admin, user = login("admin"), login()
+    # Older than anything seeded, so only this booking is archived
+    old = book(user, room_type, "1999-01-01T00:00:00", "1999-01-02T00:00:00")
+    current = book(user, room_type, "2034-05-01T00:00:00", "2034-05-02T00:00:00")
+
+    async def archive():
+        async with AsyncSessionLocal() as db:
+            return await run_archive(db, (datetime.utcnow() - datetime(2000, 1, 1)).days, 100)
+
+    assert client.portal.call(archive) == 1
+    assert client.get(f"/bookings/adminview/{old}", headers=admin).status_code == 404
+    archived = client.get(f"/bookings/adminview/{old}", headers=admin, params={"include_archived": True})
+    assert archived.status_code == 200
+    assert archived.json()["check_in"] == "1999-01-01T00:00:00"
+
+    mine = client.get("/bookings/user/my-bookings", headers=user).json()
+    assert [b["id"] for b in mine] == [current]
+    mine = client.get("/bookings/user/my-bookings", headers=user, params={"include_archived": True}).json()
+    assert [b["id"] for b in mine] == [old, current]
+    listed = client.get("/bookings/adminview", headers=admin, params={"include_archived": True, "room_type": room_type}).json()
+    assert [b["id"] for b in listed] == [old, current]
+
+def test_fieldsets_and_filters_reject_bad_parameters(client, login):
+    admin, superadmin = login("admin"), login("superadmin")
+    bad = [
+        ({"fields": "id,secret"}, 400),
+        ({"fields": "id,user.email"}, 400),  # user fields without include=user
+        ({"fields": "id,user.hashed_password", "include": "user"}, 400),
+        ({"include": "users"}, 422),
+        ({"user_email": "ab"}, 400),  # too short for a trigram search
+        ({"check_in_from": "2034-01-02T00:00:00", "check_in_to": "2034-01-01T00:00:00"}, 400),
+        ({"min_guests": 0}, 422),
+        ({"sort": "guests"}, 422),
+        ({"cursor": "not-a-cursor"}, 400),
+    ]
+    for params, status in bad:
+        response = client.get("/bookings/adminview", headers=admin, params=params)
+        assert response.status_code == status, (params, response.text)
+
+    response = client.get("/bookings/superadmin/users", headers=superadmin, params={"fields": "id,hashed_password"})
+    assert response.status_code == 400
+    response = client.get("/bookings/adminview", headers=admin, params={"fields": "id,room_type", "include": "user"})
+    assert response.status_code == 200
+    assert set(response.json()[0]) == {"id", "room_type", "user"}
+
+def test_page_etag_sees_updates_within_one_updated_at_tick(client, login, book, room_type):
+    from sqlalchemy import update
+    from database import engine
+    from models import Booking
+
+    user = login()
+    booking_id = book(user, room_type, "2034-06-01T00:00:00", "2034-06-02T00:00:00")
+    for params in ({}, {"fields": "id,guests"}):
+        etag = client.get("/bookings/user/my-bookings", headers=user, params=params).headers["ETag"]
+        # A second write that lands in the same updated_at tick as the first
+        with engine.begin() as conn:
+            conn.execute(update(Booking).where(Booking.id == booking_id)
+                         .values(guests=Booking.guests + 1, version=Booking.version + 1, updated_at=Booking.updated_at))
+        response = client.get("/bookings/user/my-bookings", headers={**user, "If-None-Match": etag}, params=params)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
@@ -0,0 +1,50 @@
+"""Bulk import and export through the admin endpoints."""
+import csv
+import io
+import json
+
+def import_csv(client, admin, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["room_type", "check_in", "check_out", "guests", "user_id"])
+    writer.writerows(rows)
+    return client.post("/bookings/adminview/import", headers=admin, files={"file": ("bookings.csv", buffer.getvalue())})
+
+def user_id(client, headers):
+    return client.get("/users/me", headers=headers).json()["id"]
+
+def test_import_reports_overlapping_rows(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    owner = user_id(client, user)
+    book(user, room_type, "2032-01-10T00:00:00", "2032-01-12T00:00:00")
+
+    report = import_csv(client, admin, [
+        (room_type, "2032-01-01T00:00:00", "2032-01-03T00:00:00", 1, owner),
+        (room_type, "2032-01-11T00:00:00", "2032-01-13T00:00:00", 1, owner),  # a stored booking
+        (room_type, "2032-01-02T00:00:00", "2032-01-04T00:00:00", 1, owner),  # the first row
+        # Spans everything above; it only clashes with what it actually overlaps
+        (room_type, "2031-01-01T00:00:00", "2033-01-01T00:00:00", 1, owner),
+        (room_type, "2032-01-05T00:00:00", "2032-01-06T00:00:00", 2, owner),
+    ]).json()
+    assert report["imported"] == 2
+    assert [(e["row"], e["error"]) for e in report["errors"]] == [
+        (row, "Room is already booked for those dates") for row in (2, 3, 4)
+    ]
+
+def test_export_round_trips_through_import(client, login, book, room_type):
+    admin, user = login("admin"), login()
+    booking_id = book(user, room_type, "2032-02-01T00:00:00", "2032-02-02T00:00:00")
+    client.put(f"/bookings/adminview/{booking_id}", headers=admin, json={"guests": 3})
+
+    exported = [json.loads(line) for line in client.get(
+        "/bookings/adminview/export", headers=admin, params={"format": "ndjson"}
+    ).text.splitlines()]
+    row = next(item for item in exported if item["id"] == booking_id)
+    assert row["version"] == 2
+
+    row = {**row, "room_type": room_type + "-copy"}
+    report = client.post("/bookings/adminview/import", headers=admin, params={"format": "ndjson"},
+                         files={"file": ("bookings.ndjson", json.dumps(row))}).json()
+    assert (report["imported"], report["failed"]) == (1, 0)
+    copies = client.get("/bookings/adminview", headers=admin, params={"room_type": room_type + "-copy"}).json()
+    assert [(c["guests"], c["version"]) for c in copies] == [(3, 2)]
@@ -0,0 +1,64 @@
+"""GET /bookings/changes: replay after Last-Event-ID and catching up after an overflow.
+
+The stream never ends, so these drive change_feed.stream, what the route
+returns, on the app's event loop instead of reading the response.
+"""
+import asyncio
+import json
+from change_feed import broker, stream
+from database import AsyncSessionLocal
+
+def user_id(client, headers):
+    return client.get("/users/me", headers=headers).json()["id"]
+
+def events(client, feed, count: int) -> list:
+    """The next count events the stream sends, skipping keepalives."""
+    async def read():
+        entries = []
+        while len(entries) < count:
+            chunk = await feed.__anext__()
+            if chunk.startswith("id: "):
+                entries.append(json.loads(chunk.split("data: ", 1)[1]))
+        return entries
+
+    return client.portal.call(asyncio.wait_for, read(), 5)
+
+def until_live(client, feed):
+    """Read up to the first keepalive, by which time the stream is subscribed."""
+    async def read():
+        while await feed.__anext__() != ": keepalive\n\n":
+            pass
+
+    client.portal.call(asyncio.wait_for, read(), 5)
+
+def test_stream_replays_after_last_event_id(client, login, book, room_type):
+    user, superadmin = login(), login("superadmin")
+    first = book(user, room_type, "2035-01-01T00:00:00", "2035-01-02T00:00:00")
+    later = [book(user, room_type, f"2035-01-0{day}T00:00:00", f"2035-01-0{day + 1}T00:00:00") for day in (3, 5)]
+    last_seen = client.get("/bookings/superadmin/activity", headers=superadmin, params={"booking_id": first}).json()[0]["id"]
+
+    feed = stream(AsyncSessionLocal, user_id(client, user), last_seen, heartbeat=0.05)
+    try:
+        replayed = events(client, feed, 2)
+        assert [(e["booking_id"], e["action"]) for e in replayed] == [(later[0], "create"), (later[1], "create")]
+        # Then live events, without repeating what was replayed
+        client.put(f"/bookings/user/my-bookings/{first}", headers=user, json={"guests": 2})
+        live = events(client, feed, 1)[0]
+        assert (live["booking_id"], live["action"], live["changes"]) == (first, "update", {"guests": [1, 2]})
+    finally:
+        client.portal.call(feed.aclose)
+
+def test_a_stream_that_overflows_catches_up_from_the_log(client, login, book, room_type, monkeypatch):
+    monkeypatch.setattr(broker, "queue_size", 2)
+    user = login()
+    feed = stream(AsyncSessionLocal, user_id(client, user), None, heartbeat=0.05)
+    try:
+        until_live(client, feed)
+        # Nobody reads while these are made, so the third finds the queue full
+        ids = [book(user, room_type, f"2035-02-0{day}T00:00:00", f"2035-02-0{day + 1}T00:00:00") for day in (1, 3, 5, 7)]
+        assert [e["booking_id"] for e in events(client, feed, 4)] == ids
+        # Subscribed again once it caught up
+        client.delete(f"/bookings/user/my-bookings/{ids[0]}", headers=user)
+        assert events(client, feed, 1)[0]["action"] == "delete"
+    finally:
+        client.portal.call(feed.aclose)
@@ -0,0 +1,61 @@
+"""Account deletion OTPs: the attempt cap and single use."""
+from config import settings
+
+def request_otp(client, headers) -> str:
+    response = client.post("/otp/request-account-deletion", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["otp_code"]
+
+def verify(client, headers, code):
+    return client.post("/otp/verify-account-deletion", headers=headers, json={"otp_code": code})
+
+def wrong(code: str) -> str:
+    return "000000" if code != "000000" else "111111"
+
+def test_wrong_guesses_use_up_the_otp(client, login):
+    user = login()
+    code = request_otp(client, user)
+
+    for _ in range(settings.otp_max_attempts):
+        assert verify(client, user, wrong(code)).status_code == 404
+    # Once the cap is reached the right code is refused too
+    assert verify(client, user, code).status_code == 429
+    # A new OTP starts a new count
+    code = request_otp(client, user)
+    assert verify(client, user, code).status_code == 200
+
+def test_an_otp_verifies_and_deletes_once(client, login):
+    user = login()
+    assert client.delete("/users/me", headers=user).status_code == 403
+    code = request_otp(client, user)
+
+    assert verify(client, user, code).status_code == 200
+    assert verify(client, user, code).status_code == 404
+    assert client.delete("/users/me", headers=user).status_code == 200
+
+def test_the_redis_store_caps_guesses_and_verifies_once():
+    import asyncio
+    from fastapi import HTTPException
+    from otp_store import LocalRedis, RedisOTPStore
+
+    async def attempt(store, code):
+        try:
+            await store.verify(None, 1, "delete_account", code)
+        except HTTPException as error:
+            return error.status_code
+        return 200
+
+    async def run():
+        store = RedisOTPStore(LocalRedis())
+        issued = await store.issue(None, 1, "delete_account")
+        statuses = [await attempt(store, wrong(issued.code)) for _ in range(settings.otp_max_attempts)]
+        statuses.append(await attempt(store, issued.code))
+
+        issued = await store.issue(None, 1, "delete_account")
+        statuses += [await attempt(store, issued.code), await attempt(store, issued.code)]
+        consumed = [await store.consume_verified(None, 1, "delete_account") for _ in range(2)]
+        return statuses, consumed
+
+    statuses, consumed = asyncio.run(run())
+    assert statuses == [404] * settings.otp_max_attempts + [429, 200, 404]
+    assert consumed == [True, False]
@@ -0,0 +1,45 @@
+"""Notifications that run out of attempts: marked failed, counted, and deleted after their retention."""
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from config import settings
+from database import AsyncSessionLocal, engine
+from models import NotificationOutbox
+from outbox import Notification, purge_failed, settle
+
+def add_notification(key: str, **values) -> int:
+    with engine.begin() as conn:
+        return conn.scalar(insert(NotificationOutbox).values(
+            kind="otp", recipient="someone@example.com", payload="{}", dedupe_key=key, **values
+        ).returning(NotificationOutbox.id))
+
+def failed_total(client) -> float:
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith("notifications_failed_total "):
+            return float(line.split()[1])
+    return 0
+
+def test_failed_notifications_are_counted_then_purged(client):
+    # Not due, so the app's workers leave it alone
+    failing = add_notification("test:failing", attempts=settings.outbox_max_attempts,
+                               next_attempt_at=datetime.utcnow() + timedelta(days=1))
+    old = add_notification("test:old", status="failed", next_attempt_at=datetime.utcnow() - timedelta(days=30))
+    failed_before = failed_total(client)
+
+    async def give_up():
+        async with AsyncSessionLocal() as db:
+            notification = Notification(failing, "otp", "someone@example.com", {}, "test:failing", settings.outbox_max_attempts)
+            await settle(db, [notification], ["SMTP 550"])
+
+    async def purge(before):
+        async with AsyncSessionLocal() as db:
+            return await purge_failed(db, before)
+
+    client.portal.call(give_up)
+    assert failed_total(client) == failed_before + 1
+
+    # Only the one that failed before the cutoff goes
+    client.portal.call(purge, datetime.utcnow() - timedelta(days=1))
+    with engine.connect() as conn:
+        rows = conn.execute(select(NotificationOutbox.id, NotificationOutbox.status, NotificationOutbox.last_error)
+                            .where(NotificationOutbox.id.in_([failing, old]))).all()
+    assert [tuple(row) for row in rows] == [(failing, "failed", "SMTP 550")]
@@ -0,0 +1,47 @@
+"""DELETE /users/me: small accounts go at once, larger ones are disabled and purged in the background."""
+import time
+from config import settings
+
+def user_id(client, headers):
+    return client.get("/users/me", headers=headers).json()["id"]
+
+def delete_me(client, headers):
+    code = client.post("/otp/request-account-deletion", headers=headers).json()["otp_code"]
+    assert client.post("/otp/verify-account-deletion", headers=headers, json={"otp_code": code}).status_code == 200
+    return client.delete("/users/me", headers=headers)
+
+def test_a_small_account_is_deleted_inline(client, login, book, room_type):
+    user, admin, superadmin = login(), login("admin"), login("superadmin")
+    uid = user_id(client, user)
+    booking_id = book(user, room_type, "2036-01-01T00:00:00", "2036-01-02T00:00:00")
+
+    assert delete_me(client, user).status_code == 200
+    assert client.get(f"/bookings/adminview/{booking_id}", headers=admin).status_code == 404
+    assert client.get(f"/users/purges/{uid}", headers=superadmin).status_code == 404
+
+def test_a_large_account_is_purged_in_the_background(client, login, book, room_type, monkeypatch):
+    monkeypatch.setattr(settings, "account_purge_inline_bookings", 1)
+    user, admin, superadmin = login(), login("admin"), login("superadmin")
+    uid = user_id(client, user)
+    ids = [book(user, room_type, f"2036-02-0{day}T00:00:00", f"2036-02-0{day + 1}T00:00:00") for day in (1, 3)]
+
+    response = delete_me(client, user)
+    assert response.status_code == 202
+    # Disabled before the purge finishes
+    assert client.get("/users/me", headers=user).status_code == 401
+
+    deadline = time.monotonic() + 5
+    while True:
+        purge = client.get(f"/users/purges/{uid}", headers=superadmin).json()
+        if purge["finished_at"] is not None or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert (purge["bookings_total"], purge["bookings_deleted"]) == (2, 2)
+    assert purge["finished_at"] is not None
+    for booking_id in ids:
+        assert client.get(f"/bookings/adminview/{booking_id}", headers=admin).status_code == 404
+    # The freed slots are bookable again
+    availability = client.get("/bookings/availability", headers=admin, params={
+        "room_type": room_type, "from": "2036-02-01T00:00:00", "to": "2036-02-05T00:00:00"
+    }).json()
+    assert availability["available"]
@@ -0,0 +1,12 @@
+"""Query budgets (bench/budgets.py) as part of the test suite."""
+import asyncio
+from bench.budgets import BUDGETS, run
+from bench.load import SCENARIOS, prepare_database
+
+def test_every_scenario_has_a_budget():
+    assert {scenario.name for scenario in SCENARIOS} <= BUDGETS.keys()
+
+def test_endpoints_stay_within_query_budgets():
+    prepare_database(50, 500, 20)
+    failures = asyncio.run(run([]))
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,118 @@
+"""EXPLAIN each hot query, built by the helper its handler calls, and fail on a full table scan.
+
+Runs against the test database: SQLite by default, or Postgres through
+TEST_DATABASE_URL, where sequential scans are disabled so a Seq Scan in the
+plan means no index can serve the query at all, whatever the table sizes.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from archive import archivable_ids, booking_source
+from availability import clashing_bookings, overlapping_booking, stays_ending_after
+from change_feed import replay_page
+from database import engine
+from filters import BookingFilters, sort_order
+from models import Booking, BookingArchive, BookingEvent, User
+from otp_store import SQLOTPStore
+from outbox import due_ids
+from pagination import encode_cursor, page_select
+from purge import user_bookings_select
+from routers.bookings import activity_select, all_bookings_select, my_bookings_select, stats_select
+
+PAGE = 100
+# Trigram searches; SQLite has no index for ILIKE and scans users, so they are only checked on Postgres
+POSTGRES_ONLY = {"filters.user_email", "filters.full_name"}
+
+def page(stmt, source, cursor=None, sort="id"):
+    sort_column, descending = sort_order(sort, source)
+    return page_select(stmt, source.id, cursor, PAGE, sort_column, descending)
+
+def hot_queries(dialect: str):
+    """(name, statement, scanned) for each query the app issues on a hot path.
+
+    scanned names a table the query walks on purpose, a LIMITed primary key walk
+    or the VALUES list find_overlaps joins, which SQLite reports as SCAN.
+    """
+    now = datetime.utcnow()
+    archived = booking_source(True)
+    after = encode_cursor(250)
+    recent = BookingFilters(check_in_from=now, check_in_to=now + timedelta(days=30))
+    last_year = BookingFilters(check_in_from=now - timedelta(days=400), check_in_to=now - timedelta(days=370))
+    week = (now - timedelta(days=7), now)
+    month = (now.date(), now.date() + timedelta(days=30))
+    stays = [(0, None, "room-7", now + timedelta(days=1), now + timedelta(days=3)),
+             (1, 42, "room-8", now, now + timedelta(days=2))]
+    return [
+        ("auth.get_current_user", select(User).where(User.id == 42), None),
+        ("auth.login", select(User).where(User.email == "user42@example.com"), None),
+        ("bookings.get_my_bookings", page(my_bookings_select(Booking, BookingFilters(), None, None, 42), Booking), None),
+        ("bookings.get_my_bookings (admin)",
+         page(my_bookings_select(Booking, BookingFilters(), None, None, None), Booking, after), "bookings"),
+        ("bookings.get_my_bookings (include_archived)",
+         page(my_bookings_select(archived, BookingFilters(), None, None, 42), archived), None),
+        ("bookings.get_all_bookings", page(all_bookings_select(Booking, BookingFilters(), None, None), Booking, after), "bookings"),
+        ("bookings.get_all_bookings (check_in)",
+         page(all_bookings_select(Booking, recent, None, sort_order("-check_in")[0]), Booking, sort="-check_in"), None),
+        ("bookings.get_all_bookings (include_archived, check_in)",
+         page(all_bookings_select(archived, last_year, None, sort_order("check_in", archived)[0]), archived, sort="check_in"), None),
+        ("filters.user_email",
+         page(all_bookings_select(Booking, BookingFilters(user_email="user42@"), None, None), Booking), "bookings"),
+        ("filters.full_name",
+         page(my_bookings_select(Booking, BookingFilters(full_name="ser 42"), None, None, None), Booking), "bookings"),
+        ("bookings.get_booking_by_id", select(Booking).where(Booking.id == 42), None),
+        ("bookings.get_booking_by_id (include_archived)", select(archived).where(archived.id == 42), None),
+        ("bookings.get_admin_activity", page(activity_select(*week, None, None), BookingEvent), None),
+        ("bookings.get_admin_activity (actor)", page(activity_select(*week, "admin@example.com", None), BookingEvent), None),
+        ("bookings.get_admin_activity (booking)", page(activity_select(*week, None, 42), BookingEvent), None),
+        ("bookings.get_booking_stats", stats_select(*month, None), None),
+        ("bookings.get_booking_stats (room)", stats_select(*month, "room-7"), None),
+        ("availability.ensure_available", overlapping_booking("room-7", *stays[0][3:]), None),
+        ("availability.find_overlaps", clashing_bookings(stays), "candidates"),
+        ("availability.load", stays_ending_after(now), None),
+        ("otp_store.verify", SQLOTPStore.take_attempt(42, "action-0"), None),
+        ("otp_store.consume_verified", SQLOTPStore.verified(42, "action-0", now - timedelta(hours=1)), None),
+        ("otp_store.sweep", SQLOTPStore.expired(now), None),
+        ("change_feed.replay", replay_page(None, 250, now - timedelta(days=1)), "booking_events"),
+        ("change_feed.replay (user)", replay_page(42, 250, now - timedelta(days=1)), None),
+        ("purge.user_bookings", user_bookings_select(Booking, 42, 500), None),
+        ("purge.user_bookings (archived)", user_bookings_select(BookingArchive, 42, 500), None),
+        ("archive.archive_chunk", archivable_ids(dialect, now - timedelta(days=180), 1000), None),
+        ("outbox.claim", due_ids(now, 50), None),
+    ]
+
+def full_scans(conn, stmt, scanned) -> list:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans, nodes = [], [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return scans
+
+    scans = []
+    for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql):
+        detail = row[-1]
+        # A VALUES list shows up as "SCAN <n> CONSTANT ROWS"
+        if detail.startswith("SCAN ") and " USING " not in detail and not detail.endswith(" CONSTANT ROWS"):
+            table = detail.split()[1]
+            if table != scanned:
+                scans.append(table)
+    return scans
+
+def test_hot_queries_use_an_index():
+    failures = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, stmt, scanned in hot_queries(conn.dialect.name):
+            if name in POSTGRES_ONLY and conn.dialect.name != "postgresql":
+                continue
+            scans = full_scans(conn, stmt, scanned)
+            if scans:
+                failures.append(f"{name}: full scan of {', '.join(scans)}")
+    assert not failures, "\n".join(failures)
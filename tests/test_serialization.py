@@ -0,0 +1,21 @@
+"""Plain-row payloads match what their response models would send."""
+from schemas import BookingWithUser, UserResponse
+
+def test_default_adminview_embeds_the_whole_user(client, login):
+    admin = login("admin")
+    default = client.get("/bookings/adminview", headers=admin, params={"limit": 20}).json()
+    narrowed = client.get("/bookings/adminview", headers=admin, params={"limit": 20, "include": "user"}).json()
+
+    assert default and default == narrowed
+    for item in default:
+        assert BookingWithUser.model_validate(item).model_dump(mode="json") == item
+        assert item["user"]["created_at"] is not None
+
+def test_user_list_leaves_out_password_hashes_and_token_state(client, login):
+    superadmin = login("superadmin")
+    users = client.get("/bookings/superadmin/users", headers=superadmin).json()
+    assert users
+    for user in users:
+        assert UserResponse.model_validate(user).model_dump(mode="json") == user
+    narrow = client.get("/bookings/superadmin/users", headers=superadmin, params={"fields": "email"}).json()
+    assert set(narrow[0]) == {"id", "email"}
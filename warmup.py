@@ -0,0 +1,70 @@
+"""Startup warmup for request-handler engines.
+
+Opens pooled connections ahead of the first requests and runs the hot read
+queries once on each. That fills SQLAlchemy's compiled statement cache and,
+with asyncpg, each connection's prepared statements. The queries are built the
+same way the handlers build them, so their cache keys match. They use values
+that match no rows and run in a transaction that is rolled back.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from models import Booking, BookingDailyStats, BookingEvent, OTPRequest, User
+from pagination import keyset, page_version
+from serialization import booking_with_user_select
+
+logger = logging.getLogger(__name__)
+
+async def warm_queries(db: AsyncSession):
+    now = datetime.utcnow()
+    today = date.today()
+    # auth.get_current_user, bookings.get_booking_by_id
+    await db.get(User, 0)
+    await db.get(Booking, 0)
+    # auth.login, auth.register
+    await db.scalar(select(User).where(User.email == ""))
+    # bookings.get_my_bookings, with its ETag check
+    mine = select(Booking).where(Booking.user_id == 0)
+    await db.scalars(keyset(mine, Booking.id, None).limit(1))
+    await page_version(db, mine, Booking.id, Booking.updated_at, Booking.version, None, 1)
+    # bookings.get_all_bookings
+    await db.execute(keyset(booking_with_user_select(), Booking.id, None).limit(1))
+    # availability.ensure_available
+    await db.scalar(select(Booking.id).where(
+        Booking.room_type == "", Booking.check_in < now, Booking.check_out > now
+    ).limit(1))
+    # bookings.get_booking_stats
+    await db.scalars(select(BookingDailyStats).where(
+        BookingDailyStats.day >= today, BookingDailyStats.day < today, BookingDailyStats.bookings > 0
+    ).order_by(BookingDailyStats.day, BookingDailyStats.room_type))
+    # bookings.get_admin_activity
+    await db.scalars(keyset(
+        select(BookingEvent).where(BookingEvent.ts >= now, BookingEvent.ts < now - timedelta(seconds=1)),
+        BookingEvent.id, None, BookingEvent.ts
+    ).limit(1))
+    # otp_store.verify
+    await db.scalar(select(OTPRequest).where(
+        OTPRequest.user_id == 0, OTPRequest.action_type == "delete_account", OTPRequest.is_used == False
+    ))
+
+async def warm_pool(engine: AsyncEngine, size: int) -> int:
+    """Open up to size connections at once, warm each, and return them to the pool."""
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "size"):
+        size = min(size, pool.size())
+    if size <= 0:
+        return 0
+    # Held together so each one is a separate pooled connection
+    connections = await asyncio.gather(*(engine.connect() for _ in range(size)))
+    try:
+        async def warm(conn):
+            async with AsyncSession(bind=conn) as db:
+                await warm_queries(db)
+                await db.rollback()
+        await asyncio.gather(*(warm(conn) for conn in connections))
+    finally:
+        for conn in connections:
+            await conn.close()
+    return size